@@ -0,0 +1,223 @@
+# coding: utf-8
+
+# Benchmark do crawler sem acessar o site.
+#
+# Sobe o servidor local de servidor.py, aponta o crawler para ele e roda cada
+# etapa (crawl_*) numa pasta temporária, medindo tempo, páginas por segundo,
+# bytes baixados e pico de memória. Antes, mede o custo de extração
+# (microssegundos por página) de cada classe de página e backend sobre as
+# fixtures, sem rede.
+#
+# Uso:
+#
+#     python benchmark/benchmark.py --latencia 50 --taxa-erro 0.01 --json resultado.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import marine_traffic_crawler as crawler
+from servidor import ConfiguracaoServidor, inicia_servidor, monta_pagina
+
+# Página usada na medição de extração de cada classe: (caminho, extrator em
+# EXTRATORES, argumento extra do extrator). Os portos 101 e 102 cobrem os dois layouts de
+# chegadas esperadas (com e sem rowspan, Issue #9).
+PAGINAS_EXTRACAO = [
+    ('portos', '/en/ais/index/ports/all/flag:BR/per_page:50',
+        'portos', None),
+    ('navios_porto', '/en/ais/index/ships/port/101/ship_type:8/per_page:50',
+        'navios_porto', 'PORTO'),
+    ('chegadas_esperadas', '/en/ais/index/eta/all/port:102/per_page:50',
+        'chegadas_esperadas', 'PORTO'),
+    ('chegadas_esperadas_rowspan', '/en/ais/index/eta/all/port:101/per_page:50',
+        'chegadas_esperadas', 'PORTO'),
+    ('navio', '/en/ais/details/ships/shipid:1/mmsi:1/imo:1/vessel:BENCHMARK',
+        'navio', None),
+]
+
+BACKENDS = ['bs4', 'lxml']
+
+'''
+    Microssegundos por página de cada extrator e backend sobre as fixtures.
+    Retorna {classe: {backend: (microssegundos, linhas)}}.
+'''
+def mede_extracao(repeticoes):
+    configuracao = ConfiguracaoServidor()
+    resultado = {}
+    for nome, caminho, funcao, argumento in PAGINAS_EXTRACAO:
+        _, html = monta_pagina(configuracao, caminho)
+        if argumento is None and funcao == 'navio':
+            argumento = crawler.URL_BASE + caminho
+        resultado[nome] = {}
+        for backend in BACKENDS:
+            extrator = crawler.extrator(funcao, backend)
+            args = (html,) if argumento is None else (html, argumento)
+            linhas = extrator(*args)
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                extrator(*args)
+            micros = (time.perf_counter() - inicio) / repeticoes * 1e6
+            quantidade = len(linhas) if funcao != 'navio' else 1
+            resultado[nome][backend] = (micros, quantidade)
+    return resultado
+
+# Escolhe os primeiros portos da lista capturada como portos de interesse.
+def escreve_portos_interesse(quantidade):
+    portos = crawler.pd.read_csv(crawler.ARQUIVO_PORTOS_BRASIL, sep=';',
+        dtype=str, keep_default_na=False)
+    crawler.cria_pasta(Path(crawler.ARQUIVO_PORTOS_INTERESSE))
+    portos[['Nome']].head(quantidade).to_csv(crawler.ARQUIVO_PORTOS_INTERESSE,
+        index=False)
+
+'''
+    Roda uma etapa e mede tempo, páginas, bytes e pico de memória (tracemalloc,
+    só do processo principal).
+'''
+def mede_etapa(nome, etapa, configuracao, memoria):
+    configuracao.zera_contagem()
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    etapa()
+    segundos = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    paginas = sum(configuracao.contagem.values())
+    return {
+        'etapa': nome,
+        'segundos': segundos,
+        'paginas': paginas,
+        'paginas_por_segundo': paginas / segundos if segundos else None,
+        'bytes': sum(configuracao.bytes.values()),
+        'erros_http': configuracao.erros,
+        'pico_memoria_mb': pico / 2**20 if pico is not None else None,
+    }
+
+def executa_etapas(args, configuracao):
+    servidor = inicia_servidor(configuracao)
+    crawler.URL_BASE = servidor.url_base
+    crawler.URL_BASE_HTTPS = servidor.url_base
+    crawler.configura_limite_requisicoes(args.taxa_requisicoes,
+        max(1, int(2 * args.taxa_requisicoes)))
+    if args.processos_extracao:
+        crawler.ativa_processos_extracao(args.processos_extracao)
+
+    etapas = [
+        ('crawl_portos_brasil', lambda: crawler.crawl_portos_brasil(
+            retomar=False)),
+        ('crawl_navios_em_portos', lambda: crawler.crawl_navios_em_portos(
+            retomar=False)),
+        ('crawl_chegadas_esperadas', lambda: crawler.crawl_chegadas_esperadas(
+            retomar=False)),
+        ('crawl_navios_interesse', lambda: crawler.crawl_navios_interesse(
+            retomar=False)),
+    ]
+    if args.pipeline:
+        etapas[1:] = [('executa_pipeline', lambda: crawler.executa_pipeline(
+            retomar=False))]
+
+    pasta_original = os.getcwd()
+    pasta = tempfile.mkdtemp(prefix='benchmark_crawler_')
+    resultados = []
+    try:
+        os.chdir(pasta)
+        for nome, etapa in etapas:
+            resultados.append(mede_etapa(nome, etapa, configuracao,
+                not args.sem_memoria))
+            if nome == 'crawl_portos_brasil':
+                escreve_portos_interesse(args.portos_interesse)
+    finally:
+        os.chdir(pasta_original)
+        shutil.rmtree(pasta, ignore_errors=True)
+        crawler.desativa_processos_extracao()
+        servidor.shutdown()
+        servidor.server_close()
+    return resultados
+
+def imprime(extracao, etapas):
+    print('Extração (microssegundos por página):')
+    print('    {:<28}'.format('pagina') + ''.join('{:>14}'.format(b) for b in BACKENDS)
+        + '{:>8}'.format('linhas'))
+    for nome, medidas in extracao.items():
+        print('    {:<28}'.format(nome)
+            + ''.join('{:>14.0f}'.format(medidas[b][0]) for b in BACKENDS)
+            + '{:>8}'.format(medidas[BACKENDS[0]][1]))
+
+    print()
+    print('Etapas:')
+    print('    {:<28}{:>10}{:>9}{:>12}{:>12}{:>8}{:>12}'.format('etapa',
+        'segundos', 'paginas', 'paginas/s', 'KB', 'erros', 'pico MB'))
+    for r in etapas:
+        print('    {:<28}{:>10.2f}{:>9}{:>12.1f}{:>12.0f}{:>8}{:>12}'.format(
+            r['etapa'], r['segundos'], r['paginas'],
+            r['paginas_por_segundo'] or 0, r['bytes'] / 1024, r['erros_http'],
+            '-' if r['pico_memoria_mb'] is None
+            else '{:.1f}'.format(r['pico_memoria_mb'])))
+
+def __argumentos():
+    parser = argparse.ArgumentParser(description='Benchmark do crawler com '
+        'servidor local e páginas gravadas.')
+    parser.add_argument('--latencia', type=float, default=20.0, metavar='MS',
+        help='atraso de cada resposta do servidor, em milissegundos (padrão 20)')
+    parser.add_argument('--taxa-erro', type=float, default=0.0,
+        help='fração das respostas devolvidas com HTTP 503 (padrão 0)')
+    parser.add_argument('--paginas-portos', type=int, default=4,
+        help='páginas da lista de portos (padrão 4, 20 portos por página)')
+    parser.add_argument('--paginas-navios-porto', type=int, default=2,
+        help='páginas de navios em cada porto (padrão 2)')
+    parser.add_argument('--paginas-chegadas', type=int, default=2,
+        help='páginas de chegadas esperadas em cada porto (padrão 2)')
+    parser.add_argument('--portos-interesse', type=int, default=4,
+        help='número de portos de interesse (padrão 4)')
+    parser.add_argument('--taxa-requisicoes', type=float, default=1000.0,
+        help='limite de requisições por segundo do crawler (padrão 1000)')
+    parser.add_argument('--backend-extracao', choices=BACKENDS,
+        default=crawler.BACKEND_EXTRACAO)
+    parser.add_argument('--processos-extracao', type=int, default=None)
+    parser.add_argument('--pipeline', action='store_true',
+        help='roda executa_pipeline no lugar das três últimas etapas')
+    parser.add_argument('--repeticoes-extracao', type=int, default=50,
+        help='repetições de cada medição de extração (padrão 50)')
+    parser.add_argument('--sem-memoria', action='store_true',
+        help='não mede o pico de memória, que deixa as etapas mais lentas')
+    parser.add_argument('--semente', type=int, default=0,
+        help='semente dos erros sorteados pelo servidor')
+    parser.add_argument('--json', metavar='ARQUIVO',
+        help='grava os resultados em JSON')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = __argumentos()
+    crawler.logger.setLevel(logging.WARNING)
+    crawler.BACKEND_EXTRACAO = args.backend_extracao
+
+    extracao = mede_extracao(args.repeticoes_extracao)
+    configuracao = ConfiguracaoServidor(args.latencia / 1000, args.taxa_erro,
+        {'portos': args.paginas_portos,
+         'navios_porto': args.paginas_navios_porto,
+         'chegadas_esperadas': args.paginas_chegadas}, args.semente)
+    etapas = executa_etapas(args, configuracao)
+    imprime(extracao, etapas)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'parametros': vars(args),
+                'extracao': {nome: {backend: {'microssegundos': m, 'linhas': l}
+                    for backend, (m, l) in medidas.items()}
+                    for nome, medidas in extracao.items()},
+                'etapas': etapas,
+            }, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,195 @@
+# coding: utf-8
+
+# Servidor HTTP local que imita o Marine Traffic para o benchmark do crawler.
+#
+# Serve as páginas gravadas em fixtures/ no lugar do site: lista de portos,
+# navios em porto, chegadas esperadas (metade dos portos no layout com
+# rowspan da Issue #9) e detalhes de navio. Nas páginas, {pagina} e {porto}
+# são trocados pelo número da página e pelo id do porto pedidos, para que
+# cada página tenha portos e navios diferentes, e {paginacao} pela paginação
+# da listagem, com o número de páginas configurado.
+#
+# Uso avulso:
+#
+#     python benchmark/servidor.py --porta 8000 --latencia 50 --taxa-erro 0.01
+
+import re
+import time
+import random
+import threading
+import argparse
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PASTA_FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+# Classes de página servidas, na ordem em que as rotas são testadas.
+ROTAS = [
+    ('portos', re.compile(r'/en/ais/index/ports/all/')),
+    ('navios_porto', re.compile(r'/en/ais/index/ships/port/(\d+)')),
+    ('chegadas_esperadas', re.compile(r'/en/ais/index/eta/all/port:(\d+)')),
+    ('navio', re.compile(r'/en/ais/details/ships/.*/vessel:([^/]*)')),
+]
+
+_RE_PAGINA = re.compile(r'/page:(\d+)')
+
+'''
+    Configuração do servidor.
+
+    latencia - atraso (segundos) de cada resposta.
+    taxa_erro - fração das respostas devolvidas com HTTP 503.
+    paginas - número de páginas de cada listagem: {'portos': N,
+        'navios_porto': N, 'chegadas_esperadas': N}.
+'''
+class ConfiguracaoServidor:
+
+    def __init__(self, latencia = 0.0, taxa_erro = 0.0, paginas = None,
+        semente = None):
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.paginas = {'portos': 4, 'navios_porto': 2, 'chegadas_esperadas': 2}
+        self.paginas.update(paginas or {})
+        self.aleatorio = random.Random(semente)
+        self.fixtures = {caminho.stem: caminho.read_text(encoding='utf-8')
+            for caminho in PASTA_FIXTURES.glob('*.html')}
+
+        # Páginas e bytes servidos por classe e respostas com erro.
+        self._lock = threading.Lock()
+        self.contagem = {}
+        self.bytes = {}
+        self.erros = 0
+
+    def conta(self, classe, tamanho):
+        with self._lock:
+            self.contagem[classe] = self.contagem.get(classe, 0) + 1
+            self.bytes[classe] = self.bytes.get(classe, 0) + tamanho
+
+    def sorteia_erro(self):
+        with self._lock:
+            erro = self.aleatorio.random() < self.taxa_erro
+            if erro:
+                self.erros += 1
+            return erro
+
+    def zera_contagem(self):
+        with self._lock:
+            self.contagem = {}
+            self.bytes = {}
+            self.erros = 0
+
+# Paginação no formato do site, com link "next" até a última página.
+def paginacao(caminho, pagina, total, janela = 5):
+    itens = []
+    for numero in range(max(1, pagina - janela), min(total, pagina + janela) + 1):
+        if numero == pagina:
+            itens.append('<span class="current">{}</span>'.format(numero))
+        else:
+            itens.append('<span><a href="{}/page:{}">{}</a></span>'.format(
+                caminho, numero, numero))
+    if pagina < total:
+        itens.append('<span class="next"><a href="{}/page:{}">Next</a></span>'.format(
+            caminho, pagina + 1))
+    else:
+        itens.append('<span class="next disabled">Next</span>')
+    return '<div class="pagination">{}</div>'.format(''.join(itens))
+
+# Página da classe para o caminho pedido ou None se o caminho não é servido.
+def monta_pagina(configuracao, caminho):
+    for classe, rota in ROTAS:
+        match = rota.search(caminho)
+        if match:
+            break
+    else:
+        return None, None
+
+    if classe == 'navio':
+        html = configuracao.fixtures['navio'].replace('{nome}',
+            match.group(1).replace('_', ' '))
+        return classe, html
+
+    match_pagina = _RE_PAGINA.search(caminho)
+    pagina = int(match_pagina.group(1)) if match_pagina else 1
+    base = _RE_PAGINA.sub('', caminho)
+    porto = match.group(1) if match.groups() else ''
+
+    fixture = classe
+    if classe == 'chegadas_esperadas' and int(porto) % 2:
+        fixture = 'chegadas_esperadas_rowspan'
+
+    html = configuracao.fixtures[fixture]
+    html = html.replace('{paginacao}', paginacao(base, pagina,
+        configuracao.paginas[classe]))
+    html = html.replace('{pagina}', str(pagina)).replace('{porto}', porto)
+    return classe, html
+
+def cria_tratador(configuracao):
+
+    class Tratador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if configuracao.latencia:
+                time.sleep(configuracao.latencia)
+
+            if configuracao.sorteia_erro():
+                return self.responde(503, b'Service Unavailable')
+
+            classe, html = monta_pagina(configuracao, self.path)
+            if html is None:
+                return self.responde(404, b'Not Found')
+
+            corpo = html.encode('utf-8')
+            configuracao.conta(classe, len(corpo))
+            self.responde(200, corpo)
+
+        def responde(self, codigo, corpo):
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Tratador
+
+'''
+    Inicia o servidor numa thread. Retorna o servidor, com a configuração em
+    servidor.configuracao e o endereço base em servidor.url_base.
+    Encerrar com servidor.shutdown().
+'''
+def inicia_servidor(configuracao, host = '127.0.0.1', porta = 0):
+    servidor = ThreadingHTTPServer((host, porta), cria_tratador(configuracao))
+    servidor.daemon_threads = True
+    servidor.configuracao = configuracao
+    servidor.url_base = 'http://{}:{}'.format(*servidor.server_address[:2])
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def __argumentos():
+    parser = argparse.ArgumentParser(description='Servidor local que imita o '
+        'Marine Traffic para o benchmark do crawler.')
+    parser.add_argument('--porta', type=int, default=8000)
+    parser.add_argument('--latencia', type=float, default=0.0, metavar='MS',
+        help='atraso de cada resposta, em milissegundos')
+    parser.add_argument('--taxa-erro', type=float, default=0.0,
+        help='fração das respostas devolvidas com HTTP 503')
+    parser.add_argument('--paginas-portos', type=int, default=4)
+    parser.add_argument('--paginas-navios-porto', type=int, default=2)
+    parser.add_argument('--paginas-chegadas', type=int, default=2)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = __argumentos()
+    configuracao = ConfiguracaoServidor(args.latencia / 1000, args.taxa_erro,
+        {'portos': args.paginas_portos,
+         'navios_porto': args.paginas_navios_porto,
+         'chegadas_esperadas': args.paginas_chegadas})
+    servidor = ThreadingHTTPServer(('127.0.0.1', args.porta),
+        cria_tratador(configuracao))
+    print('Servindo em http://127.0.0.1:{}'.format(args.porta))
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,14 +1,43 @@
 # coding: utf-8
 
 import re
+import random
+import heapq
+import bisect
+import functools
+import itertools
+import threading
+import sqlite3
+import zlib
+import io
+import hashlib
+import mmap
+import cProfile
+import pstats
 import requests
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
+import lxml.html
+import html as html_lib
 import pandas as pd
+import numpy as np
 import logging
 from pathlib import Path
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
+import os
+import json
+import shutil
+import argparse
+import signal
+import socket
+import queue
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 
 
 logger = logging.getLogger(__name__)
@@ -16,276 +45,2275 @@ logging.basicConfig()
 logger.setLevel(logging.INFO)
 
 URL_BASE = 'http://www.marinetraffic.com'
+# A listagem de portos é buscada direto por https.
+URL_BASE_HTTPS = 'https://www.marinetraffic.com'
 ARQUIVO_PORTOS_BRASIL = './output/portos.csv'
 ARQUIVO_PORTOS_INTERESSE = './input/portos_interesse.csv'
 ARQUIVO_NAVIOS_EM_PORTOS = './output/navios_em_portos.csv'
+ARQUIVO_CHEGADAS_ESPERADAS = './output/chegadas_esperadas.csv'
+ARQUIVO_NAVIOS_INTERESSE = './output/navios_interesse.csv'
+PROXY_PADRAO = 'http://127.0.0.1:53128'
+
+# Número padrão de páginas de navios buscadas simultaneamente.
+CONCORRENCIA_NAVIOS = 8
+
+# Máximo de conexões simultâneas ao site por IP de saída. Nenhuma concorrência
+# configurada ultrapassa esse valor, multiplicado pelo número de proxies
+# saudáveis quando há um pool de proxies (ver limite_conexoes).
+LIMITE_CONEXOES_POR_HOST = 16
+
+# Timeouts (segundos) de conexão e de leitura de cada requisição.
+TIMEOUT_CONEXAO = 10
+TIMEOUT_LEITURA = 30
+
+# Novas tentativas após timeout, erro de conexão ou um dos códigos HTTP abaixo.
+# A espera entre tentativas cresce exponencialmente a partir de BACKOFF_BASE,
+# limitada a BACKOFF_MAXIMO, com jitter aleatório.
+TENTATIVAS = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAXIMO = 60.0
+STATUS_REPETIR = frozenset([429, 500, 502, 503, 504])
+
+# Ritmo das requisições a cada host (token bucket, ver LimitadorHost): até
+# TAXA_REQUISICOES por segundo, com rajadas de até RAJADA_REQUISICOES. Ao
+# receber um dos STATUS_LIMITADO a taxa cai para FATOR_REDUCAO_TAXA da atual
+# (no máximo uma vez a cada INTERVALO_REDUCAO_TAXA segundos, não uma por
+# thread) e o host fica parado pelo tempo do Retry-After. Cada resposta bem
+# sucedida devolve FRACAO_RECUPERACAO_TAXA da taxa máxima, até voltar a ela.
+TAXA_REQUISICOES = 5.0
+RAJADA_REQUISICOES = 10
+STATUS_LIMITADO = frozenset([429, 503])
+FATOR_REDUCAO_TAXA = 0.5
+INTERVALO_REDUCAO_TAXA = 1.0
+TAXA_MINIMA = 0.2
+FRACAO_RECUPERACAO_TAXA = 0.02
+
+
+# Sessão HTTP compartilhada por todos os crawlers. Mantém um pool de conexões
+# keep-alive, evitando um novo handshake TCP/TLS por página.
+_sessao = None
+_lock_sessao = threading.Lock()
+
+def cria_sessao(tamanho_pool = LIMITE_CONEXOES_POR_HOST):
+    sessao = requests.Session()
+    sessao.headers.update({'User-agent': 'Mozilla/5.0'})
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamanho_pool,
+        max_retries=0)
+    sessao.mount('http://', adaptador)
+    sessao.mount('https://', adaptador)
+    return sessao
+
+def obtem_sessao():
+    global _sessao
+    with _lock_sessao:
+        if _sessao is None:
+            _sessao = cria_sessao()
+        return _sessao
+
+# Um semáforo por host limita as requisições simultâneas a
+# LIMITE_CONEXOES_POR_HOST somando todas as threads (portos, páginas e navios).
+# Como os limitadores, há um semáforo por proxy do pool.
+_semaforos_host = {}
+
+def semaforo_host(url, proxy = None):
+    chave = (urlsplit(url).netloc, proxy)
+    with _lock_sessao:
+        if chave not in _semaforos_host:
+            _semaforos_host[chave] = threading.BoundedSemaphore(
+                LIMITE_CONEXOES_POR_HOST)
+        return _semaforos_host[chave]
 
+'''
+    Limite de requisições a um host: token bucket com taxa adaptável e fila
+    de prioridades.
+
+    Quando faltam fichas, as threads esperam numa fila ordenada pela
+    prioridade (menor primeiro) e, na mesma prioridade, pela ordem de
+    chegada. Assim as páginas que mudam rápido (chegadas esperadas) passam na
+    frente das que mudam devagar (lista de portos).
+'''
+class LimitadorHost:
+
+    def __init__(self, host, taxa_maxima = TAXA_REQUISICOES,
+        rajada = RAJADA_REQUISICOES):
+        self.host = host
+        self.taxa_maxima = taxa_maxima
+        self.taxa = taxa_maxima
+        self.rajada = rajada
+        self.fichas = float(rajada)
+        self.pausa_ate = 0.0
+        self._atualizado = time.monotonic()
+        self._ultima_reducao = 0.0
+        self._condicao = threading.Condition()
+        self._fila = []
+        self._ordem = itertools.count()
+
+    def _repoe(self, agora):
+        self.fichas = min(self.rajada,
+            self.fichas + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    # Espera a vez e uma ficha disponível.
+    def adquire(self, prioridade = 0):
+        with self._condicao:
+            pedido = (prioridade, next(self._ordem))
+            heapq.heappush(self._fila, pedido)
+            registra_fila('limitador', len(self._fila))
+            try:
+                while True:
+                    espera = None
+                    if self._fila[0] == pedido:
+                        agora = time.monotonic()
+                        self._repoe(agora)
+                        espera = max(self.pausa_ate - agora,
+                            (1 - self.fichas) / self.taxa)
+                        if espera <= 0:
+                            self.fichas -= 1
+                            return
+                    self._condicao.wait(espera)
+            finally:
+                self._fila.remove(pedido)
+                heapq.heapify(self._fila)
+                self._condicao.notify_all()
+
+    # Resposta de limite (429/503): reduz a taxa e respeita o Retry-After.
+    def reduz(self, retry_after = None):
+        with self._condicao:
+            agora = time.monotonic()
+            if agora - self._ultima_reducao >= INTERVALO_REDUCAO_TAXA:
+                self._ultima_reducao = agora
+                self._repoe(agora)
+                self.taxa = max(TAXA_MINIMA, self.taxa * FATOR_REDUCAO_TAXA)
+                self.fichas = min(self.fichas, 0.0)
+                logger.warning('Limite de requisições atingido em {}: taxa '
+                    'reduzida para {:.2f}/s.'.format(self.host, self.taxa))
+            if retry_after:
+                self.pausa_ate = max(self.pausa_ate, agora + retry_after)
+            self._condicao.notify_all()
+
+    def sucesso(self):
+        with self._condicao:
+            if self.taxa < self.taxa_maxima:
+                self._repoe(time.monotonic())
+                self.taxa = min(self.taxa_maxima,
+                    self.taxa + self.taxa_maxima * FRACAO_RECUPERACAO_TAXA)
+
+_limitadores_host = {}
+
+# Com um pool de proxies, cada proxy sai com seu próprio IP e tem seu próprio
+# limitador para o host: a taxa total cresce com o número de proxies.
+def limitador_host(url, proxy = None):
+    chave = (urlsplit(url).netloc, proxy)
+    with _lock_sessao:
+        if chave not in _limitadores_host:
+            nome = chave[0] if proxy is None else '{} via {}'.format(*chave)
+            _limitadores_host[chave] = LimitadorHost(nome, TAXA_REQUISICOES,
+                RAJADA_REQUISICOES)
+        return _limitadores_host[chave]
+
+# Muda a taxa e a rajada de todos os hosts. Os limitadores são recriados.
+def configura_limite_requisicoes(taxa = TAXA_REQUISICOES,
+    rajada = RAJADA_REQUISICOES):
+    global TAXA_REQUISICOES, RAJADA_REQUISICOES
+    with _lock_sessao:
+        TAXA_REQUISICOES = taxa
+        RAJADA_REQUISICOES = rajada
+        _limitadores_host.clear()
+
+# Pool de proxies.
+#
+# Cada requisição sai pelo proxy mais saudável no momento: menor latência
+# média, menos erros e menos requisições em andamento. Um proxy com
+# FALHAS_PARA_PAUSA_PROXY falhas seguidas (erro de conexão, timeout ou um dos
+# STATUS_FALHA_PROXY) fica fora do pool por PAUSA_PROXY segundos. Cada proxy
+# atende no máximo CONCORRENCIA_POR_PROXY requisições ao mesmo tempo.
+CONCORRENCIA_POR_PROXY = 4
+FALHAS_PARA_PAUSA_PROXY = 3
+PAUSA_PROXY = 60.0
+STATUS_FALHA_PROXY = STATUS_REPETIR | frozenset([407])
+
+# Peso da última medida nas médias móveis de latência e de erros.
+PESO_MEDIA_PROXY = 0.2
+
+class EstadoProxy:
+
+    def __init__(self, url):
+        self.url = url
+        self.proxies = {'http': url, 'https': url}
+        self.latencia = 1.0
+        self.taxa_erro = 0.0
+        self.falhas_seguidas = 0
+        self.em_uso = 0
+        self.pausa_ate = 0.0
+        self.requisicoes = 0
+        self.erros = 0
+
+    # Menor é melhor.
+    def pontuacao(self):
+        return self.latencia * (1 + 4 * self.taxa_erro) * (1 + self.em_uso)
+
+class PoolProxies:
+
+    def __init__(self, urls, concorrencia_por_proxy = CONCORRENCIA_POR_PROXY,
+        pausa = PAUSA_PROXY):
+        if not urls:
+            raise ValueError('Pool de proxies vazio.')
+        self.estados = [EstadoProxy(url) for url in urls]
+        self.concorrencia_por_proxy = concorrencia_por_proxy
+        self.pausa = pausa
+        self._condicao = threading.Condition()
+
+    # Reserva o proxy mais saudável, esperando se todos estiverem ocupados ou
+    # em pausa. Devolva com devolve().
+    def obtem(self):
+        with self._condicao:
+            while True:
+                agora = time.monotonic()
+                disponiveis = [estado for estado in self.estados
+                    if estado.pausa_ate <= agora and
+                    estado.em_uso < self.concorrencia_por_proxy]
+                if disponiveis:
+                    estado = min(disponiveis, key=EstadoProxy.pontuacao)
+                    estado.em_uso += 1
+                    return estado
+                pausados = [estado.pausa_ate - agora for estado in self.estados
+                    if estado.pausa_ate > agora]
+                self._condicao.wait(min(pausados) if pausados else None)
+
+    '''
+        Devolve o proxy ao pool com o resultado da requisição.
+
+        latencia - segundos da requisição, se houve resposta.
+        falhou - erro de conexão, timeout ou código HTTP de falha.
+    '''
+    def devolve(self, estado, latencia = None, falhou = False):
+        with self._condicao:
+            estado.em_uso -= 1
+            estado.requisicoes += 1
+            if latencia is not None:
+                estado.latencia += PESO_MEDIA_PROXY * (latencia - estado.latencia)
+            estado.taxa_erro += PESO_MEDIA_PROXY * (falhou - estado.taxa_erro)
+            if falhou:
+                estado.erros += 1
+                estado.falhas_seguidas += 1
+                if estado.falhas_seguidas >= FALHAS_PARA_PAUSA_PROXY:
+                    estado.falhas_seguidas = 0
+                    estado.pausa_ate = time.monotonic() + self.pausa
+                    logger.warning('Proxy {} com falhas seguidas: fora do pool '
+                        'por {:.0f}s.'.format(estado.url, self.pausa))
+            else:
+                estado.falhas_seguidas = 0
+            self._condicao.notify_all()
+
+    # Proxies fora de pausa.
+    def saudaveis(self):
+        agora = time.monotonic()
+        with self._condicao:
+            return sum(estado.pausa_ate <= agora for estado in self.estados)
+
+    def registra_resumo(self):
+        for estado in self.estados:
+            logger.info('Proxy {}: {} requisições, {} erros, latência média '
+                '{:.2f}s.'.format(estado.url, estado.requisicoes, estado.erros,
+                estado.latencia))
+
+_pool_proxies = None
+
+'''
+    Ativa o pool de proxies para todas as requisições feitas sem um proxy
+    explícito.
+'''
+def ativa_pool_proxies(urls, concorrencia_por_proxy = CONCORRENCIA_POR_PROXY,
+    pausa = PAUSA_PROXY):
+    global _pool_proxies
+    _pool_proxies = PoolProxies(urls, concorrencia_por_proxy, pausa)
+    return _pool_proxies
+
+def desativa_pool_proxies():
+    global _pool_proxies
+    if _pool_proxies:
+        _pool_proxies.registra_resumo()
+    _pool_proxies = None
+
+# Máximo de requisições simultâneas ao site: LIMITE_CONEXOES_POR_HOST por
+# proxy saudável do pool, ou só LIMITE_CONEXOES_POR_HOST sem pool.
+def limite_conexoes():
+    pool = _pool_proxies
+    if pool is None:
+        return LIMITE_CONEXOES_POR_HOST
+    return LIMITE_CONEXOES_POR_HOST * max(1, pool.saudaveis())
+
+# Segundos indicados no cabeçalho Retry-After, em segundos ou data HTTP.
+def segundos_retry_after(valor):
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, data.timestamp() - time.time())
+
+# Backoff exponencial com "full jitter": espera um tempo aleatório entre zero
+# e o teto da tentativa, para que várias threads não repitam juntas.
+def espera_backoff(tentativa, retry_after = None):
+    teto = min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** tentativa)
+    espera = random.uniform(0, teto)
+    segundos = segundos_retry_after(retry_after)
+    if segundos is not None:
+        espera = max(espera, min(segundos, BACKOFF_MAXIMO))
+    time.sleep(espera)
+
+'''
+    Faz a requisição GET, no ritmo do limitador do host e com novas
+    tentativas.
+
+    proxy - proxies do requests. Sem proxy, usa o pool de proxies, se
+        ativado com ativa_pool_proxies(); cada tentativa pode sair por um
+        proxy diferente.
+    prioridade - posição na fila do limitador (ver PRIORIDADE_CLASSE).
+'''
+def requisita(url, proxy = None, cabecalhos = None, prioridade = 0):
+    sessao = obtem_sessao()
+    pool = _pool_proxies if proxy is None else None
+    timeout = (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)
+    for tentativa in range(TENTATIVAS + 1):
+        ultima = tentativa == TENTATIVAS
+        estado_proxy = pool.obtem() if pool else None
+        r = erro = latencia = None
+        try:
+            limitador = limitador_host(url,
+                estado_proxy.url if estado_proxy else None)
+            limitador.adquire(prioridade)
+            inicio = time.monotonic()
+            with semaforo_host(url, estado_proxy.url if estado_proxy else None):
+                r = sessao.get(url, headers = cabecalhos,
+                    proxies = estado_proxy.proxies if estado_proxy else proxy,
+                    timeout = timeout)
+            latencia = time.monotonic() - inicio
+        except (requests.ConnectionError, requests.Timeout) as e:
+            erro = e
+        finally:
+            if estado_proxy:
+                pool.devolve(estado_proxy, latencia,
+                    r is None or r.status_code in STATUS_FALHA_PROXY)
+
+        if erro is not None:
+            if ultima:
+                raise erro
+            logger.warning('Falha ao obter {} ({}). Tentativa {} de {}.'.format(
+                url, erro, tentativa + 1, TENTATIVAS + 1))
+            espera_backoff(tentativa)
+            continue
+
+        if r.status_code in STATUS_LIMITADO:
+            limitador.reduz(segundos_retry_after(r.headers.get('Retry-After')))
+        elif r.status_code < 500:
+            limitador.sucesso()
+
+        if r.status_code in STATUS_REPETIR and not ultima:
+            logger.warning('Código HTTP {} ao obter {}. Tentativa {} de {}.'.format(
+                r.status_code, url, tentativa + 1, TENTATIVAS + 1))
+            espera_backoff(tentativa, r.headers.get('Retry-After'))
+            continue
+
+        return r
+
+'''
+    Obtém uma página do site.
+
+    classe - classe da página (CLASSE_PORTOS, CLASSE_NAVIO, ...). Só páginas
+        com classe passam pelo cache, quando ativado com ativa_cache().
 
-def obtem_pagina(url, proxy = None):
-    user_agent = {'User-agent': 'Mozilla/5.0'}
-    return requests.get(url, headers = user_agent, proxies = proxy)
+    Com o arquivo de páginas ativado (ativa_arquivo_html), as páginas obtidas
+    do site são arquivadas; no modo offline, vêm do arquivo.
+'''
+def obtem_pagina(url, proxy = None, classe = None):
+    arquivo = _arquivo_html
+    if arquivo and arquivo.offline:
+        r = arquivo.resposta(url)
+        registra_resposta(classe, 'arquivo')
+        return r
+
+    cache = _cache if classe else None
+    entrada = None
+    cabecalhos = {}
+    if cache:
+        entrada = cache.obtem(url)
+        if entrada:
+            if cache.fresca(entrada, classe):
+                registra_resposta(classe, 'cache')
+                return resposta_do_cache(url, entrada)
+            if entrada['etag']:
+                cabecalhos['If-None-Match'] = entrada['etag']
+            if entrada['last_modified']:
+                cabecalhos['If-Modified-Since'] = entrada['last_modified']
+
+    inicio = time.perf_counter()
+    try:
+        r = requisita(url, proxy, cabecalhos,
+            PRIORIDADE_CLASSE.get(classe, PRIORIDADE_PADRAO))
+    except requests.RequestException:
+        registra_resposta(classe, 'erro', inicio)
+        raise
+    registra_resposta(classe, r.status_code, inicio, len(r.content))
+
+    if cache:
+        if entrada and r.status_code == 304:
+            cache.renova(url)
+            return resposta_do_cache(url, entrada)
+        if r.status_code == 200:
+            cache.grava(url, classe, r)
+    if arquivo and r.status_code == 200:
+        arquivo.grava(url, classe, r)
+    return r
 
 def cria_pasta(caminho_arquivo):
     pasta = caminho_arquivo.parent
     if not pasta.exists():
         pasta.mkdir(parents=True)
 
-def data_coleta():
-    return datetime.utcnow().strftime('%Y-%m-%d %H:%M')
+# Formato das datas nos arquivos CSV (UTC).
+FORMATO_DATA = '%Y-%m-%d %H:%M'
+
+# Data e hora (UTC) da coleta, no minuto. Obtida uma vez por etapa e gravada
+# em todas as linhas da etapa. No modo offline é a data das páginas usadas:
+# ate ou, sem ate, a da página mais recente da classe no arquivo.
+def data_coleta(classe = None):
+    arquivo = _arquivo_html
+    if arquivo and arquivo.offline:
+        if arquivo.ate:
+            return pd.Timestamp(arquivo.ate).floor('min')
+        obtido = arquivo.ultima_obtencao(classe)
+        if obtido is not None:
+            return pd.Timestamp(obtido, unit='s').floor('min')
+    return pd.Timestamp(datetime.utcnow()).floor('min')
+
+# Pós-processamento das colunas. Os extratores devolvem os valores crus (datas
+# em segundos desde 1970, números com ponto decimal) e as colunas inteiras são
+# convertidas de uma vez para datetime e float. A vírgula decimal e o formato
+# das datas só são aplicados ao gravar o CSV (ver escreve_csv).
+
+# Coluna de datas em segundos desde 1970 (UTC) para datetime.
+def converte_datas(coluna):
+    return pd.to_datetime(pd.to_numeric(coluna, errors='coerce'), unit='s')
+
+# Coluna de datas no formato FORMATO_DATA para datetime.
+def converte_datas_texto(coluna):
+    if pd.api.types.is_datetime64_any_dtype(coluna):
+        return coluna
+    return pd.to_datetime(coluna, format=FORMATO_DATA, errors='coerce')
+
+# Coluna de números, com ponto ou vírgula decimal, para float.
+def converte_decimais(coluna):
+    if pd.api.types.is_float_dtype(coluna):
+        return coluna
+    return pd.to_numeric(coluna.astype(str).str.replace(',', '.', regex=False),
+        errors='coerce').astype('float64')
+
+_RE_COORDENADAS = (r'centerx:(?P<Longitude>-?\d{,3}\.?\d*)/' +
+    r'centery:(?P<Latitude>-?\d{,3}\.?\d*)')
+
+# Longitude e latitude (float) dos links de posição no mapa. Issue #5.
+def coordenadas_do_link(links):
+    df_latlong = links.str.extract(_RE_COORDENADAS, expand=True)
+    df_latlong['Longitude'] = pd.to_numeric(df_latlong.Longitude, errors='coerce')
+    df_latlong['Latitude'] = pd.to_numeric(df_latlong.Latitude, errors='coerce')
+    return df_latlong
+
+# Grava o DataFrame em CSV com separador ';', vírgula decimal (Issue #5) e
+# datas no FORMATO_DATA.
+def escreve_csv(dataframe, destino, **opcoes):
+    dataframe.to_csv(destino, sep=';', index=False, decimal=',',
+        date_format=FORMATO_DATA, **opcoes)
+
+# Colunas com poucos valores distintos (porto, país, tipo, bandeira) viram
+# categóricas: cada valor é guardado uma vez e as linhas guardam só códigos.
+def categoriza(dataframe, colunas):
+    for coluna in colunas:
+        dataframe[coluna] = dataframe[coluna].astype('category')
+    return dataframe
+
+# Cache de respostas em disco.
+#
+# As páginas são guardadas por URL num arquivo SQLite. Cada classe de página
+# tem seu próprio tempo de validade (TTL, em segundos). Uma página vencida é
+# revalidada com If-None-Match / If-Modified-Since quando o servidor enviou
+# ETag / Last-Modified. Quando o cache passa de TAMANHO_MAXIMO_CACHE bytes, as
+# páginas acessadas há mais tempo são removidas (LRU).
+#
+# A página do navio traz a posição, o último sinal e a área do navio, que
+# mudam a cada coleta: com TTL 0 ela nunca é servida sem consultar o site,
+# só revalidada (HTTP 304) quando o servidor informa ETag / Last-Modified.
+CLASSE_PORTOS = 'portos'
+CLASSE_NAVIOS_PORTO = 'navios_porto'
+CLASSE_CHEGADAS_ESPERADAS = 'chegadas_esperadas'
+CLASSE_NAVIO = 'navio'
+
+TTL_CACHE = {
+    CLASSE_PORTOS: 7 * 24 * 3600,
+    CLASSE_NAVIOS_PORTO: 3600,
+    CLASSE_CHEGADAS_ESPERADAS: 15 * 60,
+    CLASSE_NAVIO: 0,
+}
+ARQUIVO_CACHE = './cache/respostas.sqlite'
+
+# Prioridade das requisições de cada classe no limitador do host: menor
+# passa primeiro. As páginas que envelhecem mais rápido vêm antes.
+PRIORIDADE_CLASSE = {
+    CLASSE_CHEGADAS_ESPERADAS: 0,
+    CLASSE_NAVIOS_PORTO: 1,
+    CLASSE_NAVIO: 2,
+    CLASSE_PORTOS: 3,
+}
+PRIORIDADE_PADRAO = 2
+TAMANHO_MAXIMO_CACHE = 512 * 1024 * 1024
+
+class CacheRespostas:
+
+    def __init__(self, caminho = ARQUIVO_CACHE,
+        tamanho_maximo = TAMANHO_MAXIMO_CACHE, ttl = None):
+        caminho = Path(caminho)
+        cria_pasta(caminho)
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = dict(TTL_CACHE)
+        if ttl:
+            self.ttl.update(ttl)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho.as_posix(),
+            check_same_thread=False, isolation_level=None)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS respostas ('
+            'url TEXT PRIMARY KEY, classe TEXT, corpo BLOB, encoding TEXT, '
+            'etag TEXT, last_modified TEXT, armazenado REAL, acesso REAL, '
+            'tamanho INTEGER)')
+        self._conexao.execute('CREATE INDEX IF NOT EXISTS respostas_acesso '
+            'ON respostas (acesso)')
+        self._tamanho_total = self._conexao.execute(
+            'SELECT COALESCE(SUM(tamanho), 0) FROM respostas').fetchone()[0]
+
+    def obtem(self, url):
+        with self._lock:
+            linha = self._conexao.execute('SELECT classe, corpo, encoding, '
+                'etag, last_modified, armazenado FROM respostas WHERE url = ?',
+                (url,)).fetchone()
+            if linha is None:
+                return None
+            self._conexao.execute('UPDATE respostas SET acesso = ? WHERE url = ?',
+                (time.time(), url))
+        classe, corpo, encoding, etag, last_modified, armazenado = linha
+        return {'classe': classe, 'corpo': zlib.decompress(corpo),
+            'encoding': encoding, 'etag': etag, 'last_modified': last_modified,
+            'armazenado': armazenado}
+
+    def fresca(self, entrada, classe):
+        ttl = self.ttl.get(classe, 0)
+        return time.time() - entrada['armazenado'] < ttl
+
+    def grava(self, url, classe, resposta):
+        corpo = zlib.compress(resposta.content)
+        agora = time.time()
+        with self._lock:
+            anterior = self._conexao.execute(
+                'SELECT tamanho FROM respostas WHERE url = ?', (url,)).fetchone()
+            self._conexao.execute('INSERT OR REPLACE INTO respostas VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?)', (url, classe, corpo,
+                resposta.encoding, resposta.headers.get('ETag'),
+                resposta.headers.get('Last-Modified'), agora, agora, len(corpo)))
+            self._tamanho_total += len(corpo) - (anterior[0] if anterior else 0)
+            if self._tamanho_total > self.tamanho_maximo:
+                self._despeja()
+
+    # Página revalidada pelo servidor (HTTP 304): volta a contar o TTL.
+    def renova(self, url):
+        with self._lock:
+            self._conexao.execute('UPDATE respostas SET armazenado = ? '
+                'WHERE url = ?', (time.time(), url))
+
+    # Remove as páginas menos recentemente usadas até o cache ocupar no máximo
+    # 90% do tamanho máximo, para não despejar a cada gravação.
+    def _despeja(self):
+        alvo = self.tamanho_maximo * 0.9
+        cursor = self._conexao.execute(
+            'SELECT url, tamanho FROM respostas ORDER BY acesso')
+        remover = []
+        for url, tamanho in cursor:
+            if self._tamanho_total <= alvo:
+                break
+            remover.append((url,))
+            self._tamanho_total -= tamanho
+        self._conexao.executemany('DELETE FROM respostas WHERE url = ?', remover)
+        logger.info('Cache: {} páginas removidas por excesso de tamanho.'.format(
+            len(remover)))
 
-def converte_data(num):
-    return time.strftime('%Y-%m-%d %H:%M', time.gmtime(num))
+_cache = None
 
-def salva_dataframe_csv(dataframe, caminho_arquivo):
-    caminho_arquivo_acum = caminho_arquivo.replace('.csv', '_acumulado.csv')
+'''
+    Ativa o cache de respostas em disco para todas as chamadas a obtem_pagina
+    que informam a classe da página.
+
+    ttl - dicionário {classe: segundos} que sobrepõe valores de TTL_CACHE.
+'''
+def ativa_cache(caminho = ARQUIVO_CACHE, tamanho_maximo = TAMANHO_MAXIMO_CACHE,
+    ttl = None):
+    global _cache
+    _cache = CacheRespostas(caminho, tamanho_maximo, ttl)
+    return _cache
+
+def desativa_cache():
+    global _cache
+    _cache = None
+
+def resposta_do_cache(url, entrada):
+    r = requests.Response()
+    r.status_code = 200
+    r.url = url
+    r._content = entrada['corpo']
+    r.encoding = entrada['encoding']
+    r.headers['X-Cache'] = 'HIT'
+    return r
+
+# Arquivo das páginas baixadas.
+#
+# Cada página obtida do site (HTTP 200) é acrescentada, comprimida, ao
+# segmento atual da pasta do arquivo (segmento-00001.bin, ...). Cada registro
+# é uma linha JSON com url, classe, data de obtenção, encoding e tamanho,
+# seguida do corpo comprimido; os segmentos nunca são reescritos. Um índice
+# SQLite guarda, por url e data de obtenção, o segmento e a posição do corpo,
+# que é lido por mmap sem carregar o segmento. Ver reconstroi_indice.
+#
+# No modo offline, obtem_pagina responde com a página arquivada, sem acessar
+# a rede: os crawlers rodam de novo sobre as páginas guardadas, com a
+# extração atual, na velocidade do disco.
+PASTA_ARQUIVO_HTML = './arquivo_html'
+TAMANHO_SEGMENTO = 256 * 1024 * 1024
+
+# Página pedida no modo offline que não está no arquivo.
+class PaginaNaoArquivada(requests.RequestException):
+    pass
+
+class ArquivoHtml:
+
+    def __init__(self, pasta = PASTA_ARQUIVO_HTML, offline = False, ate = None,
+        tamanho_segmento = TAMANHO_SEGMENTO):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+        self.ate = ate
+        self.tamanho_segmento = tamanho_segmento
+        self._lock = threading.Lock()
+        self._mapas = {}
+        self._conexao = sqlite3.connect((self.pasta / 'indice.sqlite').as_posix(),
+            check_same_thread=False, isolation_level=None)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS paginas ('
+            'url TEXT, classe TEXT, obtido REAL, encoding TEXT, '
+            'segmento INTEGER, posicao INTEGER, tamanho INTEGER)')
+        self._conexao.execute('CREATE INDEX IF NOT EXISTS paginas_url '
+            'ON paginas (url, obtido)')
+        segmentos = sorted(self.pasta.glob('segmento-*.bin'))
+        self._segmento = int(segmentos[-1].stem.split('-')[1]) if segmentos else 1
+        self._saida = None
+
+    def caminho_segmento(self, numero):
+        return self.pasta / 'segmento-{:05d}.bin'.format(numero)
+
+    def _abre_saida(self):
+        if self._saida is None:
+            self._saida = open(self.caminho_segmento(self._segmento).as_posix(), 'ab')
+        if self._saida.tell() >= self.tamanho_segmento:
+            self._saida.close()
+            self._segmento += 1
+            self._saida = open(self.caminho_segmento(self._segmento).as_posix(), 'ab')
+        return self._saida
+
+    def grava(self, url, classe, resposta, obtido = None):
+        corpo = zlib.compress(resposta.content)
+        if obtido is None:
+            obtido = time.time()
+        cabecalho = json.dumps({'url': url, 'classe': classe, 'obtido': obtido,
+            'encoding': resposta.encoding, 'tamanho': len(corpo)}).encode() + b'\n'
+        with self._lock:
+            saida = self._abre_saida()
+            saida.write(cabecalho)
+            posicao = saida.tell()
+            saida.write(corpo)
+            saida.flush()
+            self._conexao.execute('INSERT INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, classe, obtido, resposta.encoding, self._segmento, posicao,
+                len(corpo)))
+
+    # Segmento mapeado em memória; remapeado quando cresceu depois do mapa.
+    def _mapa(self, segmento, fim):
+        mapa = self._mapas.get(segmento)
+        if mapa is None or len(mapa) < fim:
+            if mapa is not None:
+                mapa.close()
+            if self._saida is not None:
+                self._saida.flush()
+            with open(self.caminho_segmento(segmento).as_posix(), 'rb') as f:
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapas[segmento] = mapa
+        return mapa
+
+    '''
+        Versão mais recente da página obtida até a data ate (epoch) ou None.
+        Retorna o dicionário {'corpo', 'encoding', 'obtido'}.
+    '''
+    def obtem(self, url, ate = None):
+        with self._lock:
+            linha = self._conexao.execute('SELECT obtido, encoding, segmento, '
+                'posicao, tamanho FROM paginas WHERE url = ? AND obtido <= ? '
+                'ORDER BY obtido DESC LIMIT 1', (url, ate or float('inf'))).fetchone()
+            if linha is None:
+                return None
+            obtido, encoding, segmento, posicao, tamanho = linha
+            corpo = self._mapa(segmento, posicao + tamanho)[posicao:posicao + tamanho]
+        return {'corpo': zlib.decompress(corpo), 'encoding': encoding,
+            'obtido': obtido}
+
+    # Data (epoch) da página mais recente da classe, ou de todas, ou None.
+    def ultima_obtencao(self, classe = None):
+        with self._lock:
+            if classe is None:
+                linha = self._conexao.execute(
+                    'SELECT MAX(obtido) FROM paginas').fetchone()
+            else:
+                linha = self._conexao.execute('SELECT MAX(obtido) FROM paginas '
+                    'WHERE classe = ?', (classe,)).fetchone()
+        return linha[0]
+
+    def resposta(self, url):
+        entrada = self.obtem(url, pd.Timestamp(self.ate, tz='UTC').timestamp()
+            if self.ate else None)
+        if entrada is None:
+            raise PaginaNaoArquivada('Página não arquivada: {}'.format(url))
+        r = resposta_do_cache(url, entrada)
+        r.headers['X-Arquivo'] = 'HIT'
+        return r
+
+    # Refaz o índice lendo os cabeçalhos dos registros de todos os segmentos.
+    def reconstroi_indice(self):
+        with self._lock:
+            if self._saida is not None:
+                self._saida.flush()
+            self._conexao.execute('DELETE FROM paginas')
+            for caminho in sorted(self.pasta.glob('segmento-*.bin')):
+                segmento = int(caminho.stem.split('-')[1])
+                with open(caminho.as_posix(), 'rb') as f:
+                    for cabecalho in iter(f.readline, b''):
+                        registro = json.loads(cabecalho)
+                        posicao = f.tell()
+                        self._conexao.execute('INSERT INTO paginas VALUES '
+                            '(?, ?, ?, ?, ?, ?, ?)', (registro['url'],
+                            registro['classe'], registro['obtido'],
+                            registro['encoding'], segmento, posicao,
+                            registro['tamanho']))
+                        f.seek(registro['tamanho'], os.SEEK_CUR)
+
+    def fecha(self):
+        with self._lock:
+            if self._saida is not None:
+                self._saida.close()
+                self._saida = None
+            for mapa in self._mapas.values():
+                mapa.close()
+            self._mapas.clear()
+            self._conexao.close()
+
+_arquivo_html = None
+
+'''
+    Ativa o arquivo de páginas.
+
+    offline - obtem_pagina responde só com páginas arquivadas, sem rede.
+    ate - no modo offline, usa a versão de cada página obtida até essa data
+        (datetime, UTC), que também passa a ser a data de coleta das linhas.
+        Sem ate, a data de coleta de cada etapa é a da sua página arquivada
+        mais recente (ver data_coleta).
+'''
+def ativa_arquivo_html(pasta = PASTA_ARQUIVO_HTML, offline = False, ate = None):
+    global _arquivo_html
+    _arquivo_html = ArquivoHtml(pasta, offline, ate)
+    return _arquivo_html
+
+def desativa_arquivo_html():
+    global _arquivo_html
+    if _arquivo_html:
+        _arquivo_html.fecha()
+    _arquivo_html = None
+
+# # Métricas
+#
+# Com ativa_metricas(), o crawler mede onde vai o tempo de cada execução:
+# latência das requisições por classe de página, bytes baixados, códigos HTTP,
+# tempo de extração e linhas extraídas por tipo de página, tamanho das filas,
+# tempo de gravação por arquivo e duração de cada etapa. O relatório é
+# gravado em JSON e no formato texto do Prometheus (para o textfile collector
+# do node_exporter) ao fim de cada etapa e da execução. Sem métricas ativas,
+# os pontos de medição retornam de imediato.
+#
+# Com ativa_perfil(), cada etapa roda sob o cProfile, inclusive nas threads
+# de executa_em_paralelo, e o perfil é gravado em <pasta>/<etapa>.prof.
+
+# Limites (segundos) dos baldes dos histogramas.
+LIMITES_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LIMITES_DURACAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 1.0)
+
+PREFIXO_PROMETHEUS = 'marinetraffic_'
+
+DESCRICOES_METRICAS = {
+    'requisicao_segundos': 'Tempo para obter uma página da rede, com espera '
+        'do limitador e novas tentativas.',
+    'respostas': 'Páginas obtidas por classe e código HTTP (cache, arquivo e '
+        'erro para as que não vieram da rede).',
+    'bytes_baixados': 'Bytes das páginas obtidas da rede.',
+    'extracao_segundos': 'Tempo de extração das linhas de uma página.',
+    'linhas_extraidas': 'Linhas extraídas das páginas.',
+    'gravacao_segundos': 'Tempo de gravação de um lote ou arquivo.',
+    'linhas_gravadas': 'Linhas gravadas nos arquivos.',
+    'fila': 'Itens na fila (atual).',
+    'fila_maximo': 'Itens na fila (máximo da execução).',
+    'etapa_segundos': 'Duração da última execução da etapa.',
+}
+
+class Histograma:
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.baldes = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.contagem = 0
+
+    def observa(self, valor):
+        self.baldes[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.contagem += 1
+
+    # Contagens acumuladas por limite, como no Prometheus.
+    def acumulados(self):
+        return list(zip([str(l) for l in self.limites] + ['+Inf'],
+            itertools.accumulate(self.baldes)))
+
+'''
+    Métricas de uma execução: contadores, histogramas e medidores, cada um
+    identificado pelo nome e pelos rótulos.
+
+    arquivo_json, arquivo_prometheus - onde grava() escreve os relatórios.
+'''
+class Metricas:
+
+    def __init__(self, arquivo_json = None, arquivo_prometheus = None):
+        self.arquivo_json = arquivo_json
+        self.arquivo_prometheus = arquivo_prometheus
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+        self._medidores = {}
+
+    # Rótulos como texto: valores de tipos diferentes (código HTTP 200 e
+    # 'cache') precisam ser comparáveis para ordenar as séries.
+    @staticmethod
+    def _chave(nome, rotulos):
+        return nome, tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+    def conta(self, nome, valor = 1, **rotulos):
+        chave = self._chave(nome, rotulos)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observa(self, nome, valor, limites = LIMITES_DURACAO, **rotulos):
+        chave = self._chave(nome, rotulos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(limites)
+            histograma.observa(valor)
+
+    # Medidor: guarda o valor atual e o máximo.
+    def mede(self, nome, valor, **rotulos):
+        chave = self._chave(nome, rotulos)
+        with self._lock:
+            _, maximo = self._medidores.get(chave, (valor, valor))
+            self._medidores[chave] = (valor, max(maximo, valor))
+
+    def relatorio(self):
+        with self._lock:
+            metricas = {}
+            for (nome, rotulos), valor in self._contadores.items():
+                metricas.setdefault(nome, []).append(
+                    {'rotulos': dict(rotulos), 'valor': valor})
+            for (nome, rotulos), h in self._histogramas.items():
+                metricas.setdefault(nome, []).append({'rotulos': dict(rotulos),
+                    'contagem': h.contagem, 'soma': h.soma,
+                    'baldes': dict(h.acumulados())})
+            for (nome, rotulos), (atual, maximo) in self._medidores.items():
+                metricas.setdefault(nome, []).append({'rotulos': dict(rotulos),
+                    'valor': atual, 'maximo': maximo})
+        return {
+            'inicio': datetime.utcfromtimestamp(self.inicio).strftime(FORMATO_DATA),
+            'duracao_segundos': time.time() - self.inicio,
+            'metricas': metricas,
+        }
+
+    def texto_prometheus(self):
+        def serie(nome, rotulos, valor, extra = ()):
+            itens = ['{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                for k, v in tuple(rotulos) + tuple(extra)]
+            return '{}{}{} {}'.format(PREFIXO_PROMETHEUS, nome,
+                '{' + ','.join(itens) + '}' if itens else '', valor)
+
+        def cabecalho(nome, tipo, descricao):
+            return ['# HELP {}{} {}'.format(PREFIXO_PROMETHEUS, nome, descricao),
+                '# TYPE {}{} {}'.format(PREFIXO_PROMETHEUS, nome, tipo)]
+
+        linhas = []
+        with self._lock:
+            for nome in sorted({n for n, _ in self._contadores}):
+                linhas += cabecalho(nome + '_total', 'counter',
+                    DESCRICOES_METRICAS.get(nome, nome))
+                for (n, rotulos), valor in sorted(self._contadores.items()):
+                    if n == nome:
+                        linhas.append(serie(nome + '_total', rotulos, valor))
+            for nome in sorted({n for n, _ in self._histogramas}):
+                linhas += cabecalho(nome, 'histogram',
+                    DESCRICOES_METRICAS.get(nome, nome))
+                for (n, rotulos), h in sorted(self._histogramas.items()):
+                    if n != nome:
+                        continue
+                    for limite, acumulado in h.acumulados():
+                        linhas.append(serie(nome + '_bucket', rotulos, acumulado,
+                            [('le', limite)]))
+                    linhas.append(serie(nome + '_sum', rotulos, h.soma))
+                    linhas.append(serie(nome + '_count', rotulos, h.contagem))
+            for nome in sorted({n for n, _ in self._medidores}):
+                for sufixo, indice in (('', 0), ('_maximo', 1)):
+                    linhas += cabecalho(nome + sufixo, 'gauge',
+                        DESCRICOES_METRICAS.get(nome + sufixo, nome))
+                    for (n, rotulos), valores in sorted(self._medidores.items()):
+                        if n == nome:
+                            linhas.append(serie(nome + sufixo, rotulos,
+                                valores[indice]))
+        return '\n'.join(linhas) + '\n'
+
+    # Grava os relatórios configurados. O arquivo é trocado de uma vez, para
+    # que o leitor nunca veja um relatório pela metade.
+    def grava(self):
+        for caminho, conteudo in ((self.arquivo_json, lambda: json.dumps(
+            self.relatorio(), indent=2, ensure_ascii=False)),
+            (self.arquivo_prometheus, self.texto_prometheus)):
+            if not caminho:
+                continue
+            cria_pasta(Path(caminho))
+            temporario = caminho + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                f.write(conteudo())
+            os.replace(temporario, caminho)
+
+_metricas = None
+
+def ativa_metricas(arquivo_json = None, arquivo_prometheus = None):
+    global _metricas
+    _metricas = Metricas(arquivo_json, arquivo_prometheus)
+    return _metricas
+
+def desativa_metricas():
+    global _metricas
+    if _metricas:
+        _metricas.grava()
+    _metricas = None
+
+# Página obtida: status é o código HTTP ou 'cache', 'arquivo' e 'erro'.
+def registra_resposta(classe, status, inicio = None, tamanho = None):
+    metricas = _metricas
+    if metricas is None:
+        return
+    classe = classe or 'outra'
+    metricas.conta('respostas', classe=classe, status=status)
+    if inicio is not None:
+        metricas.observa('requisicao_segundos', time.perf_counter() - inicio,
+            LIMITES_LATENCIA, classe=classe)
+    if tamanho:
+        metricas.conta('bytes_baixados', tamanho, classe=classe)
+
+def registra_extracao(pagina, inicio, linhas):
+    metricas = _metricas
+    if metricas is None:
+        return
+    metricas.observa('extracao_segundos', time.perf_counter() - inicio,
+        pagina=pagina)
+    metricas.conta('linhas_extraidas', linhas, pagina=pagina)
+
+def registra_gravacao(arquivo, inicio, linhas):
+    metricas = _metricas
+    if metricas is None:
+        return
+    metricas.observa('gravacao_segundos', time.perf_counter() - inicio,
+        arquivo=arquivo)
+    metricas.conta('linhas_gravadas', linhas, arquivo=arquivo)
+
+def registra_fila(fila, tamanho):
+    metricas = _metricas
+    if metricas is not None:
+        metricas.mede('fila', tamanho, fila=fila)
+
+_pasta_perfis = None
+_perfil_local = threading.local()
 
-    dataframe.to_csv(caminho_arquivo_acum, sep=';', index=False, mode='a', decimal=',')
+def ativa_perfil(pasta):
+    global _pasta_perfis
+    Path(pasta).mkdir(parents=True, exist_ok=True)
+    _pasta_perfis = pasta
+
+def desativa_perfil():
+    global _pasta_perfis
+    _pasta_perfis = None
+
+'''
+    Perfis (cProfile) das threads de uma etapa.
+
+    O cProfile só observa a thread em que foi ativado: cada thread que executa
+    trabalho da etapa tem o seu perfil, e os perfis são somados ao gravar.
+'''
+class ColetorPerfil:
+
+    def __init__(self):
+        self.perfis = []
+        self._lock = threading.Lock()
+
+    def executa(self, funcao, *args, **kwargs):
+        # A thread já está sob um perfil (executa_em_paralelo sequencial).
+        if getattr(_perfil_local, 'ativo', None) is not None:
+            return funcao(*args, **kwargs)
+
+        perfil = getattr(_perfil_local, 'perfil', None)
+        if perfil is None or _perfil_local.dono is not self:
+            perfil = cProfile.Profile()
+            _perfil_local.perfil = perfil
+            _perfil_local.dono = self
+            with self._lock:
+                self.perfis.append(perfil)
+
+        _perfil_local.ativo = self
+        perfil.enable()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            perfil.disable()
+            _perfil_local.ativo = None
+
+    def grava(self, caminho):
+        with self._lock:
+            perfis = list(self.perfis)
+        if not perfis:
+            return
+        estatisticas = pstats.Stats(perfis[0])
+        for perfil in perfis[1:]:
+            estatisticas.add(perfil)
+        estatisticas.dump_stats(caminho)
+        logger.info('Perfil gravado em {}.'.format(caminho))
+
+# Função que executa funcao no perfil da thread atual, se houver, para uso
+# nas threads de trabalho.
+def no_perfil_atual(funcao):
+    coletor = getattr(_perfil_local, 'ativo', None)
+    if coletor is None:
+        return funcao
+    return functools.partial(coletor.executa, funcao)
+
+'''
+    Decorador das etapas (crawl_* e executa_pipeline): mede a duração da etapa,
+    grava os relatórios de métricas ao fim e, com ativa_perfil(), grava o
+    perfil da etapa.
+'''
+def etapa_medida(funcao):
+    nome = funcao.__name__
+
+    @functools.wraps(funcao)
+    def executa(*args, **kwargs):
+        coletor = None
+        if _pasta_perfis and getattr(_perfil_local, 'ativo', None) is None:
+            coletor = ColetorPerfil()
+        inicio = time.perf_counter()
+        try:
+            if coletor:
+                return coletor.executa(funcao, *args, **kwargs)
+            return funcao(*args, **kwargs)
+        finally:
+            metricas = _metricas
+            if metricas is not None:
+                metricas.mede('etapa_segundos', time.perf_counter() - inicio,
+                    etapa=nome)
+                metricas.grava()
+            if coletor:
+                coletor.grava((Path(_pasta_perfis) / (nome + '.prof')).as_posix())
+    return executa
+
+'''
+    Aplica funcao a cada item de itens usando até `concorrencia` threads.
+
+    Os resultados são devolvidos na mesma ordem dos itens, à medida que ficam
+    prontos. No máximo 2 * concorrencia itens ficam em andamento, então itens
+    pode ser um gerador longo sem que todas as tarefas sejam criadas de uma vez.
+'''
+def executa_em_paralelo(funcao, itens, concorrencia=1):
+    concorrencia = max(1, min(concorrencia or 1, limite_conexoes()))
+    funcao = no_perfil_atual(funcao)
+    if concorrencia == 1:
+        for item in itens:
+            yield funcao(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=concorrencia)
+    pendentes = deque()
+    try:
+        for item in itens:
+            pendentes.append(executor.submit(funcao, item))
+            if len(pendentes) >= 2 * concorrencia:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+    finally:
+        # Interrompido antes do fim (limite, erro): descarta o que não começou.
+        for futuro in pendentes:
+            futuro.cancel()
+        executor.shutdown(wait=True)
+
+# # Histórico acumulado
+#
+# Cada execução acrescenta suas linhas ao histórico do arquivo. No formato
+# 'csv' o histórico é o arquivo <nome>_acumulado.csv. Nos formatos colunares
+# ('parquet' e 'feather', que dependem do pyarrow) é a pasta <nome>_acumulado,
+# particionada por data de coleta (data=AAAA-MM-DD), com um arquivo
+# comprimido por gravação e colunas tipadas. Ler um dia ou algumas colunas
+# não exige percorrer o histórico inteiro (ver le_acumulado).
+FORMATO_ACUMULADO = 'csv'
+FORMATOS_ACUMULADO = ('csv', 'parquet', 'feather')
+COMPRESSAO_ACUMULADO = 'zstd'
+
+# Linhas lidas por vez ao converter um arquivo de saída para o histórico.
+LINHAS_POR_BLOCO_ACUMULADO = 100000
+
+COLUNAS_DATAS = ['DataColeta', 'DataUltimoSinal', 'DataChegada',
+    'ETAInformado', 'ETACalculado']
+COLUNAS_DECIMAIS = ['Latitude', 'Longitude', 'Comprimento', 'Largura']
+COLUNAS_INTEIRAS = ['Id', 'IMO', 'MMSI', 'Porte', 'Tonelagem', 'Ano']
+
+_contador_acumulado = 0
+_lock_acumulado = threading.Lock()
+
+def caminho_acumulado(caminho_arquivo, formato = None):
+    formato = formato or FORMATO_ACUMULADO
+    if formato == 'csv':
+        return caminho_arquivo.replace('.csv', '_acumulado.csv')
+    return caminho_arquivo.replace('.csv', '_acumulado')
+
+'''
+    Converte as colunas conhecidas para os tipos do histórico colunar: datas
+    para datetime, decimais (com vírgula ou ponto) para float e números
+    inteiros para Int64. As demais colunas ficam como texto.
+'''
+def tipa_colunas(dataframe):
+    df = dataframe.copy()
+    for coluna in df.columns:
+        if coluna in COLUNAS_DATAS:
+            df[coluna] = pd.to_datetime(df[coluna], format='%Y-%m-%d %H:%M',
+                errors='coerce')
+        elif coluna in COLUNAS_DECIMAIS:
+            df[coluna] = pd.to_numeric(df[coluna].astype(str).str.replace(
+                ',', '.'), errors='coerce').astype('float64')
+        elif coluna in COLUNAS_INTEIRAS:
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce').astype('Int64')
+        else:
+            df[coluna] = df[coluna].astype('string')
+    return df
+
+def grava_acumulado_colunar(dataframe, pasta, formato):
+    global _contador_acumulado
+
+    df = tipa_colunas(dataframe)
+    if 'DataColeta' in df.columns:
+        datas = df.DataColeta.dt.strftime('%Y-%m-%d').fillna('sem_data')
+    else:
+        datas = pd.Series(data_coleta().strftime('%Y-%m-%d'), index=df.index)
+
+    for data, df_data in df.groupby(datas, sort=True):
+        with _lock_acumulado:
+            _contador_acumulado += 1
+            nome = '{}-{}-{}.{}'.format(datetime.utcnow().strftime(
+                '%Y%m%d%H%M%S%f'), os.getpid(), _contador_acumulado, formato)
+        particao = Path(pasta) / 'data={}'.format(data)
+        particao.mkdir(parents=True, exist_ok=True)
+        df_data = df_data.reset_index(drop=True)
+        if formato == 'parquet':
+            df_data.to_parquet((particao / nome).as_posix(), index=False,
+                compression=COMPRESSAO_ACUMULADO)
+        else:
+            df_data.to_feather((particao / nome).as_posix(),
+                compression=COMPRESSAO_ACUMULADO)
+
+'''
+    Acrescenta o DataFrame ao histórico de caminho_arquivo no formato
+    FORMATO_ACUMULADO.
+'''
+def salva_acumulado(dataframe, caminho_arquivo):
+    caminho_arquivo_acum = caminho_acumulado(caminho_arquivo)
+    if FORMATO_ACUMULADO == 'csv':
+        escreve_csv(dataframe, caminho_arquivo_acum, mode='a')
+    else:
+        grava_acumulado_colunar(dataframe, caminho_arquivo_acum, FORMATO_ACUMULADO)
     logger.info('Arquivo {} criado.'.format(caminho_arquivo_acum))
 
-    dataframe.to_csv(caminho_arquivo, sep=';', index=False, mode='w', decimal=',')
+'''
+    Acrescenta ao histórico colunar as linhas de um arquivo de saída já
+    gravado, lendo o CSV em blocos.
+'''
+def salva_acumulado_de_csv(caminho_arquivo):
+    caminho_arquivo_acum = caminho_acumulado(caminho_arquivo)
+    for bloco in pd.read_csv(caminho_arquivo, sep=';', dtype=str,
+        keep_default_na=False, chunksize=LINHAS_POR_BLOCO_ACUMULADO):
+        grava_acumulado_colunar(bloco, caminho_arquivo_acum, FORMATO_ACUMULADO)
+    logger.info('Arquivo {} criado.'.format(caminho_arquivo_acum))
+
+'''
+    Lê o histórico colunar de caminho_arquivo.
+
+    datas - lista de datas de coleta ('AAAA-MM-DD'). Só as partições dessas
+        datas são lidas.
+    colunas - lista de colunas a ler.
+'''
+def le_acumulado(caminho_arquivo, datas = None, colunas = None, formato = None):
+    formato = formato or FORMATO_ACUMULADO
+    if formato == 'csv':
+        df = pd.read_csv(caminho_acumulado(caminho_arquivo, formato), sep=';',
+            decimal=',', usecols=colunas)
+        if datas:
+            df = df[df.DataColeta.str[:10].isin(datas)]
+        return df
+
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(caminho_acumulado(caminho_arquivo, formato),
+        format=formato, partitioning=ds.partitioning(flavor='hive'))
+    filtro = ds.field('data').isin(list(datas)) if datas else None
+    return dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+
+def ativa_formato_acumulado(formato):
+    global FORMATO_ACUMULADO
+
+    if formato not in FORMATOS_ACUMULADO:
+        raise ValueError('Formato de histórico desconhecido: {}'.format(formato))
+    if formato != 'csv':
+        # Os formatos colunares dependem do pyarrow.
+        import pyarrow
+    FORMATO_ACUMULADO = formato
+
+def salva_dataframe_csv(dataframe, caminho_arquivo):
+    inicio = time.perf_counter()
+    salva_acumulado(dataframe, caminho_arquivo)
+
+    escreve_csv(dataframe, caminho_arquivo, mode='w')
+    registra_gravacao(Path(caminho_arquivo).name, inicio, len(dataframe))
     logger.info('Arquivo {} criado.'.format(caminho_arquivo))
 
 
-# # Navios de interesse
+# # Banco de saída
+#
+# Além dos CSVs, cada etapa pode gravar suas linhas num banco SQLite, para
+# consultas pontuais (última posição de um navio, chegadas num porto) sem
+# carregar os arquivos inteiros. As linhas são gravadas com upsert pela chave
+# da tabela: o banco guarda o estado mais recente de cada porto e navio.
+# IdNavio é a identidade do navio (ver identidade_navio).
+ARQUIVO_BANCO = './output/marine_traffic.sqlite'
+
+TABELA_PORTOS = 'portos'
+TABELA_NAVIOS_PORTO = 'navios_porto'
+TABELA_CHEGADAS_ESPERADAS = 'chegadas_esperadas'
+TABELA_NAVIOS = 'navios'
+
+# {tabela: (colunas da chave, colunas indexadas)}
+TABELAS_BANCO = {
+    TABELA_PORTOS: (['Id'], ['Nome', 'Codigo', 'DataColeta']),
+    TABELA_NAVIOS_PORTO: (['Porto', 'IdNavio'],
+        ['IdNavio', 'DataChegada', 'DataColeta']),
+    TABELA_CHEGADAS_ESPERADAS: (['Porto', 'IdNavio'],
+        ['IdNavio', 'ETAInformado', 'ETACalculado', 'DataColeta']),
+    TABELA_NAVIOS: (['IdNavio'],
+        ['IMO', 'MMSI', 'Nome', 'DataUltimoSinal', 'DataColeta']),
+}
+
+class BancoSaida:
+
+    def __init__(self, caminho = ARQUIVO_BANCO):
+        caminho = Path(caminho)
+        cria_pasta(caminho)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho.as_posix(),
+            check_same_thread=False, isolation_level=None)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('PRAGMA synchronous=NORMAL')
+        self._colunas = {}
+
+    # Datas ficam como texto AAAA-MM-DD HH:MM, que ordena como data.
+    @staticmethod
+    def tipo_coluna(coluna):
+        if coluna in COLUNAS_DECIMAIS:
+            return 'REAL'
+        if coluna in COLUNAS_INTEIRAS:
+            return 'INTEGER'
+        return 'TEXT'
+
+    @staticmethod
+    def valor(tipo, valor):
+        if valor is None or pd.isna(valor) or valor == '':
+            return None
+        if isinstance(valor, datetime):
+            return valor.strftime(FORMATO_DATA)
+        try:
+            if tipo == 'REAL':
+                return float(str(valor).replace(',', '.'))
+            if tipo == 'INTEGER':
+                return int(float(valor))
+        except ValueError:
+            return None
+        return str(valor)
+
+    # Cria a tabela e os índices, e acrescenta colunas que ainda não existem.
+    def _prepara_tabela(self, tabela, colunas):
+        chave, indexadas = TABELAS_BANCO[tabela]
+        existentes = self._colunas.get(tabela)
+        if existentes is None:
+            definicoes = ', '.join('"{}" {}'.format(c, self.tipo_coluna(c))
+                for c in colunas)
+            self._conexao.execute('CREATE TABLE IF NOT EXISTS "{}" ({}, '
+                'PRIMARY KEY ({}))'.format(tabela, definicoes,
+                ', '.join('"{}"'.format(c) for c in chave)))
+            existentes = [linha[1] for linha in self._conexao.execute(
+                'PRAGMA table_info("{}")'.format(tabela))]
+            self._colunas[tabela] = existentes
+
+        for coluna in colunas:
+            if coluna not in existentes:
+                self._conexao.execute('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(
+                    tabela, coluna, self.tipo_coluna(coluna)))
+                existentes.append(coluna)
+
+        for coluna in indexadas:
+            if coluna in existentes:
+                self._conexao.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                    'ON "{0}" ("{1}")'.format(tabela, coluna))
+
+    '''
+        Grava as linhas do DataFrame na tabela, numa única transação.
+        Linhas com a chave de uma linha existente a substituem.
+    '''
+    def grava(self, tabela, dataframe):
+        chave, _ = TABELAS_BANCO[tabela]
+        df = dataframe
+        if 'IdNavio' in chave:
+            df = df.assign(IdNavio=df.LinkNavio.map(identidade_navio))
+        colunas = list(df.columns)
+        tipos = [self.tipo_coluna(c) for c in colunas]
+        linhas = [tuple(self.valor(tipo, v) for tipo, v in zip(tipos, linha))
+            for linha in df.itertuples(index=False, name=None)]
+
+        atualizar = [c for c in colunas if c not in chave]
+        sql = 'INSERT INTO "{}" ({}) VALUES ({}) ON CONFLICT ({}) DO {}'.format(
+            tabela, ', '.join('"{}"'.format(c) for c in colunas),
+            ', '.join('?' for _ in colunas),
+            ', '.join('"{}"'.format(c) for c in chave),
+            'UPDATE SET ' + ', '.join('"{0}" = excluded."{0}"'.format(c)
+                for c in atualizar) if atualizar else 'NOTHING')
+
+        with self._lock:
+            self._prepara_tabela(tabela, colunas)
+            self._conexao.execute('BEGIN')
+            try:
+                self._conexao.executemany(sql, linhas)
+            except Exception:
+                self._conexao.execute('ROLLBACK')
+                raise
+            self._conexao.execute('COMMIT')
+        logger.info('Banco: {} linhas gravadas em {}.'.format(len(linhas), tabela))
+
+    def _tabelas_existentes(self):
+        return {linha[0] for linha in self._conexao.execute(
+            'SELECT name FROM sqlite_master WHERE type = \'table\'')}
+
+    # Linhas da tabela com a data de coleta, sem a coluna IdNavio.
+    def le(self, tabela, coleta):
+        with self._lock:
+            if tabela not in self._tabelas_existentes():
+                return pd.DataFrame()
+            df = pd.read_sql_query('SELECT * FROM "{}" WHERE DataColeta = ? '
+                'ORDER BY rowid'.format(tabela), self._conexao, params=(coleta,))
+        return df.drop(columns=['IdNavio'], errors='ignore')
+
+    # Grava as linhas de um arquivo de saída, lendo o CSV em blocos.
+    def grava_csv(self, tabela, caminho_arquivo):
+        for bloco in pd.read_csv(caminho_arquivo, sep=';', dtype=str,
+            keep_default_na=False, chunksize=LINHAS_POR_BLOCO_ACUMULADO):
+            self.grava(tabela, bloco)
+
+    def fecha(self):
+        with self._lock:
+            self._conexao.close()
+
+_banco = None
 
 '''
-    Crawl dos navios de interesse.
-
-    arquivo_csv - arquivo de saída.
-    proxy - proxy se necessário.
+    Ativa a gravação das linhas de todas as etapas no banco SQLite, além dos
+    arquivos CSV.
 '''
-def crawl_navios_interesse(arquivo_csv = './output/navios_interesse.csv',
-    navios_em_portos_csv=ARQUIVO_NAVIOS_EM_PORTOS,
-    chegadas_esperadas_csv='./output/chegadas_esperadas.csv', proxy=None,
-    limite = None):
+def ativa_banco(caminho = ARQUIVO_BANCO):
+    global _banco
+    _banco = BancoSaida(caminho)
+    return _banco
 
-    df_navios_em_portos =   pd.read_csv(ARQUIVO_NAVIOS_EM_PORTOS, sep=';')
-    df_chegadas_esperadas = pd.read_csv('./output/chegadas_esperadas.csv', sep=';')
+def desativa_banco():
+    global _banco
+    if _banco:
+        _banco.fecha()
+    _banco = None
 
-    urls = df_navios_em_portos.LinkNavio.append(df_chegadas_esperadas.LinkNavio).values
+def salva_no_banco(tabela, dataframe):
+    if _banco and tabela:
+        _banco.grava(tabela, dataframe)
 
+def salva_csv_no_banco(tabela, caminho_arquivo):
+    if _banco and tabela:
+        _banco.grava_csv(tabela, caminho_arquivo)
 
-    navios = []
-    navios_erro = []
-    i_limite = 1
-    for url in urls:
-        # Controle de limite de navios a buscar.
-        if limite and i_limite > limite:
-                break
-        i_limite += 1
 
+# # Execução incremental
+
+# Linhas acumuladas em memória antes de serem gravadas no arquivo parcial.
+TAMANHO_LOTE = 200
 
+'''
+    Checkpoint e arquivos parciais de uma etapa.
+
+    As linhas são gravadas em lotes em arquivos parciais na pasta
+    <arquivo_csv>.parcial. Cada lote gravado é registrado no checkpoint
+    <arquivo_csv>.checkpoint.jsonl, uma linha JSON por lote, com o tamanho do
+    arquivo parcial e as chaves (portos, páginas, navios) concluídas.
+
+    Se a execução for interrompida, a próxima retoma do checkpoint: o que foi
+    concluído não é refeito e o que foi gravado depois do último registro é
+    descartado. A data de coleta (coleta) também fica no checkpoint, para
+    que as linhas de antes e de depois da interrupção tenham a mesma. O
+    checkpoint e os arquivos parciais são removidos ao final da
+    etapa, depois de gravado o arquivo de saída.
+
+    classe - classe das páginas da etapa, para a data de coleta no modo
+        offline (ver data_coleta).
+'''
+class ExecucaoIncremental:
+
+    def __init__(self, arquivo_csv, retomar = True, classe = None):
+        arquivo_csv = Path(arquivo_csv).as_posix()
+        self.arquivo_csv = arquivo_csv
+        self.pasta = Path(arquivo_csv + '.parcial')
+        self.caminho_checkpoint = Path(arquivo_csv + '.checkpoint.jsonl')
+        self._lock = threading.Lock()
+        self._concluidos = set()
+        self._paginas = {}
+        self._arquivos = {}
+        self.coleta = None
+
+        if retomar and self.caminho_checkpoint.exists():
+            self._carrega()
+            logger.info('Retomando {} do checkpoint: {} itens concluídos.'.format(
+                arquivo_csv, len(self._concluidos) + len(self._paginas)))
+        else:
+            self._remove_arquivos()
+
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self._checkpoint = open(self.caminho_checkpoint.as_posix(), 'a',
+            encoding='utf-8')
+        if self.coleta is None:
+            self.coleta = data_coleta(classe)
+            self._escreve({'coleta': self.coleta.strftime(FORMATO_DATA)})
+
+    def _carrega(self):
+        with open(self.caminho_checkpoint.as_posix(), encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    # Última linha incompleta: interrompido durante a gravação.
+                    break
+                if 'coleta' in registro:
+                    self.coleta = pd.Timestamp(datetime.strptime(
+                        registro['coleta'], FORMATO_DATA))
+                else:
+                    self._aplica(registro)
+
+    def _aplica(self, registro):
+        self._arquivos[registro['arquivo']] = (registro['tamanho'],
+            registro['linhas'])
+        self._concluidos.update(registro['concluidos'])
+        self._paginas.update(registro['paginas'])
+
+    def _remove_arquivos(self):
+        if self.pasta.exists():
+            shutil.rmtree(self.pasta.as_posix())
+        if self.caminho_checkpoint.exists():
+            self.caminho_checkpoint.unlink()
+
+    def concluido(self, chave):
+        return chave in self._concluidos
+
+    # Páginas de listagem já gravadas: {url da página: url da próxima}.
+    @property
+    def paginas_concluidas(self):
+        return self._paginas
+
+    def estado_arquivo(self, nome):
+        return self._arquivos.get(nome)
+
+    def gravador(self, nome, colunas, monta = None, tamanho_lote = TAMANHO_LOTE):
+        return GravadorIncremental(self, nome, colunas, monta, tamanho_lote)
+
+    def registra(self, arquivo, tamanho, linhas, concluidos = (), paginas = None):
+        registro = {'arquivo': arquivo, 'tamanho': tamanho, 'linhas': linhas,
+            'concluidos': list(concluidos), 'paginas': paginas or {}}
+        with self._lock:
+            self._escreve(registro)
+            self._aplica(registro)
+
+    def _escreve(self, registro):
+        self._checkpoint.write(json.dumps(registro) + '\n')
+        self._checkpoint.flush()
+        os.fsync(self._checkpoint.fileno())
+
+    '''
+        Grava o arquivo de saída com as linhas dos gravadores, na ordem da
+        lista, e acrescenta as mesmas linhas ao histórico, como
+        salva_dataframe_csv. Os arquivos são copiados em blocos, sem carregar
+        as linhas em memória. Depois remove o checkpoint e os parciais.
+
+        tabela - tabela do banco de saída que recebe as linhas (ver
+            ativa_banco).
+    '''
+    def finaliza(self, gravadores, tabela = None):
+        caminho_arquivo = Path(self.arquivo_csv)
+        cria_pasta(caminho_arquivo)
+        acumula_csv = FORMATO_ACUMULADO == 'csv'
+        caminho_arquivo_acum = caminho_acumulado(self.arquivo_csv)
+
+        destinos = [open(self.arquivo_csv, 'wb')]
+        if acumula_csv:
+            destinos.append(open(caminho_arquivo_acum, 'ab'))
+        try:
+            for i, gravador in enumerate(gravadores):
+                with open(gravador.caminho.as_posix(), 'rb') as parcial:
+                    cabecalho = parcial.readline()
+                    if i == 0:
+                        for destino in destinos:
+                            destino.write(cabecalho)
+                    for bloco in iter(lambda: parcial.read(1024 * 1024), b''):
+                        for destino in destinos:
+                            destino.write(bloco)
+        finally:
+            for destino in destinos:
+                destino.close()
+        if acumula_csv:
+            logger.info('Arquivo {} criado.'.format(caminho_arquivo_acum))
+        else:
+            salva_acumulado_de_csv(self.arquivo_csv)
+        logger.info('Arquivo {} criado.'.format(self.arquivo_csv))
+        salva_csv_no_banco(tabela, self.arquivo_csv)
 
-        logger.info('Obtendo dados de navio em {}.'.format(url))
+        self.limpa()
 
-        r = obtem_pagina(url, proxy)
+    def limpa(self):
+        self._checkpoint.close()
+        self._remove_arquivos()
 
-        if r.status_code == 200: # Código HTTP de OK.
-            soup = BeautifulSoup(r.text, 'lxml')
+'''
+    Grava as linhas de uma etapa em lotes num arquivo parcial.
 
-            detalhes = []
+    monta - função que recebe a lista de linhas de um lote e devolve o
+        DataFrame a gravar. Por padrão, pd.DataFrame(linhas, columns=colunas).
+'''
+class GravadorIncremental:
+
+    def __init__(self, execucao, nome, colunas, monta = None,
+        tamanho_lote = TAMANHO_LOTE):
+        self.execucao = execucao
+        self.nome = nome
+        self.caminho = execucao.pasta / (nome + '.csv')
+        self.tamanho_lote = tamanho_lote
+        self._monta = monta or (lambda linhas: pd.DataFrame(linhas, columns=colunas))
+        self._lock = threading.Lock()
+        self._linhas = []
+        self._concluidos = []
+        self._paginas = {}
+
+        estado = execucao.estado_arquivo(nome)
+        if estado and self.caminho.exists():
+            # Descarta o que foi gravado depois do último registro.
+            tamanho, self.linhas_gravadas = estado
+            with open(self.caminho.as_posix(), 'r+b') as f:
+                f.truncate(tamanho)
+        else:
+            self.linhas_gravadas = 0
+            escreve_csv(self._monta([]), self.caminho.as_posix())
+            execucao.registra(nome, self.caminho.stat().st_size, 0)
+
+    '''
+        Adiciona as linhas ao lote.
+
+        concluido - chave (porto, navio) registrada como concluída junto com
+            as linhas.
+        pagina - tupla (url, url da próxima página) da página de listagem de
+            onde vieram as linhas.
+    '''
+    def adiciona(self, linhas, concluido = None, pagina = None):
+        with self._lock:
+            self._linhas.extend(linhas)
+            if concluido is not None:
+                self._concluidos.append(concluido)
+            if pagina is not None:
+                self._paginas[pagina[0]] = pagina[1]
+            if len(self._linhas) >= self.tamanho_lote:
+                self._descarrega()
+
+    def descarrega(self, concluido = None):
+        with self._lock:
+            if concluido is not None:
+                self._concluidos.append(concluido)
+            self._descarrega()
+
+    def _descarrega(self):
+        if not (self._linhas or self._concluidos or self._paginas):
+            return
+        if self._linhas:
+            inicio = time.perf_counter()
+            df = self._monta(self._linhas)
+            with open(self.caminho.as_posix(), 'a', encoding='utf-8',
+                newline='') as f:
+                escreve_csv(df, f, header=False)
+            registra_gravacao(self.caminho.parent.name, inicio, len(df))
+        self.linhas_gravadas += len(self._linhas)
+        self.execucao.registra(self.nome, self.caminho.stat().st_size,
+            self.linhas_gravadas, self._concluidos, self._paginas)
+        self._linhas = []
+        self._concluidos = []
+        self._paginas = {}
 
-            # Nome do navio
-            nome = soup.find('h1', class_='font-200 no-margin').text
-            detalhes.append(nome)
 
-            # Tipo. Informação logo abaixo do nome no site.
-            tipo = None
-            div = soup.find('div', class_='group-ib vertical-offset-10')
-            if div:
-                tipo = div.text.strip()
+# # Navios de interesse
+
+'''
+    Extrai os detalhes de um navio a partir do HTML da sua página.
 
-            # Latitude e longitude.
-            a_posicao = soup.find('a', class_='details_data_link')
-            link_posicao =None
-            latitude = None
-            longitude = None
-            if a_posicao:
-                if a_posicao['href']:
-                    link_posicao = URL_BASE+a_posicao['href']
-                if a_posicao.text:
-                    coord = a_posicao.text
-                    coord = [i.strip() for i in coord.split('/')]
-                    coord = [i.replace('°','').replace('.',',') for i in coord]
-                    latitude, longitude = coord
+    html - conteúdo da página do navio.
+    url - endereço da página, gravado na coluna LinkNavio.
+'''
+def extrai_dados_navio_bs4(html, url):
+    soup = BeautifulSoup(html, 'lxml')
+
+    detalhes = []
+
+    # Nome do navio
+    nome = soup.find('h1', class_='font-200 no-margin').text
+    detalhes.append(nome)
+
+    # Tipo. Informação logo abaixo do nome no site.
+    tipo = None
+    div = soup.find('div', class_='group-ib vertical-offset-10')
+    if div:
+        tipo = div.text.strip()
+
+    # Latitude e longitude.
+    a_posicao = soup.find('a', class_='details_data_link')
+    link_posicao =None
+    latitude = None
+    longitude = None
+    if a_posicao:
+        if a_posicao['href']:
+            link_posicao = URL_BASE+a_posicao['href']
+        if a_posicao.text:
+            coord = a_posicao.text
+            coord = [i.strip() for i in coord.split('/')]
+            coord = [i.replace('°','') for i in coord]
+            latitude, longitude = coord
+
+    # Data (UTC) último sinal recebido.
+    span = soup.find('span', text=re.compile('Position Received'))
+    data_ultimo_sinal = None
+    if span and span.parent and span.parent.strong and span.parent.strong.text:
+        texto = span.parent.strong.text.strip()
+        match = re.search(r'(\d\d\d\d-\d\d-\d\d\s\d\d:\d\d)', texto)
+        if match:
+            data_ultimo_sinal = match.groups()[0]
+
+    # Área geográfica.
+    span = soup.find('span', text=re.compile('Area:'))
+    area_geografica = None
+    if span and span.parent and span.parent.strong and span.parent.strong.text:
+        area_geografica = span.parent.strong.text.strip()
+
+
+
+    # Restante das informações.
+    div = soup.find('div', class_='row equal-height')
+    div_infos = div.find_all('div', class_='col-xs-6')
+    for div_ in div_infos:
+        detalhes.extend([i.text for i in div_.find_all('b')])
+
+    detalhes.extend([tipo, latitude, longitude,
+        data_ultimo_sinal, area_geografica, link_posicao, url])
+
+    return detalhes
 
-            # Data (UTC) último sinal recebido.
-            span = soup.find('span', text=re.compile('Position Received'))
-            data_ultimo_sinal = None
-            if span and span.parent and span.parent.strong and span.parent.strong.text:
-                texto = span.parent.strong.text.strip()
-                match = re.search(r'(\d\d\d\d-\d\d-\d\d\s\d\d:\d\d)', texto)
-                if match:
-                    data_ultimo_sinal = match.groups()[0]
+'''
+    Busca e extrai os dados de um navio.
 
-            # Área geográfica.
-            span = soup.find('span', text=re.compile('Area:'))
-            area_geografica = None
-            if span and span.parent and span.parent.strong and span.parent.strong.text:
-                area_geografica = span.parent.strong.text.strip()
+    Retorna a tupla (detalhes, erro). Apenas um dos dois é preenchido:
+    detalhes com a linha do navio ou erro com a linha [mensagem, url].
+'''
+def obtem_dados_navio(url, proxy=None):
+    logger.info('Obtendo dados de navio em {}.'.format(url))
+
+    try:
+        r = obtem_pagina(url, proxy, CLASSE_NAVIO)
+    except requests.RequestException as e:
+        s = 'Erro {} ao obter dados do navio {}.'.format(e, url)
+        logger.error(s)
+        registra_falha(CLASSE_NAVIO, url, s)
+        return None, [s, url]
+
+    if r.status_code == 200: # Código HTTP de OK.
+        resolve_falha(url)
+        return extrai_dados_navio(r.text, url), None
+
+    s = 'Erro código HTTP {} ao obter dados do navio {}.'.format(r.status_code, url)
+    logger.error(s)
+    registra_falha(CLASSE_NAVIO, url, s)
+    return None, [s, url]
+
+# Identidade do navio a partir do LinkNavio, no formato
+# /en/ais/details/ships/shipid:123/mmsi:538004321/imo:9321234/vessel:NOME.
+# Usa o IMO, ou o MMSI quando o IMO não é informado (imo:0), ou a própria url.
+def identidade_navio(url):
+    match = re.search(r'/imo:(\d+)', url)
+    if match and int(match.group(1)):
+        return 'IMO:' + match.group(1)
+    match = re.search(r'/mmsi:(\d+)', url)
+    if match and int(match.group(1)):
+        return 'MMSI:' + match.group(1)
+    return url
+
+# Mantém apenas a primeira url de cada navio, na ordem original.
+def remove_navios_repetidos(urls):
+    vistos = set()
+    for url in urls:
+        identidade = identidade_navio(url)
+        if identidade in vistos:
+            continue
+        vistos.add(identidade)
+        yield url
 
+'''
+    Lê do arquivo de navios de interesse de uma execução anterior os navios
+    coletados há menos de janela_frescor (timedelta).
 
+    Retorna o dicionário {identidade do navio: linha do arquivo}. As linhas
+    são lidas como texto, para serem gravadas novamente sem alteração.
 
-            # Restante das informações.
-            div = soup.find('div', class_='row equal-height')
-            div_infos = div.find_all('div', class_='col-xs-6')
-            for div_ in div_infos:
-                detalhes.extend([i.text for i in div_.find_all('b')])
+    todos - lê todos os navios do arquivo, de qualquer data de coleta.
+'''
+def navios_recentes(arquivo_csv = ARQUIVO_NAVIOS_INTERESSE, janela_frescor = None,
+    todos = False):
+    if not (janela_frescor or todos) or not Path(arquivo_csv).exists():
+        return {}
+
+    df = pd.read_csv(arquivo_csv, sep=';', dtype=str, keep_default_na=False)
+    if not todos:
+        coleta = pd.to_datetime(df.DataColeta, format='%Y-%m-%d %H:%M',
+            errors='coerce')
+        df = df[coleta >= datetime.utcnow() - janela_frescor]
+
+    recentes = {}
+    for linha in df.to_dict('records'):
+        recentes[identidade_navio(linha['LinkNavio'])] = linha
+    if not todos:
+        logger.info('{} navios coletados há menos de {} serão reaproveitados.'.format(
+            len(recentes), janela_frescor))
+    return recentes
 
-            detalhes.extend([tipo, latitude, longitude,
-                data_ultimo_sinal, area_geografica, link_posicao, url, data_coleta()])
+'''
+    Urls dos navios na ordem de atualização: primeiro os navios das chegadas
+    esperadas, do que chega antes (ETACalculado ou, sem ele, ETAInformado) ao
+    que chega depois; em seguida os demais, na ordem original.
+'''
+def ordena_navios_por_eta(urls, chegadas_esperadas_csv = ARQUIVO_CHEGADAS_ESPERADAS):
+    etas = {}
+    if Path(chegadas_esperadas_csv).exists():
+        df = pd.read_csv(chegadas_esperadas_csv, sep=';', dtype=str,
+            usecols=['LinkNavio', 'ETAInformado', 'ETACalculado'])
+        eta = converte_datas_texto(df.ETACalculado).fillna(
+            converte_datas_texto(df.ETAInformado))
+        for url, valor in zip(df.LinkNavio, eta):
+            if pd.isna(valor):
+                continue
+            identidade = identidade_navio(url)
+            if identidade not in etas or valor < etas[identidade]:
+                etas[identidade] = valor
+
+    fila = []
+    for posicao, url in enumerate(urls):
+        eta = etas.get(identidade_navio(url))
+        chave = (0, eta.value, posicao) if eta is not None else (1, 0, posicao)
+        heapq.heappush(fila, (chave, url))
+    while fila:
+        yield heapq.heappop(fila)[1]
+
+# Reaproveita a linha de uma coleta recente do navio ou busca o navio no site.
+def obtem_ou_reaproveita_navio(url, proxy = None, recentes = None):
+    if recentes:
+        linha = recentes.get(identidade_navio(url))
+        if linha is not None:
+            return linha, None
+    return obtem_dados_navio(url, proxy)
 
-            navios.append(detalhes)
+'''
+    Busca os navios das urls, com até `concorrencia` navios simultâneos.
+
+    Retorna as listas (navios, navios_erro) na ordem das urls. urls pode ser
+    um gerador, consumido à medida que os navios são buscados. Navios em
+    recentes (ver navios_recentes) não são buscados: a linha anterior, um
+    dicionário, entra no lugar.
+'''
+def busca_navios(urls, proxy=None, concorrencia = CONCORRENCIA_NAVIOS,
+    recentes = None):
+    navios = []
+    navios_erro = []
+    buscar = lambda url: obtem_ou_reaproveita_navio(url, proxy, recentes)
+    for detalhes, erro in executa_em_paralelo(buscar, urls, concorrencia):
+        if erro:
+            navios_erro.append(erro)
         else:
-            s = 'Erro código HTTP {} ao obter dados do navio {}.'.format(r.status_code, url)
-            logger.error(s)
-            navios_erro.append([s,url])
+            navios.append(detalhes)
 
     logger.info('Total de navios sem erro / com erros: {} / {}'.format(len(navios),len(navios_erro)))
+    return navios, navios_erro
 
-    df = pd.DataFrame(navios, columns= ['Nome', 'IMO', 'MMSI', 'Indicativo',
-        'Bandeira', 'TipoAIS', 'Tonelagem', 'Porte', 'Comp_Larg', 'Ano',
-        'Estado','Tipo', 'Latitude', 'Longitude', 'DataUltimoSinal',
-        'AreaGeografica', 'LinkPosicaoNavio', 'LinkNavio','DataColeta'])
+COLUNAS_NAVIOS = ['Nome', 'IMO', 'MMSI', 'Indicativo',
+    'Bandeira', 'TipoAIS', 'Tonelagem', 'Porte', 'Comp_Larg', 'Ano',
+    'Estado','Tipo', 'Latitude', 'Longitude', 'DataUltimoSinal',
+    'AreaGeografica', 'LinkPosicaoNavio', 'LinkNavio']
+REPETIDAS_NAVIOS = ['Bandeira', 'TipoAIS', 'Estado', 'Tipo', 'AreaGeografica']
 
-    df = df.replace('-',pd.np.nan)
-    df.Porte = df.Porte.str.replace(' t','')
-    df['Comprimento'] = df.Comp_Larg.str.extract(r'(\d{0,4}(?:[.,]\d{1,3})?)m', expand=False)
-    df['Comprimento'] = df['Comprimento'].str.replace('.',',')
-    df['Largura'] = df.Comp_Larg.str.extract(r'(\d{0,4}(?:[.,]\d{1,3})?)m$', expand=False)
-    df['Largura'] = df['Largura'].str.replace('.',',')
+_RE_COMPRIMENTO = r'(\d{0,4}(?:[.,]\d{1,3})?)m'
+_RE_LARGURA = r'(\d{0,4}(?:[.,]\d{1,3})?)m$'
+
+'''
+    Monta o DataFrame de navios com as colunas tratadas.
+
+    coleta - valor da coluna DataColeta dos navios buscados. Por padrão, a
+        data atual.
+'''
+def prepara_navios(navios, coleta = None):
+    # Linhas reaproveitadas (dicionários) já foram tratadas na coleta anterior.
+    reaproveitados = [i for i, detalhes in enumerate(navios)
+        if isinstance(detalhes, dict)]
+    novos = [i for i, detalhes in enumerate(navios)
+        if not isinstance(detalhes, dict)]
 
+    df = pd.DataFrame([navios[i] for i in novos], index=novos,
+        columns=COLUNAS_NAVIOS)
+
+    df = df.replace('-',np.nan)
+    df.Porte = df.Porte.str.replace(' t','')
+    df['Latitude'] = converte_decimais(df.Latitude)
+    df['Longitude'] = converte_decimais(df.Longitude)
+    df['DataUltimoSinal'] = converte_datas_texto(df.DataUltimoSinal)
+    df['DataColeta'] = coleta if coleta is not None else data_coleta()
+    df['Comprimento'] = converte_decimais(df.Comp_Larg.str.extract(
+        _RE_COMPRIMENTO, expand=False))
+    df['Largura'] = converte_decimais(df.Comp_Larg.str.extract(
+        _RE_LARGURA, expand=False))
+
+    if reaproveitados:
+        df_reaproveitados = pd.DataFrame([navios[i] for i in reaproveitados],
+            index=reaproveitados, columns=df.columns)
+        for coluna in ('Latitude', 'Longitude', 'Comprimento', 'Largura'):
+            df_reaproveitados[coluna] = converte_decimais(df_reaproveitados[coluna])
+        for coluna in ('DataUltimoSinal', 'DataColeta'):
+            df_reaproveitados[coluna] = converte_datas_texto(
+                df_reaproveitados[coluna])
+        df = pd.concat([df, df_reaproveitados]).sort_index()
+
+    return categoriza(df, REPETIDAS_NAVIOS)
+
+def salva_navios(navios, arquivo_csv = ARQUIVO_NAVIOS_INTERESSE, coleta = None):
+    df = prepara_navios(navios, coleta)
 
     # Salva arquivo no diretório indicado.
     caminho_arquivo = Path(arquivo_csv)
     cria_pasta(caminho_arquivo)
     salva_dataframe_csv(df,caminho_arquivo.as_posix())
+    salva_no_banco(TABELA_NAVIOS, df)
 
-    df_erro = pd.DataFrame(navios_erro, columns=['Erro','URL'])
-    salva_dataframe_csv(df_erro, './navios_erro.csv')
+'''
+    Crawl dos navios de interesse.
 
+    arquivo_csv - arquivo de saída.
+    proxy - proxy se necessário.
+    concorrencia - número de navios buscados simultaneamente. Limitado por
+        limite_conexoes().
+    janela_frescor - timedelta. Navios coletados há menos tempo que isso na
+        execução anterior não são buscados de novo; a linha anterior é mantida.
+    retomar - retoma uma execução interrompida a partir do checkpoint (ver
+        ExecucaoIncremental). Se False, começa do zero.
+    prioridade_eta - busca e grava os navios do que chega antes ao que chega
+        depois (ver ordena_navios_por_eta), em vez da ordem dos arquivos.
+    maximo_buscas - busca no site no máximo esse número de navios, primeiro
+        os que não estão no arquivo anterior; os demais mantêm a linha do
+        arquivo anterior ou, sem ela, ficam para a próxima execução.
+
+    Cada navio (IMO ou MMSI do LinkNavio) é buscado uma única vez, mesmo que
+    esteja em mais de um porto ou também nas chegadas esperadas. Os navios
+    são gravados em lotes à medida que são obtidos; navios com erro numa
+    execução interrompida são buscados de novo ao retomar e gravados no fim.
+'''
+@etapa_medida
+def crawl_navios_interesse(arquivo_csv = ARQUIVO_NAVIOS_INTERESSE,
+    navios_em_portos_csv=ARQUIVO_NAVIOS_EM_PORTOS,
+    chegadas_esperadas_csv=ARQUIVO_CHEGADAS_ESPERADAS, proxy=None,
+    limite = None, concorrencia = CONCORRENCIA_NAVIOS, janela_frescor = None,
+    retomar = True, prioridade_eta = False, maximo_buscas = None):
+
+    df_navios_em_portos =   pd.read_csv(navios_em_portos_csv, sep=';',
+        usecols=['LinkNavio'])
+    df_chegadas_esperadas = pd.read_csv(chegadas_esperadas_csv, sep=';',
+        usecols=['LinkNavio'])
+
+    urls = pd.concat([df_navios_em_portos.LinkNavio,
+        df_chegadas_esperadas.LinkNavio]).values
+    total_urls = len(urls)
+    urls = list(remove_navios_repetidos(urls))
+    logger.info('{} links de navios, {} navios distintos.'.format(total_urls,
+        len(urls)))
+
+    if prioridade_eta:
+        urls = list(ordena_navios_por_eta(urls, chegadas_esperadas_csv))
+
+    # Controle de limite de navios a buscar.
+    if limite:
+        urls = urls[:limite]
+
+    recentes = navios_recentes(arquivo_csv, janela_frescor)
+
+    # Só maximo_buscas navios vão ao site: primeiro os que ainda não estão no
+    # arquivo, para que todos entrem nele, e depois os demais, na ordem das
+    # urls. Os outros mantêm a linha anterior.
+    if maximo_buscas is not None:
+        anteriores = navios_recentes(arquivo_csv, todos = True)
+        a_buscar = [identidade_navio(url) for url in urls]
+        a_buscar = [identidade for identidade in a_buscar
+            if identidade not in recentes]
+        escolhidos = set(([identidade for identidade in a_buscar
+            if identidade not in anteriores] + [identidade for identidade
+            in a_buscar if identidade in anteriores])[:maximo_buscas])
+
+        recentes = dict(recentes)
+        selecionadas = []
+        for url in urls:
+            identidade = identidade_navio(url)
+            if identidade not in recentes and identidade not in escolhidos:
+                if identidade not in anteriores:
+                    continue
+                recentes[identidade] = anteriores[identidade]
+            selecionadas.append(url)
+        logger.info('{} navios serão buscados; {} ficam para a próxima '
+            'execução.'.format(len(escolhidos), len(urls) - len(selecionadas)))
+        urls = selecionadas
+
+    execucao = ExecucaoIncremental(arquivo_csv, retomar, CLASSE_NAVIO)
+    coleta = execucao.coleta
+    gravador = execucao.gravador('navios', COLUNAS_NAVIOS,
+        lambda navios: prepara_navios(navios, coleta))
+    urls = [url for url in urls if not execucao.concluido(url)]
 
+    navios_erro = []
+    buscar = lambda url: (url, obtem_ou_reaproveita_navio(url, proxy, recentes))
+    for url, (detalhes, erro) in executa_em_paralelo(buscar, urls, concorrencia):
+        if erro:
+            navios_erro.append(erro)
+        else:
+            gravador.adiciona([detalhes], concluido=url)
+    gravador.descarrega()
 
-# # Portos brasileiros
+    logger.info('Total de navios sem erro / com erros: {} / {}'.format(
+        gravador.linhas_gravadas, len(navios_erro)))
 
-# In[236]:
+    execucao.finaliza([gravador], TABELA_NAVIOS)
+    salva_delta('navio', arquivo_csv, lambda navios: prepara_navios(navios, coleta))
 
-def crawl_portos_brasil(arquivo_csv='./output/portos.csv', proxy=None,
-    limite = None):
 
-    # Essa URL filtra os apenas os portos. Issue #22.
-    url = 'https://www.marinetraffic.com/en/ais/index/ports/all/flag:BR/port_type:p/per_page:50'
 
-    # Essa URL pega todos os portos, incluindo ancoradouros, marinas, etc. Issue #22.
-    url = 'https://www.marinetraffic.com/en/ais/index/ports/all/flag:BR/per_page:50'
+# # Paginação
 
-    tabela_portos = []
+# Número padrão de páginas de uma listagem buscadas simultaneamente.
+CONCORRENCIA_PAGINAS = 4
 
-    i_limite = 1
-    while True:
+_RE_SPAN = re.compile(r'<span\b([^>]*)>(.*?)</span>', re.S | re.I)
+_RE_CLASSE = re.compile(r'\bclass\s*=\s*["\']([^"\']*)["\']', re.I)
+_RE_HREF = re.compile(r'<a\b[^>]*\bhref\s*=\s*["\']([^"\']*)["\']', re.I)
 
-        logger.info('Capturar portos em: {}'.format(url))
-        html_portos = obtem_pagina(url, proxy=proxy).text
-        soup = BeautifulSoup(html_portos, 'lxml')
+'''
+    Endereço da próxima página da listagem ou None na última página.
 
-        # Tag <table> dos portos.
-        table_portos = soup.find('table', class_='table table-hover text-left')
+    Procura direto no HTML o <span class="next"> da paginação, sem montar a
+    árvore da página, que já é montada pelo extrator das linhas.
+'''
+def url_proxima_pagina(html):
+    spans_next = []
+    for match in _RE_SPAN.finditer(html):
+        classe = _RE_CLASSE.search(match.group(1))
+        if not classe:
+            continue
+        classes = classe.group(1).split()
+        if classes == ['next', 'disabled']:
+            return None
+        if 'next' in classes:
+            spans_next.append(match.group(2))
+
+    if spans_next:
+        href = _RE_HREF.search(spans_next[0])
+        if href:
+            return URL_BASE + html_lib.unescape(href.group(1))
+    return None
 
-        # Percorrer todas as linhas da tabela.
-        # A primeira linha é o cabeçalho, então iremos pulá-la.
-        linhas = table_portos.find_all('tr')
+'''
+    Infere os endereços das páginas seguintes da listagem.
 
-        for linha in linhas[1:]:
-            # Controle de limite de portos a buscar.
-            if limite and i_limite > limite:
-                    break
-            i_limite += 1
+    As páginas seguem o padrão ".../per_page:50/page:N". A partir do link da
+    próxima página, procura no HTML o maior número de página com o mesmo
+    prefixo e devolve os endereços da próxima página até ela. Retorna None se
+    o link não seguir o padrão.
+'''
+def urls_paginas_seguintes(html, url_proxima):
+    match = re.search(r'/page:(\d+)', url_proxima)
+    if not match:
+        return None
+    prefixo = url_proxima[:match.start()]
+    sufixo = url_proxima[match.end():]
+    primeira = int(match.group(1))
+
+    caminho = prefixo[len(URL_BASE):] if prefixo.startswith(URL_BASE) else prefixo
+    numeros = re.findall(re.escape(caminho) + r'/page:(\d+)', html)
+    ultima = max([primeira] + [int(n) for n in numeros])
+    return ['{}/page:{}{}'.format(prefixo, n, sufixo)
+        for n in range(primeira, ultima + 1)]
 
-            # Cada linha contém uma lista de células com os valores de interesse.
-            celulas = linha.find_all('td')
+'''
+    Percorre todas as páginas de uma listagem, devolvendo (url, html, url da
+    próxima página) de cada página na ordem da listagem.
+
+    Depois da primeira página, as páginas indicadas na paginação são buscadas
+    em paralelo. Se os endereços não puderem ser inferidos, ou se a última
+    página ainda tiver link para uma próxima, segue os links "next" um a um a
+    partir dela.
+
+    Páginas que não puderam ser obtidas vão para a fila de falhas (ver
+    registra_falha), com a classe como etapa e o nome_porto, e são puladas.
+    Se a página que falhou for a última obtida, a listagem termina nela: o
+    reprocessamento segue a paginação a partir dela.
+'''
+def percorre_paginas(url, proxy = None, classe = None,
+    concorrencia = CONCORRENCIA_PAGINAS, paginas_concluidas = None,
+    nome_porto = None):
+    def busca(u):
+        try:
+            r = obtem_pagina(u, proxy=proxy, classe=classe)
+        except requests.RequestException as e:
+            erro = 'Erro {} ao obter a página {}.'.format(e, u)
+        else:
+            if r.status_code == 200:
+                resolve_falha(u)
+                return u, r.text
+            erro = 'Erro código HTTP {} ao obter a página {}.'.format(
+                r.status_code, u)
+        logger.error(erro)
+        registra_falha(classe, u, erro, nome_porto)
+        return u, None
+
+    # Páginas gravadas numa execução anterior (ver ExecucaoIncremental):
+    # segue os links registrados no checkpoint, sem buscá-las de novo.
+    concluidas = paginas_concluidas or {}
+    while url in concluidas:
+        url = concluidas[url]
+        if not url:
+            return
+
+    url, html = busca(url)
+    if html is None:
+        return
+    url_proxima = url_proxima_pagina(html)
+    yield url, html, url_proxima
+
+    while url_proxima:
+        urls = None
+        if concorrencia and concorrencia > 1:
+            urls = urls_paginas_seguintes(html, url_proxima)
+        if not urls:
+            urls = [url_proxima]
+
+        for url, html in executa_em_paralelo(busca, urls, concorrencia):
+            if html is None:
+                url_proxima = None
+                continue
+            url_proxima = url_proxima_pagina(html)
+            yield url, html, url_proxima
 
-            # Pular propagada que contém apenas uma célula <td>.
-            if len(celulas) == 1: continue
+# # Portos brasileiros
 
-            # Coluna da bandeira do país.
-            col = celulas[0]
-            pais = col.img.attrs['title']
-            link_bandeira_pais = URL_BASE+col.img['src']
+# In[236]:
 
-            # Coluna de link para o porto.
-            col = celulas[1]
-            link_porto = URL_BASE+col.a['href']
-            nome_porto = col.text.strip().upper()
+def extrai_portos_bs4(html):
+    soup = BeautifulSoup(html, 'lxml')
+    tabela_portos = []
 
-            # Coluna Codigo.
-            col = celulas[2]
-            codigo = col.text.strip()
+    # Tag <table> dos portos.
+    table_portos = soup.find('table', class_='table table-hover text-left')
 
-            # Coluna Foto.
-            col = celulas[3]
-            link_fotos = URL_BASE+col.a['href']
+    # Percorrer todas as linhas da tabela.
+    # A primeira linha é o cabeçalho, então iremos pulá-la.
+    linhas = table_portos.find_all('tr')
 
-            # Coluna Tipo
-            col = celulas[4]
-            tipo = col.text.strip()
+    for linha in linhas[1:]:
+        # Cada linha contém uma lista de células com os valores de interesse.
+        celulas = linha.find_all('td')
 
-            # Coluna link para mapa do porto.
-            col = celulas[5]
-            link_mapa_porto = URL_BASE+col.a['href']
+        # Pular propagada que contém apenas uma célula <td>.
+        if len(celulas) == 1: continue
 
-            # Coluna Navios no porto.
-            col = celulas[6]
-            link_navios_porto = URL_BASE+col.a['href']
+        # Coluna da bandeira do país.
+        col = celulas[0]
+        pais = col.img.attrs['title']
+        link_bandeira_pais = URL_BASE+col.img['src']
 
-            # Coluna link partidas.
-            col = celulas[7]
-            link_partidas = URL_BASE+col.a['href']
+        # Coluna de link para o porto.
+        col = celulas[1]
+        link_porto = URL_BASE+col.a['href']
+        nome_porto = col.text.strip().upper()
 
-            # Coluna link chegadas.
-            col = celulas[8]
-            link_chegadas = URL_BASE+col.a['href']
+        # Coluna Codigo.
+        col = celulas[2]
+        codigo = col.text.strip()
 
-            # Coluna link chegadas esperadas.
-            col = celulas[9]
-            link_chegadas_esperadas = URL_BASE+col.a['href']
+        # Coluna Foto.
+        col = celulas[3]
+        link_fotos = URL_BASE+col.a['href']
 
-            # Coluna status da cobertura AIS.
-            col = celulas[10]
-            cobertura_ais = col.div['title']
+        # Coluna Tipo
+        col = celulas[4]
+        tipo = col.text.strip()
 
-            # Armazena os dados de cada porto na tabela de portos.
-            dados = [pais, nome_porto,codigo, tipo, cobertura_ais, link_bandeira_pais, link_navios_porto,
-                     link_chegadas_esperadas, link_chegadas, link_porto, link_fotos,
-                     link_mapa_porto, data_coleta()]
-            tabela_portos.append(dados)
+        # Coluna link para mapa do porto.
+        col = celulas[5]
+        link_mapa_porto = URL_BASE+col.a['href']
 
-        # Não há próxima página?
-        next_disabled = soup.find('span', class_='next disabled')
-        if next_disabled:
-            logger.info('Fim da captura de portos.')
+        # Coluna Navios no porto.
+        col = celulas[6]
+        link_navios_porto = URL_BASE+col.a['href']
 
-            break
-        else:
-            next_page = soup.find('span', class_='next')
-            url = URL_BASE + next_page.a['href']
+        # Coluna link partidas.
+        col = celulas[7]
+        link_partidas = URL_BASE+col.a['href']
 
-    cabecalho = ['Pais','Nome','Codigo','Tipo','CoberturaAIS','LinkBandeira','LinkNaviosPorto',
+        # Coluna link chegadas.
+        col = celulas[8]
+        link_chegadas = URL_BASE+col.a['href']
+
+        # Coluna link chegadas esperadas.
+        col = celulas[9]
+        link_chegadas_esperadas = URL_BASE+col.a['href']
+
+        # Coluna status da cobertura AIS.
+        col = celulas[10]
+        cobertura_ais = col.div['title']
+
+        # Armazena os dados de cada porto na tabela de portos.
+        dados = [pais, nome_porto,codigo, tipo, cobertura_ais, link_bandeira_pais, link_navios_porto,
+                 link_chegadas_esperadas, link_chegadas, link_porto, link_fotos,
+                 link_mapa_porto]
+        tabela_portos.append(dados)
+
+    return tabela_portos
+
+COLUNAS_PORTOS = ['Pais','Nome','Codigo','Tipo','CoberturaAIS','LinkBandeira','LinkNaviosPorto',
                  'LinkChegadasEsperadas','LinkChegadas','LinkPorto','LinkFotos',
-                'LinkMapaPorto', 'DataColeta']
-    df = pd.DataFrame(tabela_portos, columns=cabecalho)
+                'LinkMapaPorto']
+REPETIDAS_PORTOS = ['Pais', 'Tipo', 'CoberturaAIS', 'LinkBandeira']
+
+# Monta o DataFrame de portos com as colunas tratadas.
+def prepara_portos(tabela_portos, coleta):
+    df = pd.DataFrame(tabela_portos, columns=COLUNAS_PORTOS)
+    df['DataColeta'] = coleta
 
     # Issue #3
-    df['Id'] = df.LinkPorto.str.extract(r'ports/(\d+)/Brazil', expand=False)
+    df['Id'] = pd.to_numeric(df.LinkPorto.str.extract(r'ports/(\d+)/Brazil',
+        expand=False), errors='coerce').astype('Int64')
 
     # Issue #5
-    df_latlong = df.LinkMapaPorto.str.extract(
-        'centerx:(?P<Longitude>-?\d{,3}\.?\d*)/' +
-        'centery:(?P<Latitude>-?\d{,3}\.?\d*)',
-        expand=True)
-    df_latlong['Latitude'] = df_latlong.Latitude.str.replace('.', ',')
-    df_latlong['Longitude'] = df_latlong.Longitude.str.replace('.', ',')
-    df = df.join(df_latlong)
+    df = df.join(coordenadas_do_link(df.LinkMapaPorto))
+    return categoriza(df, REPETIDAS_PORTOS)
 
+@etapa_medida
+def crawl_portos_brasil(arquivo_csv='./output/portos.csv', proxy=None,
+    limite = None, concorrencia_paginas = CONCORRENCIA_PAGINAS, retomar = True):
+
+    # Essa URL filtra os apenas os portos. Issue #22.
+    url = URL_BASE_HTTPS + '/en/ais/index/ports/all/flag:BR/port_type:p/per_page:50'
+
+    # Essa URL pega todos os portos, incluindo ancoradouros, marinas, etc. Issue #22.
+    url = URL_BASE_HTTPS + '/en/ais/index/ports/all/flag:BR/per_page:50'
+
+    execucao = ExecucaoIncremental(arquivo_csv, retomar, CLASSE_PORTOS)
+    coleta = execucao.coleta
+    gravador = execucao.gravador('portos', COLUNAS_PORTOS,
+        lambda linhas: prepara_portos(linhas, coleta))
+
+    # Portos passados ao gravador, incluindo os que ainda estão no lote.
+    capturados = gravador.linhas_gravadas
+    for url_pagina, html, url_proxima in percorre_paginas(url, proxy,
+        CLASSE_PORTOS, concorrencia_paginas, execucao.paginas_concluidas):
+        logger.info('Capturar portos em: {}'.format(url_pagina))
+        linhas = extrai_portos(html, url = url_pagina)
+
+        # Controle de limite de portos a buscar.
+        if limite and capturados + len(linhas) >= limite:
+            gravador.adiciona(linhas[:max(0, limite - capturados)])
+            break
+        gravador.adiciona(linhas, pagina=(url_pagina, url_proxima))
+        capturados += len(linhas)
+    gravador.descarrega()
+
+    # Sem nenhuma página obtida, mantém o arquivo da coleta anterior.
+    if not gravador.linhas_gravadas:
+        logger.error('Nenhum porto capturado; o arquivo {} não foi '
+            'alterado.'.format(arquivo_csv))
+        execucao.limpa()
+        return
+
+    logger.info('Fim da captura de portos.')
+
+    # A lista de portos é pequena: é lida inteira para remover repetidos e
+    # ordenar. As colunas já foram tratadas em prepara_portos e seguem como
+    # texto.
+    df = pd.read_csv(gravador.caminho.as_posix(), sep=';', dtype=str,
+        keep_default_na=False)
 
     # Issue #23.
     df = df.drop_duplicates(['Nome','Codigo']).sort_values('Nome')
@@ -293,12 +2321,108 @@ def crawl_portos_brasil(arquivo_csv='./output/portos.csv', proxy=None,
     caminho_arquivo = Path(arquivo_csv)
     cria_pasta(caminho_arquivo)
     salva_dataframe_csv(df, caminho_arquivo.as_posix())
+    salva_no_banco(TABELA_PORTOS, df)
+    salva_delta('portos', arquivo_csv, lambda linhas: prepara_portos(linhas, coleta))
+    execucao.limpa()
 
-def crawl_navios_em_portos(arquivo_csv=ARQUIVO_NAVIOS_EM_PORTOS,
-    arquivo_portos_interesse = ARQUIVO_PORTOS_INTERESSE,
-    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL, proxy=None):
+# # Portos de interesse
 
-    tabela_navios_porto = []
+# Número padrão de portos capturados simultaneamente.
+CONCORRENCIA_PORTOS = 4
+
+# Nome de porto para comparação: maiúsculas, sem espaços repetidos.
+def normaliza_nome_porto(nome):
+    return ' '.join(str(nome).upper().split())
+
+'''
+    Catálogo dos portos do arquivo de portos do Brasil, com índices por nome
+    normalizado, código e Id. Nomes e códigos repetidos apontam para o
+    primeiro porto do arquivo.
+
+    Use obtem_catalogo_portos, que mantém um catálogo por arquivo no processo
+    e só o recarrega quando o arquivo muda.
+'''
+class CatalogoPortos:
+
+    def __init__(self, arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL):
+        self.arquivo = arquivo_portos_brasil
+        self.df = pd.read_csv(arquivo_portos_brasil, sep=';', encoding='latin-1')
+        self._por_nome = {}
+        self._por_codigo = {}
+        self._por_id = {}
+        for posicao, (nome, codigo, id_porto) in enumerate(zip(
+            self.df.Nome.values, self.df.Codigo.values, self.df.Id.values)):
+            self._por_nome.setdefault(normaliza_nome_porto(nome), posicao)
+            self._por_codigo.setdefault(str(codigo).upper(), posicao)
+            self._por_id.setdefault(self._chave_id(id_porto), posicao)
+
+    def __len__(self):
+        return len(self.df)
+
+    # Ids lidos como float quando algum porto ficou sem Id (1000.0).
+    @staticmethod
+    def _chave_id(id_porto):
+        try:
+            return str(int(float(id_porto)))
+        except (TypeError, ValueError):
+            return str(id_porto)
+
+    def _porto(self, posicao):
+        return None if posicao is None else self.df.iloc[posicao]
+
+    def por_nome(self, nome):
+        return self._porto(self._por_nome.get(normaliza_nome_porto(nome)))
+
+    def por_codigo(self, codigo):
+        return self._porto(self._por_codigo.get(str(codigo).upper()))
+
+    def por_id(self, id_porto):
+        return self._porto(self._por_id.get(self._chave_id(id_porto)))
+
+    # Posições (array) dos portos de uma coluna de nomes; -1 se não existe.
+    def posicoes_por_nome(self, nomes):
+        codigos, unicos = pd.factorize(np.asarray(nomes, dtype=object))
+        posicoes = [self._por_nome.get(normaliza_nome_porto(nome), -1)
+            for nome in unicos]
+        return np.append(np.array(posicoes, dtype=np.intp), -1)[codigos]
+
+# Arquivos lidos por este processo: {caminho: (assinatura, conteúdo)}.
+_catalogos_portos = {}
+_portos_interesse_lidos = {}
+_lock_catalogos = threading.Lock()
+
+# Muda quando o arquivo é regravado.
+def assinatura_arquivo(caminho):
+    estado = Path(caminho).stat()
+    return estado.st_mtime_ns, estado.st_size
+
+def _le_em_cache(lidos, caminho, carrega):
+    chave = Path(caminho).resolve().as_posix()
+    with _lock_catalogos:
+        assinatura = assinatura_arquivo(caminho)
+        lido = lidos.get(chave)
+        if lido is None or lido[0] != assinatura:
+            lido = (assinatura, carrega(caminho))
+            lidos[chave] = lido
+        return lido[1]
+
+def obtem_catalogo_portos(arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL):
+    return _le_em_cache(_catalogos_portos, arquivo_portos_brasil, CatalogoPortos)
+
+def _nomes_portos_interesse(arquivo_portos_interesse):
+    return list(pd.read_csv(arquivo_portos_interesse, sep=';',
+        encoding='latin-1', comment='#').Nome.values)
+
+'''
+    Lê os portos de interesse e os localiza no arquivo de portos do Brasil.
+
+    Retorna a lista de tuplas (nome_porto, porto), onde porto é a linha do
+    arquivo de portos, na ordem do arquivo de portos de interesse. Retorna
+    None se algum dos arquivos não existir. Os arquivos são lidos uma vez
+    por processo, enquanto não mudarem (ver obtem_catalogo_portos).
+'''
+def le_portos_interesse(arquivo_portos_interesse = ARQUIVO_PORTOS_INTERESSE,
+    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL):
 
     path_arquivo_portos_interesse = Path(arquivo_portos_interesse)
     if not path_arquivo_portos_interesse.exists():
@@ -313,308 +2437,1957 @@ def crawl_navios_em_portos(arquivo_csv=ARQUIVO_NAVIOS_EM_PORTOS,
             format(path_arquivo_portos_brasil.absolute().as_posix()))
         return
 
-    df_portos_interesse = pd.read_csv(arquivo_portos_interesse, sep=';',
-        encoding='latin-1', comment='#')
-    df_portos = pd.read_csv(arquivo_portos_brasil, sep=';', encoding='latin-1')
-    nome_portos_interesse = df_portos_interesse.Nome.values
-
+    nome_portos_interesse = _le_em_cache(_portos_interesse_lidos,
+        arquivo_portos_interesse, _nomes_portos_interesse)
+    catalogo = obtem_catalogo_portos(arquivo_portos_brasil)
 
+    portos = []
     for nome_porto in nome_portos_interesse:
-        porto = df_portos[df_portos.Nome==nome_porto.upper()]
+        porto = catalogo.por_nome(nome_porto)
 
         # Verifica se os porto de interesse está no arquivo de portos.
         # Caso não esteja, avisa o erro e pula para o próximo.
-        if len(porto) == 0:
+        if porto is None:
             logger.warn('PORTO DE INTERESSE "{}" CONFIGURADO NO ARQUVO "{}" '\
             'NÃO CONSTA NO ARQUIVO "{}"!'.format(nome_porto,
             path_arquivo_portos_interesse.absolute().as_posix(),
             path_arquivo_portos_brasil.absolute().as_posix()))
             continue
 
-        url_navios_porto =  porto.LinkNaviosPorto.values[0]
+        portos.append((nome_porto, porto))
 
-        # Adiciona filtro para navios tanques.
-        url_navios_porto += '/ship_type:8'
+    return portos
 
-        # Issue #20
-        url_navios_porto += '/per_page:50'
+'''
+    Executa tarefa(indice, nome_porto, porto) para cada porto, com até
+    concorrencia_portos portos em andamento.
 
-        while True:
-            logger.info('Capturar navios no porto {}'.format(url_navios_porto))
-            html_navios_porto = obtem_pagina(url_navios_porto, proxy=proxy).text
-            soup = BeautifulSoup(html_navios_porto, 'lxml')
-            # Tag <table> dos navios.
-            table = soup.find('table', class_='table table-hover text-left')
+    As linhas devolvidas por cada porto são concatenadas na ordem de portos,
+    independente de qual porto termine primeiro. Um porto com erro é
+    registrado no log e não interrompe os demais.
+'''
+def executa_por_porto(tarefa, portos, concorrencia_portos = CONCORRENCIA_PORTOS):
+    def executa(item):
+        indice, (nome_porto, porto) = item
+        try:
+            return tarefa(indice, nome_porto, porto)
+        except Exception:
+            logger.exception('Erro ao capturar o porto {}.'.format(nome_porto))
+            return []
+
+    tabela = []
+    for linhas in executa_em_paralelo(executa, enumerate(portos),
+        concorrencia_portos):
+        tabela.extend(linhas)
+    return tabela
+
+'''
+    Executa crawl_porto para cada porto gravando as linhas em lotes, num
+    arquivo parcial por porto (ver ExecucaoIncremental), e depois grava o
+    arquivo de saída com as linhas na ordem dos portos.
 
-            # Percorrer todas as linhas da tabela.
-            # A primeira linha é o cabeçalho, então iremos pulá-la.
-            linhas = table.find_all('tr')
-            for linha in linhas[1:]:
+    crawl_porto(nome_porto, porto, gravador, paginas_concluidas) - captura um
+        porto, adicionando as linhas de cada página ao gravador.
+    prepara(linhas, coleta) - monta o DataFrame de um lote de linhas.
+    tabela - ver ExecucaoIncremental.finaliza.
+    classe - ver ExecucaoIncremental.
 
-                # Cada linha contém uma lista de células com os valores de interesse.
-                celulas = linha.find_all('td')
+    Retorna a data de coleta das linhas, a da execução retomada, se houver.
+'''
+def crawl_portos_incremental(crawl_porto, portos, arquivo_csv, colunas,
+    prepara, concorrencia_portos = CONCORRENCIA_PORTOS, retomar = True,
+    tabela = None, classe = None):
+
+    execucao = ExecucaoIncremental(arquivo_csv, retomar, classe)
+    coleta = execucao.coleta
+    monta = lambda linhas: prepara(linhas, coleta)
+    gravadores = [execucao.gravador('{:04d}'.format(i), colunas, monta)
+        for i in range(len(portos))]
+    if not gravadores:
+        gravadores = [execucao.gravador('vazio', colunas, monta)]
+
+    def tarefa(indice, nome_porto, porto):
+        chave = 'porto:{:04d}'.format(indice)
+        if execucao.concluido(chave):
+            logger.info('Porto {} já capturado na execução anterior.'.format(
+                nome_porto))
+            return []
+        gravador = gravadores[indice]
+        crawl_porto(nome_porto, porto, gravador, execucao.paginas_concluidas)
+        gravador.descarrega(concluido=chave)
+        return []
+
+    executa_por_porto(tarefa, portos, concorrencia_portos)
+    execucao.finaliza(gravadores, tabela)
+    return coleta
+
+def extrai_navios_porto_bs4(html, nome_porto):
+    soup = BeautifulSoup(html, 'lxml')
+    tabela_navios_porto = []
 
-                # Pular propagada que contém apenas uma célula <td>.
-                if len(celulas) == 1: continue
+    # Tag <table> dos navios.
+    table = soup.find('table', class_='table table-hover text-left')
 
-                # Coluna Tipo.
-                col = celulas[4]
-                tipo = col.text.strip()
+    # Percorrer todas as linhas da tabela.
+    # A primeira linha é o cabeçalho, então iremos pulá-la.
+    linhas = table.find_all('tr')
+    for linha in linhas[1:]:
 
-                # Se não for do tipo "tanker", pula para próximo navio.
-                if tipo.lower().find('tanker') == -1: continue
+        # Cada linha contém uma lista de células com os valores de interesse.
+        celulas = linha.find_all('td')
 
+        # Pular propagada que contém apenas uma célula <td>.
+        if len(celulas) == 1: continue
 
-                # Coluna da bandeira do país.
-                col = celulas[0]
-                pais = col.img.attrs['title']
-                link_bandeira_pais = URL_BASE+col.img['src']
+        # Coluna Tipo.
+        col = celulas[4]
+        tipo = col.text.strip()
 
+        # Se não for do tipo "tanker", pula para próximo navio.
+        if tipo.lower().find('tanker') == -1: continue
 
-                # Coluna de link para o navio.
-                col = celulas[1]
-                link_navio = URL_BASE+col.a['href']
-                nome_navio = col.text.strip()
 
-                # Coluna Foto.
-                col = celulas[2]
-                link_fotos = URL_BASE+col.a['href']
+        # Coluna da bandeira do país.
+        col = celulas[0]
+        pais = col.img.attrs['title']
+        link_bandeira_pais = URL_BASE+col.img['src']
 
 
-                # Coluna Dimensões.
-                col = celulas[5]
-                dimensoes = col.text.strip()
+        # Coluna de link para o navio.
+        col = celulas[1]
+        link_navio = URL_BASE+col.a['href']
+        nome_navio = col.text.strip()
 
-                # Coluna Porte.
-                col = celulas[6]
-                porte = col.text.strip()
+        # Coluna Foto.
+        col = celulas[2]
+        link_fotos = URL_BASE+col.a['href']
 
-                # Coluna Data Ultimo Sinal.
-                col = celulas[8]
-                data_ultimo_sinal = converte_data(int(col.time.text.strip()))
 
-                # Coluna Data Chegada.
-                col = celulas[9]
-                data_chegada = None
-                if col.time:
-                    data_chegada = converte_data(int(col.time.text.strip()))
+        # Coluna Dimensões.
+        col = celulas[5]
+        dimensoes = col.text.strip()
 
-                # Armazena os dados de cada navio na tabela de navios.
-                dados = [nome_porto, nome_navio, tipo, pais, dimensoes, porte,
-                    data_ultimo_sinal, data_chegada, link_navio,
-                    link_bandeira_pais, link_fotos,data_coleta()]
-                tabela_navios_porto.append(dados)
+        # Coluna Porte.
+        col = celulas[6]
+        porte = col.text.strip()
 
-            # Não há próxima página?
-            next_disabled = soup.find('span', class_='next disabled')
-            if next_disabled:
-                logger.info('Fim da captura de navios em portos para o porto {}.'.format(nome_porto))
-                break
-            elif soup.find('span', class_='next'):
-                next_page = soup.find('span', class_='next')
-                url_navios_porto = URL_BASE + next_page.a['href']
-            else:
-                logger.info('Fim da captura de navios em portos para o porto {}.'.format(nome_porto))
-                break
+        # Coluna Data Ultimo Sinal.
+        col = celulas[8]
+        data_ultimo_sinal = int(col.time.text.strip())
 
+        # Coluna Data Chegada.
+        col = celulas[9]
+        data_chegada = None
+        if col.time:
+            data_chegada = int(col.time.text.strip())
 
-    cabecalho = ['Porto', 'Nome','Tipo','Pais', 'Dimensoes', 'Porte',
-        'DataUltimoSinal', 'DataChegada', 'LinkNavio', 'LinkBandeira',
-        'LinkFotos','DataColeta']
-    df = pd.DataFrame(tabela_navios_porto, columns=cabecalho)
-    caminho_arquivo = Path(arquivo_csv)
-    cria_pasta(caminho_arquivo)
-    salva_dataframe_csv(df, caminho_arquivo.as_posix())
+        # Armazena os dados de cada navio na tabela de navios.
+        dados = [nome_porto, nome_navio, tipo, pais, dimensoes, porte,
+            data_ultimo_sinal, data_chegada, link_navio,
+            link_bandeira_pais, link_fotos]
+        tabela_navios_porto.append(dados)
+
+    return tabela_navios_porto
+
+'''
+    Captura os navios tanque de um porto.
+
+    gravador - GravadorIncremental que recebe as linhas de cada página. Sem
+        gravador, as linhas são devolvidas numa lista.
+    paginas_concluidas - ver percorre_paginas.
+'''
+def crawl_navios_porto(nome_porto, porto, proxy=None,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS, ao_encontrar_navio = None,
+    gravador = None, paginas_concluidas = None):
+    tabela_navios_porto = []
+
+    url_navios_porto =  porto.LinkNaviosPorto
+
+    # Adiciona filtro para navios tanques.
+    url_navios_porto += '/ship_type:8'
+
+    # Issue #20
+    url_navios_porto += '/per_page:50'
+
+    for url_pagina, html, url_proxima in percorre_paginas(url_navios_porto,
+        proxy, CLASSE_NAVIOS_PORTO, concorrencia_paginas, paginas_concluidas,
+        nome_porto):
+        logger.info('Capturar navios no porto {}'.format(url_pagina))
+        linhas = extrai_navios_porto(html, nome_porto, url = url_pagina)
+        if gravador:
+            gravador.adiciona(linhas, pagina=(url_pagina, url_proxima))
+        else:
+            tabela_navios_porto.extend(linhas)
+
+        if ao_encontrar_navio:
+            for dados in linhas:
+                ao_encontrar_navio(dados.LinkNavio)
+
+    logger.info('Fim da captura de navios em portos para o porto {}.'.format(nome_porto))
+    return tabela_navios_porto
 
-def crawl_chegadas_esperadas(arquivo_csv='./output/chegadas_esperadas.csv',
+COLUNAS_NAVIOS_PORTO = ['Porto', 'Nome','Tipo','Pais', 'Dimensoes', 'Porte',
+    'DataUltimoSinal', 'DataChegada', 'LinkNavio', 'LinkBandeira',
+    'LinkFotos']
+REPETIDAS_NAVIOS_PORTO = ['Porto', 'Tipo', 'Pais', 'Dimensoes', 'LinkBandeira']
+
+# Monta o DataFrame de navios em portos com as colunas tratadas.
+def prepara_navios_porto(tabela_navios_porto, coleta):
+    df = pd.DataFrame(tabela_navios_porto, columns=COLUNAS_NAVIOS_PORTO)
+    df['DataUltimoSinal'] = converte_datas(df.DataUltimoSinal)
+    df['DataChegada'] = converte_datas(df.DataChegada)
+    df['DataColeta'] = coleta
+    return categoriza(df, REPETIDAS_NAVIOS_PORTO)
+
+@etapa_medida
+def crawl_navios_em_portos(arquivo_csv=ARQUIVO_NAVIOS_EM_PORTOS,
     arquivo_portos_interesse = ARQUIVO_PORTOS_INTERESSE,
-    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL, proxy=None):
+    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL, proxy=None,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS,
+    concorrencia_portos = CONCORRENCIA_PORTOS, ao_encontrar_navio = None,
+    retomar = True):
+
+    portos = le_portos_interesse(arquivo_portos_interesse, arquivo_portos_brasil)
+    if portos is None:
+        return
+
+    crawl_porto = lambda nome_porto, porto, gravador, paginas_concluidas: \
+        crawl_navios_porto(nome_porto, porto, proxy, concorrencia_paginas,
+            ao_encontrar_navio, gravador, paginas_concluidas)
+    coleta = crawl_portos_incremental(crawl_porto, portos, arquivo_csv,
+        COLUNAS_NAVIOS_PORTO, prepara_navios_porto, concorrencia_portos,
+        retomar, TABELA_NAVIOS_PORTO, CLASSE_NAVIOS_PORTO)
+    salva_delta('navios_porto', arquivo_csv,
+        lambda linhas: prepara_navios_porto(linhas, coleta))
+
+def extrai_chegadas_esperadas_bs4(html, nome_porto):
+    soup = BeautifulSoup(html, 'lxml')
     tabela_chegadas_esperadas = []
 
-    path_arquivo_portos_interesse = Path(arquivo_portos_interesse)
-    if not path_arquivo_portos_interesse.exists():
-        logger.error('ARQUIVO DE PORTOS DE INTERESSE NÃO ENCONTRADO! ' \
-            'ESSE ARQUIVO É CRIADO PELO USUÁRIO E DEVE CONTER A COLUNA ' \
-            '"Nome": {}'.format(path_arquivo_portos_interesse.absolute().as_posix()))
+    # Tag <table> dos navios.
+    table = soup.find('table', class_='table table-hover text-left')
+
+    # Percorrer todas as linhas da tabela.
+    # A primeira linha é o cabeçalho, então iremos pulá-la.
+    linhas = table.find_all('tr')
+
+    primeira_linha_dados = True
+    rowspan_porto_origem = False
+    rowspan_eta_calculado = False
+
+    for linha in linhas[1:]:
+
+        # Cada linha contém uma lista de células com os valores de interesse.
+        celulas = linha.find_all('td')
+
+        # Pular linha de propagada que contém apenas uma célula <td>.
+        if len(celulas) == 1: continue
+
+        # Issue #9.
+        # A primeira linha de dados tem a segunda célula com rowspan.
+        # As demais linhas não tem essa célula, então os ínidices das células
+        # precisam ser ajustados.
+        idx_porto_origem = 1
+        idx_nome_navio = 2
+        idx_eta_informado = 3
+        idx_eta_calculado = 4
+        idx_chegada_atual = 5
+        idx_posicao_navio = 6
+        if primeira_linha_dados:
+            col = celulas[idx_porto_origem]
+            if col.has_attr('rowspan'):
+                rowspan_porto_origem = True
+            col = celulas[4]
+            if col.has_attr('rowspan'):
+                rowspan_eta_calculado = True
+            primeira_linha_dados = False
+        else:
+            if rowspan_porto_origem:
+                idx_porto_origem = None
+                idx_nome_navio -= 1
+                idx_eta_informado -= 1
+                idx_eta_calculado -= 1
+                idx_chegada_atual -= 1
+                idx_posicao_navio -= 1
+            if rowspan_eta_calculado:
+                idx_eta_calculado = None
+                idx_chegada_atual -= 1
+                idx_posicao_navio -= 1
+
+
+        # Coluna nome do porto de origem.
+        nome_porto_origem = None
+        if idx_porto_origem:
+            col = celulas[idx_porto_origem]
+            nome_porto_origem = col.text.strip()
+
+        # Coluna nome  do navio.
+        col = celulas[idx_nome_navio]
+        nome_navio = col.a.text.strip()
+        link_navio = URL_BASE+col.a['href'].strip()
+        link_icone_tipo_navio = None
+        if col.img:
+            link_icone_tipo_navio = URL_BASE+col.img['src']
+
+            # Se não for do tipo tanker (vi8.png), pula para próximo navio.
+            if link_icone_tipo_navio.find('vessel_types/vi8.png') == -1:
+                continue
+        # Se não contiver imagem do tipo, pula para próximo navio.
+        else:
+            continue
+
+        # Coluna ETA Informado.
+        eta_informado = None
+        col = celulas[idx_eta_informado]
+        if col.span:
+            if col.span.has_attr('data-time'):
+                valor_data = col.span['data-time']
+                if valor_data:
+                    eta_informado = int(valor_data)
+
+        # Coluna ETA Calculado.
+        eta_calculado = None
+        if idx_eta_calculado:
+            col = celulas[idx_eta_calculado]
+            if col.span:
+                if col.span.has_attr('data-time'):
+                    valor_data = col.span['data-time']
+                    if valor_data:
+                        eta_calculado = int(valor_data)
+
+        # Coluna Chegada Atual.
+        data_chegada = None
+        col = celulas[idx_chegada_atual]
+        if col.span:
+            if col.span.has_attr('data-time'):
+                valor_data = col.span['data-time']
+                if valor_data:
+                    data_chegada = int(valor_data)
+
+        # Link posição do navio
+        link_posicao_navio = None
+        col = celulas[idx_posicao_navio]
+        if col.a:
+            link_posicao_navio = URL_BASE+col.a['href']
+
+
+        # Armazena os dados de cada navio na tabela de navios.
+        dados = [nome_porto, nome_porto_origem,nome_navio,
+            eta_informado, eta_calculado, data_chegada, link_navio,
+            link_icone_tipo_navio, link_posicao_navio]
+        tabela_chegadas_esperadas.append(dados)
+
+    return tabela_chegadas_esperadas
+
+'''
+    Captura as chegadas esperadas de navios tanque em um porto.
+
+    gravador, paginas_concluidas - ver crawl_navios_porto.
+'''
+def crawl_chegadas_esperadas_porto(nome_porto, porto, proxy=None,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS, ao_encontrar_navio = None,
+    gravador = None, paginas_concluidas = None):
+    tabela_chegadas_esperadas = []
+
+    url_chegadas_esperadas =   porto.LinkChegadasEsperadas
+
+    # Issue #20
+    url_chegadas_esperadas += '/per_page:50'
+
+    for url_pagina, html, url_proxima in percorre_paginas(url_chegadas_esperadas,
+        proxy, CLASSE_CHEGADAS_ESPERADAS, concorrencia_paginas,
+        paginas_concluidas, nome_porto):
+        logger.info('Capturar chegadas esperadas no porto {}'.format(url_pagina))
+        linhas = extrai_chegadas_esperadas(html, nome_porto, url = url_pagina)
+        if gravador:
+            gravador.adiciona(linhas, pagina=(url_pagina, url_proxima))
+        else:
+            tabela_chegadas_esperadas.extend(linhas)
+
+        if ao_encontrar_navio:
+            for dados in linhas:
+                ao_encontrar_navio(dados.LinkNavio)
+
+    logger.info('Fim da captura de chegadas esperadas para o ' \
+        'porto {}.'.format(nome_porto))
+    return tabela_chegadas_esperadas
+
+COLUNAS_CHEGADAS_ESPERADAS = ['Porto', 'PortoOrigem','Navio','ETAInformado','ETACalculado', 'DataChegada',
+    'LinkNavio','LinkIconeTipoNavio', 'LinkPosicaoNavio']
+REPETIDAS_CHEGADAS_ESPERADAS = ['Porto', 'PortoOrigem', 'LinkIconeTipoNavio']
+
+# Monta o DataFrame de chegadas esperadas com as colunas tratadas.
+def prepara_chegadas_esperadas(tabela_chegadas_esperadas, coleta):
+    df = pd.DataFrame(tabela_chegadas_esperadas, columns=COLUNAS_CHEGADAS_ESPERADAS)
+    for coluna in ('ETAInformado', 'ETACalculado', 'DataChegada'):
+        df[coluna] = converte_datas(df[coluna])
+    df['DataColeta'] = coleta
+
+    # Pegar latitude e longitude a partir do link da posição.
+    df = df.join(coordenadas_do_link(df.LinkPosicaoNavio))
+    return categoriza(df, REPETIDAS_CHEGADAS_ESPERADAS)
+
+@etapa_medida
+def crawl_chegadas_esperadas(arquivo_csv=ARQUIVO_CHEGADAS_ESPERADAS,
+    arquivo_portos_interesse = ARQUIVO_PORTOS_INTERESSE,
+    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL, proxy=None,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS,
+    concorrencia_portos = CONCORRENCIA_PORTOS, ao_encontrar_navio = None,
+    retomar = True):
+
+    portos = le_portos_interesse(arquivo_portos_interesse, arquivo_portos_brasil)
+    if portos is None:
         return
-    path_arquivo_portos_brasil = Path(arquivo_portos_brasil)
-    if not path_arquivo_portos_brasil.exists():
-        logger.error('ARQUIVO DE PORTOS DO BRASIL NÃO ENCONTRADO. ' \
-            'ESSE ARQUIVO É GERADO PELO CRAWLER DE PORTOS: {}'. \
-            format(path_arquivo_portos_brasil.absolute().as_posix()))
+
+    crawl_porto = lambda nome_porto, porto, gravador, paginas_concluidas: \
+        crawl_chegadas_esperadas_porto(nome_porto, porto, proxy,
+            concorrencia_paginas, ao_encontrar_navio, gravador,
+            paginas_concluidas)
+    coleta = crawl_portos_incremental(crawl_porto, portos, arquivo_csv,
+        COLUNAS_CHEGADAS_ESPERADAS, prepara_chegadas_esperadas,
+        concorrencia_portos, retomar, TABELA_CHEGADAS_ESPERADAS,
+        CLASSE_CHEGADAS_ESPERADAS)
+    salva_delta('chegadas_esperadas', arquivo_csv,
+        lambda linhas: prepara_chegadas_esperadas(linhas, coleta))
+
+
+# # Consultas geográficas
+#
+# Índice espacial dos portos para consultas sobre lotes inteiros de posições
+# (arrays do NumPy ou colunas do pandas, com ponto ou vírgula decimal), sem
+# laços por linha: porto mais próximo, distância até o porto de destino e
+# posições a até R km de cada porto.
+#
+# As coordenadas viram vetores unitários em 3D: a distância em linha reta
+# (corda) entre dois vetores cresce junto com a distância sobre a esfera,
+# sem casos especiais no antimeridiano ou nos polos. Os portos ficam numa
+# árvore k-d com folhas de até TAMANHO_FOLHA_INDICE portos. Uma consulta
+# desce a árvore com todas as posições do lote de uma vez: em cada nó seguem
+# só as posições cuja distância até a caixa do nó é menor que a melhor já
+# achada (ou que o raio), e as distâncias aos portos só são calculadas nas
+# folhas.
+
+RAIO_TERRA_KM = 6371.0088
+TAMANHO_FOLHA_INDICE = 16
+
+# Posições consultadas por vez, para limitar a memória das distâncias.
+BLOCO_CONSULTA = 65536
+
+# Coordenadas em graus como array de float.
+def _graus(valores):
+    if not isinstance(valores, pd.Series):
+        valores = pd.Series(np.asarray(valores).ravel())
+    return converte_decimais(valores).to_numpy(dtype='float64')
+
+# Vetores unitários (N x 3) das coordenadas em graus.
+def vetores_unitarios(latitude, longitude):
+    latitude = np.radians(_graus(latitude))
+    longitude = np.radians(_graus(longitude))
+    cos_latitude = np.cos(latitude)
+    return np.column_stack((cos_latitude * np.cos(longitude),
+        cos_latitude * np.sin(longitude), np.sin(latitude)))
+
+def _corda_para_km(corda):
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.minimum(corda / 2, 1.0))
+
+def _km_para_corda(km):
+    return 2 * np.sin(min(km / RAIO_TERRA_KM, np.pi) / 2)
+
+# Distância (km) sobre a esfera entre as posições 1 e 2 de cada linha.
+def distancia_km(latitude1, longitude1, latitude2, longitude2):
+    return _corda_para_km(np.linalg.norm(vetores_unitarios(latitude1, longitude1)
+        - vetores_unitarios(latitude2, longitude2), axis=1))
+
+'''
+    Índice espacial dos portos de um CatalogoPortos (ver o início da seção).
+    Portos são identificados pela posição no arquivo de portos
+    (catalogo.df.iloc); -1 indica que não há porto. Portos sem coordenadas
+    ficam fora do índice.
+
+    Use obtem_indice_portos, que mantém um índice por arquivo no processo e
+    só o refaz quando o arquivo muda.
+'''
+class IndicePortos:
+
+    def __init__(self, catalogo, tamanho_folha = TAMANHO_FOLHA_INDICE):
+        self.catalogo = catalogo
+        xyz = vetores_unitarios(catalogo.df.Latitude, catalogo.df.Longitude)
+        # Linha extra de NaN para a posição -1 (porto desconhecido).
+        self._xyz = np.vstack([xyz, np.full((1, 3), np.nan)])
+
+        validos = np.flatnonzero(~np.isnan(xyz).any(axis=1))
+        self.profundidade = max(0, int(np.ceil(np.log2(
+            max(len(validos), 1) / tamanho_folha))))
+        internos = 2 ** self.profundidade - 1
+        self._eixo = np.zeros(internos, dtype=np.intp)
+        self._corte = np.zeros(internos)
+        self._folhas = np.zeros((internos + 1, 2), dtype=np.intp)
+        self._ordem = validos
+        self._divide(xyz, 0, 0, len(validos), 0)
+
+        # Pontos na ordem das folhas e caixa de cada nó, das folhas para a
+        # raiz. Nós vazios têm caixa infinita invertida, longe de qualquer
+        # posição.
+        self._pontos = xyz[self._ordem]
+        self._minimos = np.full((2 * internos + 1, 3), np.inf)
+        self._maximos = np.full((2 * internos + 1, 3), -np.inf)
+        for folha, (inicio, fim) in enumerate(self._folhas):
+            if fim > inicio:
+                self._minimos[internos + folha] = self._pontos[inicio:fim].min(axis=0)
+                self._maximos[internos + folha] = self._pontos[inicio:fim].max(axis=0)
+        for no in range(internos - 1, -1, -1):
+            self._minimos[no] = np.minimum(self._minimos[2 * no + 1],
+                self._minimos[2 * no + 2])
+            self._maximos[no] = np.maximum(self._maximos[2 * no + 1],
+                self._maximos[2 * no + 2])
+
+    # Divide os portos ordem[inicio:fim] do nó pela mediana do eixo de maior
+    # extensão. Os nós ficam num array: filhos de n em 2n+1 e 2n+2.
+    def _divide(self, xyz, no, inicio, fim, nivel):
+        if nivel == self.profundidade:
+            self._folhas[no - len(self._eixo)] = inicio, fim
+            return
+        meio = (inicio + fim) // 2
+        if fim > inicio:
+            pontos = xyz[self._ordem[inicio:fim]]
+            eixo = int(np.argmax(pontos.max(axis=0) - pontos.min(axis=0)))
+            parte = np.argpartition(pontos[:, eixo], meio - inicio)
+            self._ordem[inicio:fim] = self._ordem[inicio:fim][parte]
+            self._eixo[no] = eixo
+            self._corte[no] = xyz[self._ordem[meio], eixo]
+        self._divide(xyz, 2 * no + 1, inicio, meio, nivel + 1)
+        self._divide(xyz, 2 * no + 2, meio, fim, nivel + 1)
+
+    # Folha de cada posição, descendo a árvore.
+    def _folha(self, q):
+        no = np.zeros(len(q), dtype=np.intp)
+        linhas = np.arange(len(q))
+        for _ in range(self.profundidade):
+            direita = q[linhas, self._eixo[no]] >= self._corte[no]
+            no = 2 * no + 1 + direita
+        return no - len(self._eixo)
+
+    # Quadrado da menor distância de cada posição até a caixa do nó.
+    def _distancia_caixa(self, q, no):
+        fora = np.maximum(self._minimos[no] - q, q - self._maximos[no])
+        return (np.maximum(fora, 0) ** 2).sum(axis=1)
+
+    '''
+        Desce a árvore com as posições q[selecionadas]. Em cada nó seguem as
+        posições com distância até a caixa menor que limite(selecionadas) (ou
+        igual, com inclusivo), e em cada folha chama
+        na_folha(selecionadas, folha).
+    '''
+    def _percorre(self, q, selecionadas, limite, na_folha, inclusivo = False):
+        internos = len(self._eixo)
+        pilha = [(0, selecionadas)]
+        while pilha:
+            no, selecionadas = pilha.pop()
+            distancias = self._distancia_caixa(q[selecionadas], no)
+            if inclusivo:
+                selecionadas = selecionadas[distancias <= limite(selecionadas)]
+            else:
+                selecionadas = selecionadas[distancias < limite(selecionadas)]
+            if not len(selecionadas):
+                continue
+            if no >= internos:
+                na_folha(selecionadas, no - internos)
+            else:
+                pilha.append((2 * no + 2, selecionadas))
+                pilha.append((2 * no + 1, selecionadas))
+
+    # Quadrados das distâncias das posições q[selecionadas] aos pontos da folha.
+    def _distancias_folha(self, q, selecionadas, folha):
+        inicio, fim = self._folhas[folha]
+        return ((q[selecionadas, None, :] - self._pontos[None, inicio:fim, :])
+            ** 2).sum(axis=2)
+
+    def _aproxima(self, q, selecionadas, folha, melhor, posicao):
+        if not len(selecionadas) or self._folhas[folha, 0] == self._folhas[folha, 1]:
+            return
+        distancias = self._distancias_folha(q, selecionadas, folha)
+        mais_proximo = distancias.argmin(axis=1)
+        distancias = distancias[np.arange(len(selecionadas)), mais_proximo]
+        menores = distancias < melhor[selecionadas]
+        selecionadas = selecionadas[menores]
+        melhor[selecionadas] = distancias[menores]
+        posicao[selecionadas] = self._folhas[folha, 0] + mais_proximo[menores]
+
+    '''
+        Porto mais próximo de cada posição. Retorna os arrays (portos,
+        distancias_km); posições sem coordenadas ficam com porto -1 e
+        distância NaN.
+    '''
+    def mais_proximo(self, latitude, longitude):
+        xyz = vetores_unitarios(latitude, longitude)
+        portos = np.full(len(xyz), -1, dtype=np.intp)
+        distancias = np.full(len(xyz), np.nan)
+        if not len(self._pontos):
+            return portos, distancias
+
+        folhas = range(len(self._folhas))
+        for inicio in range(0, len(xyz), BLOCO_CONSULTA):
+            q = xyz[inicio:inicio + BLOCO_CONSULTA]
+            melhor = np.full(len(q), np.inf)
+            posicao = np.full(len(q), -1, dtype=np.intp)
+
+            # Primeiro a folha de cada posição, que dá uma distância inicial
+            # pequena; depois só as folhas que podem ter um porto mais perto.
+            propria = self._folha(q)
+            ordem = np.argsort(propria, kind='stable')
+            limites = np.searchsorted(propria[ordem], np.arange(len(folhas) + 1))
+            for folha in folhas:
+                self._aproxima(q, ordem[limites[folha]:limites[folha + 1]],
+                    folha, melhor, posicao)
+            self._percorre(q, np.arange(len(q)), lambda selecionadas:
+                melhor[selecionadas], lambda selecionadas, folha:
+                self._aproxima(q, selecionadas[propria[selecionadas] != folha],
+                folha, melhor, posicao))
+
+            achadas = posicao >= 0
+            bloco = slice(inicio, inicio + len(q))
+            portos[bloco][achadas] = self._ordem[posicao[achadas]]
+            distancias[bloco][achadas] = _corda_para_km(np.sqrt(melhor[achadas]))
+        return portos, distancias
+
+    '''
+        Pares de posição e porto a até raio_km um do outro. Retorna os arrays
+        (posicoes, portos, distancias_km), com o índice da posição consultada,
+        o porto e a distância, ordenados por posição e distância.
+    '''
+    def no_raio(self, latitude, longitude, raio_km):
+        xyz = vetores_unitarios(latitude, longitude)
+        limite = _km_para_corda(raio_km) ** 2
+        posicoes, pontos, quadrados = [], [], []
+        for inicio in range(0, len(xyz), BLOCO_CONSULTA):
+            q = xyz[inicio:inicio + BLOCO_CONSULTA]
+
+            def na_folha(selecionadas, folha, inicio = inicio, q = q):
+                distancias = self._distancias_folha(q, selecionadas, folha)
+                linhas, colunas = np.nonzero(distancias <= limite)
+                posicoes.append(inicio + selecionadas[linhas])
+                pontos.append(self._folhas[folha, 0] + colunas)
+                quadrados.append(distancias[linhas, colunas])
+
+            self._percorre(q, np.arange(len(q)), lambda selecionadas: limite,
+                na_folha, inclusivo = True)
+
+        if not posicoes:
+            return (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp),
+                np.zeros(0))
+        posicoes = np.concatenate(posicoes)
+        portos = self._ordem[np.concatenate(pontos)]
+        distancias = _corda_para_km(np.sqrt(np.concatenate(quadrados)))
+        ordem = np.lexsort((distancias, posicoes))
+        return posicoes[ordem], portos[ordem], distancias[ordem]
+
+    '''
+        Distância (km) de cada posição até o porto de destino da mesma linha,
+        dado pelo nome (como na coluna Porto). NaN quando o porto não está no
+        catálogo ou não tem coordenadas.
+    '''
+    def distancia_ao_porto(self, latitude, longitude, nomes_portos):
+        destinos = self._xyz[self.catalogo.posicoes_por_nome(nomes_portos)]
+        return _corda_para_km(np.linalg.norm(vetores_unitarios(latitude,
+            longitude) - destinos, axis=1))
+
+    # Nomes dos portos (None para -1).
+    def nomes(self, portos):
+        nomes = np.append(self.catalogo.df.Nome.to_numpy(dtype=object), None)
+        return nomes[portos]
+
+_indices_portos = {}
+
+def obtem_indice_portos(arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL):
+    return _le_em_cache(_indices_portos, arquivo_portos_brasil,
+        lambda caminho: IndicePortos(CatalogoPortos(caminho)))
+
+'''
+    Acrescenta ao DataFrame de posições (colunas Latitude e Longitude, como
+    em navios_interesse.csv ou chegadas_esperadas.csv) as colunas
+    PortoMaisProximo e DistanciaPortoMaisProximo (km) e, se houver a coluna
+    Porto (porto de destino), DistanciaDestino (km).
+'''
+def adiciona_distancias_portos(df, arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL):
+    indice = obtem_indice_portos(arquivo_portos_brasil)
+    portos, distancias = indice.mais_proximo(df.Latitude, df.Longitude)
+    df = df.assign(PortoMaisProximo = indice.nomes(portos),
+        DistanciaPortoMaisProximo = distancias)
+    if 'Porto' in df.columns:
+        df['DistanciaDestino'] = indice.distancia_ao_porto(df.Latitude,
+            df.Longitude, df.Porto)
+    return df
+
+# # Extração
+
+# Backend de extração do HTML: 'bs4' (BeautifulSoup, padrão) ou 'lxml'. O
+# backend lxml usa XPath direto na árvore do lxml e, nas listagens, monta a
+# árvore apenas da tabela de dados. As linhas produzidas são as mesmas.
+BACKEND_EXTRACAO = 'bs4'
+
+CLASSE_TABELA_DADOS = 'table table-hover text-left'
+
+# Predicado XPath equivalente ao class_ do BeautifulSoup: com espaço, compara
+# o atributo class inteiro; sem espaço, procura a classe entre as do elemento.
+def _xpath_classe(classe):
+    if ' ' in classe:
+        return 'normalize-space(@class)="{}"'.format(classe)
+    return 'contains(concat(" ", normalize-space(@class), " "), " {} ")'.format(
+        classe)
+
+# Primeiro descendente com a tag, como tag.img / tag.a no BeautifulSoup.
+def _filho(elemento, tag):
+    for descendente in elemento.iterdescendants(tag):
+        return descendente
+    return None
+
+def _texto(elemento):
+    return elemento.text_content()
+
+# Equivalente a tag.string do BeautifulSoup: o texto do elemento quando ele
+# tem um único filho, descendo enquanto esse filho for outra tag.
+def _string(elemento):
+    filhos = list(elemento)
+    if not filhos:
+        return elemento.text
+    if len(filhos) == 1 and not elemento.text and not filhos[0].tail \
+        and isinstance(filhos[0].tag, str):
+        return _string(filhos[0])
+    return None
+
+def _busca_span(raiz, padrao):
+    for span in raiz.iterdescendants('span'):
+        texto = _string(span)
+        if texto is not None and re.search(padrao, texto):
+            return span
+    return None
+
+'''
+    Tabela de dados das listagens como elemento lxml.
+
+    Recorta do HTML apenas a tabela, sem montar a árvore da página inteira.
+    Se a tabela não puder ser recortada (tabela aninhada ou atributos em outra
+    ordem), monta a árvore da página e procura a tabela com XPath.
+'''
+def _tabela_dados_lxml(html):
+    inicio = html.find('<table class="{}"'.format(CLASSE_TABELA_DADOS))
+    if inicio != -1:
+        fim = html.find('</table>', inicio)
+        if fim != -1 and html.find('<table', inicio + 1, fim) == -1:
+            return lxml.html.fromstring(html[inicio:fim + len('</table>')])
+
+    documento = lxml.html.document_fromstring(html)
+    tabelas = documento.xpath('//table[{}]'.format(
+        _xpath_classe(CLASSE_TABELA_DADOS)))
+    if not tabelas:
+        raise ValueError('Tabela de dados não encontrada na página.')
+    return tabelas[0]
+
+def extrai_portos_lxml(html):
+    tabela_portos = []
+
+    linhas = list(_tabela_dados_lxml(html).iter('tr'))
+    for linha in linhas[1:]:
+        celulas = list(linha.iterdescendants('td'))
+        if len(celulas) == 1: continue
+
+        img = _filho(celulas[0], 'img')
+        pais = img.get('title')
+        link_bandeira_pais = URL_BASE+img.get('src')
+
+        col = celulas[1]
+        link_porto = URL_BASE+_filho(col, 'a').get('href')
+        nome_porto = _texto(col).strip().upper()
+
+        codigo = _texto(celulas[2]).strip()
+        link_fotos = URL_BASE+_filho(celulas[3], 'a').get('href')
+        tipo = _texto(celulas[4]).strip()
+        link_mapa_porto = URL_BASE+_filho(celulas[5], 'a').get('href')
+        link_navios_porto = URL_BASE+_filho(celulas[6], 'a').get('href')
+        # Não vai para a saída, mas é lido como no extrator bs4.
+        link_partidas = URL_BASE+_filho(celulas[7], 'a').get('href')
+        link_chegadas = URL_BASE+_filho(celulas[8], 'a').get('href')
+        link_chegadas_esperadas = URL_BASE+_filho(celulas[9], 'a').get('href')
+        cobertura_ais = _filho(celulas[10], 'div').get('title')
+
+        dados = [pais, nome_porto,codigo, tipo, cobertura_ais, link_bandeira_pais, link_navios_porto,
+                 link_chegadas_esperadas, link_chegadas, link_porto, link_fotos,
+                 link_mapa_porto]
+        tabela_portos.append(dados)
+
+    return tabela_portos
+
+def extrai_navios_porto_lxml(html, nome_porto):
+    tabela_navios_porto = []
+
+    linhas = list(_tabela_dados_lxml(html).iter('tr'))
+    for linha in linhas[1:]:
+        celulas = list(linha.iterdescendants('td'))
+        if len(celulas) == 1: continue
+
+        tipo = _texto(celulas[4]).strip()
+        if tipo.lower().find('tanker') == -1: continue
+
+        img = _filho(celulas[0], 'img')
+        pais = img.get('title')
+        link_bandeira_pais = URL_BASE+img.get('src')
+
+        col = celulas[1]
+        link_navio = URL_BASE+_filho(col, 'a').get('href')
+        nome_navio = _texto(col).strip()
+
+        link_fotos = URL_BASE+_filho(celulas[2], 'a').get('href')
+        dimensoes = _texto(celulas[5]).strip()
+        porte = _texto(celulas[6]).strip()
+
+        data_ultimo_sinal = int(_texto(_filho(celulas[8], 'time')).strip())
+
+        data_chegada = None
+        time_chegada = _filho(celulas[9], 'time')
+        if time_chegada is not None:
+            data_chegada = int(_texto(time_chegada).strip())
+
+        dados = [nome_porto, nome_navio, tipo, pais, dimensoes, porte,
+            data_ultimo_sinal, data_chegada, link_navio,
+            link_bandeira_pais, link_fotos]
+        tabela_navios_porto.append(dados)
+
+    return tabela_navios_porto
+
+# Atributo data-time (segundos desde 1970) do primeiro <span> da célula.
+def _data_span_lxml(celula):
+    span = _filho(celula, 'span')
+    if span is not None:
+        valor_data = span.get('data-time')
+        if valor_data:
+            return int(valor_data)
+    return None
+
+def extrai_chegadas_esperadas_lxml(html, nome_porto):
+    tabela_chegadas_esperadas = []
+
+    linhas = list(_tabela_dados_lxml(html).iter('tr'))
+
+    primeira_linha_dados = True
+    rowspan_porto_origem = False
+    rowspan_eta_calculado = False
+
+    for linha in linhas[1:]:
+        celulas = list(linha.iterdescendants('td'))
+        if len(celulas) == 1: continue
+
+        # Issue #9. Ver extrai_chegadas_esperadas_bs4.
+        idx_porto_origem = 1
+        idx_nome_navio = 2
+        idx_eta_informado = 3
+        idx_eta_calculado = 4
+        idx_chegada_atual = 5
+        idx_posicao_navio = 6
+        if primeira_linha_dados:
+            if 'rowspan' in celulas[idx_porto_origem].attrib:
+                rowspan_porto_origem = True
+            if 'rowspan' in celulas[4].attrib:
+                rowspan_eta_calculado = True
+            primeira_linha_dados = False
+        else:
+            if rowspan_porto_origem:
+                idx_porto_origem = None
+                idx_nome_navio -= 1
+                idx_eta_informado -= 1
+                idx_eta_calculado -= 1
+                idx_chegada_atual -= 1
+                idx_posicao_navio -= 1
+            if rowspan_eta_calculado:
+                idx_eta_calculado = None
+                idx_chegada_atual -= 1
+                idx_posicao_navio -= 1
+
+        nome_porto_origem = None
+        if idx_porto_origem:
+            nome_porto_origem = _texto(celulas[idx_porto_origem]).strip()
+
+        col = celulas[idx_nome_navio]
+        a = _filho(col, 'a')
+        nome_navio = _texto(a).strip()
+        link_navio = URL_BASE+a.get('href').strip()
+        img = _filho(col, 'img')
+        if img is None:
+            continue
+        link_icone_tipo_navio = URL_BASE+img.get('src')
+        if link_icone_tipo_navio.find('vessel_types/vi8.png') == -1:
+            continue
+
+        eta_informado = _data_span_lxml(celulas[idx_eta_informado])
+
+        eta_calculado = None
+        if idx_eta_calculado:
+            eta_calculado = _data_span_lxml(celulas[idx_eta_calculado])
+
+        data_chegada = _data_span_lxml(celulas[idx_chegada_atual])
+
+        link_posicao_navio = None
+        a = _filho(celulas[idx_posicao_navio], 'a')
+        if a is not None:
+            link_posicao_navio = URL_BASE+a.get('href')
+
+        dados = [nome_porto, nome_porto_origem,nome_navio,
+            eta_informado, eta_calculado, data_chegada, link_navio,
+            link_icone_tipo_navio, link_posicao_navio]
+        tabela_chegadas_esperadas.append(dados)
+
+    return tabela_chegadas_esperadas
+
+# Texto do <strong> ao lado do <span> com o rótulo, como em
+# "<span>Area:</span> <strong>...</strong>".
+def _valor_rotulo_lxml(raiz, rotulo):
+    span = _busca_span(raiz, rotulo)
+    if span is None:
+        return None
+    pai = span.getparent()
+    strong = _filho(pai, 'strong') if pai is not None else None
+    if strong is not None and _texto(strong):
+        return _texto(strong).strip()
+    return None
+
+def extrai_dados_navio_lxml(html, url):
+    raiz = lxml.html.document_fromstring(html)
+
+    detalhes = []
+
+    nome = _texto(raiz.xpath('//h1[{}]'.format(
+        _xpath_classe('font-200 no-margin')))[0])
+    detalhes.append(nome)
+
+    tipo = None
+    div = raiz.xpath('//div[{}]'.format(_xpath_classe('group-ib vertical-offset-10')))
+    if div:
+        tipo = _texto(div[0]).strip()
+
+    link_posicao =None
+    latitude = None
+    longitude = None
+    a_posicao = raiz.xpath('//a[{}]'.format(_xpath_classe('details_data_link')))
+    if a_posicao:
+        a_posicao = a_posicao[0]
+        if a_posicao.get('href'):
+            link_posicao = URL_BASE+a_posicao.get('href')
+        if _texto(a_posicao):
+            coord = [i.strip() for i in _texto(a_posicao).split('/')]
+            coord = [i.replace('°','') for i in coord]
+            latitude, longitude = coord
+
+    data_ultimo_sinal = None
+    texto = _valor_rotulo_lxml(raiz, 'Position Received')
+    if texto:
+        match = re.search(r'(\d\d\d\d-\d\d-\d\d\s\d\d:\d\d)', texto)
+        if match:
+            data_ultimo_sinal = match.groups()[0]
+
+    area_geografica = _valor_rotulo_lxml(raiz, 'Area:')
+
+    div = raiz.xpath('//div[{}]'.format(_xpath_classe('row equal-height')))[0]
+    for div_ in div.xpath('.//div[{}]'.format(_xpath_classe('col-xs-6'))):
+        detalhes.extend([_texto(b) for b in div_.iterdescendants('b')])
+
+    detalhes.extend([tipo, latitude, longitude,
+        data_ultimo_sinal, area_geografica, link_posicao, url])
+
+    return detalhes
+
+EXTRATORES = {
+    'bs4': {
+        'portos': extrai_portos_bs4,
+        'navios_porto': extrai_navios_porto_bs4,
+        'chegadas_esperadas': extrai_chegadas_esperadas_bs4,
+        'navio': extrai_dados_navio_bs4,
+    },
+    'lxml': {
+        'portos': extrai_portos_lxml,
+        'navios_porto': extrai_navios_porto_lxml,
+        'chegadas_esperadas': extrai_chegadas_esperadas_lxml,
+        'navio': extrai_dados_navio_lxml,
+    },
+}
+
+def extrator(nome, backend = None):
+    return EXTRATORES[backend or BACKEND_EXTRACAO][nome]
+
+# Pool de processos de extração. Quando ativo, o HTML obtido pelas threads de
+# rede é analisado em outros processos, fora do GIL do processo principal, e
+# só as linhas extraídas voltam.
+_pool_extracao = None
+
+def _inicializa_processo_extracao(url_base):
+    global URL_BASE
+    URL_BASE = url_base
+
+def _executa_extrator(nome, backend, args):
+    return EXTRATORES[backend][nome](*args)
+
+'''
+    Ativa o pool de processos de extração com `processos` processos.
+
+    Os processos são iniciados com "spawn": o processo principal já tem
+    threads de rede em andamento, e um fork nesse estado pode herdar locks
+    travados.
+'''
+def ativa_processos_extracao(processos = None):
+    global _pool_extracao
+    desativa_processos_extracao()
+    _pool_extracao = ProcessPoolExecutor(max_workers = processos or None,
+        mp_context = multiprocessing.get_context('spawn'),
+        initializer = _inicializa_processo_extracao, initargs = (URL_BASE,))
+    return _pool_extracao
+
+def desativa_processos_extracao():
+    global _pool_extracao
+    if _pool_extracao is not None:
+        _pool_extracao.shutdown(wait=True)
+        _pool_extracao = None
+
+def extrai(nome, *args, backend = None):
+    backend = backend or BACKEND_EXTRACAO
+    pool = _pool_extracao
+    inicio = time.perf_counter()
+    if pool is None:
+        linhas = EXTRATORES[backend][nome](*args)
+    else:
+        linhas = pool.submit(_executa_extrator, nome, backend, args).result()
+    registra_extracao(nome, inicio, 1 if nome == 'navio' else len(linhas))
+    return linhas
+
+# Registros das linhas extraídas.
+#
+# Cada linha vira uma namedtuple, sem o dicionário por instância de um objeto
+# comum nem a folga de alocação de uma lista. Os textos das colunas REPETIDAS_*
+# são internados (sys.intern): o mesmo nome de porto, país ou link de bandeira
+# fica uma única vez em memória, compartilhado por todas as linhas.
+LinhaPorto = namedtuple('LinhaPorto', COLUNAS_PORTOS)
+LinhaNavioPorto = namedtuple('LinhaNavioPorto', COLUNAS_NAVIOS_PORTO)
+LinhaChegadaEsperada = namedtuple('LinhaChegadaEsperada', COLUNAS_CHEGADAS_ESPERADAS)
+LinhaNavio = namedtuple('LinhaNavio', COLUNAS_NAVIOS)
+
+# {extrator: (tipo do registro, posições das colunas internadas)}
+REGISTROS = {}
+for _nome, _tipo, _repetidas in [
+    ('portos', LinhaPorto, REPETIDAS_PORTOS),
+    ('navios_porto', LinhaNavioPorto, REPETIDAS_NAVIOS_PORTO),
+    ('chegadas_esperadas', LinhaChegadaEsperada, REPETIDAS_CHEGADAS_ESPERADAS),
+    ('navio', LinhaNavio, REPETIDAS_NAVIOS)]:
+    REGISTROS[_nome] = (_tipo, frozenset(_tipo._fields.index(c) for c in _repetidas))
+
+def registro(nome, linha):
+    tipo, internadas = REGISTROS[nome]
+    return tipo._make(sys.intern(valor) if i in internadas and
+        isinstance(valor, str) else valor for i, valor in enumerate(linha))
+
+def registros(nome, linhas):
+    return [registro(nome, linha) for linha in linhas]
+
+# url - endereço da página, usado pelas impressões (ver extrai_registros).
+def extrai_portos(html, backend = None, url = None):
+    return extrai_registros('portos', url, html, backend = backend)
+
+def extrai_navios_porto(html, nome_porto, backend = None, url = None):
+    return extrai_registros('navios_porto', url, html, nome_porto,
+        backend = backend)
+
+def extrai_chegadas_esperadas(html, nome_porto, backend = None, url = None):
+    return extrai_registros('chegadas_esperadas', url, html, nome_porto,
+        backend = backend)
+
+def extrai_dados_navio(html, url, backend = None):
+    return extrai_registros('navio', url, html, url, backend = backend)
+
+# # Impressões das páginas
+#
+# Com ativa_impressoes(), cada página de listagem ou de navio ganha uma
+# impressão: o hash da tabela de dados (ou do corpo da página do navio), sem
+# scripts, comentários, tempos relativos ("5 min ago") e diferenças de
+# espaços. As linhas extraídas ficam guardadas com a impressão; se a página
+# não mudou desde a última vez, as linhas guardadas são usadas sem extrair a
+# página de novo. Das páginas que mudaram, as linhas novas ou alteradas
+# ficam registradas até que a etapa as grave em <arquivo>_delta.csv (ver
+# salva_delta), ao lado do arquivo completo.
+ARQUIVO_IMPRESSOES = './output/impressoes.sqlite'
+
+_RE_TABELA_DADOS = re.compile(r'<table\b[^>]*\btable-hover\b[^>]*>.*?</table>',
+    re.S | re.I)
+_RE_CORPO = re.compile(r'<body\b.*</body>', re.S | re.I)
+_RE_VOLATIL = re.compile(r'<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->|'
+    r'\(\s*[^()<>]*\bago\s*\)', re.S | re.I)
+
+# Impressão da página para o extrator nome com os argumentos args.
+def impressao_pagina(nome, html, args):
+    trecho = _RE_CORPO if nome == 'navio' else _RE_TABELA_DADOS
+    match = trecho.search(html)
+    trecho = _RE_VOLATIL.sub('', match.group(0) if match else html)
+    conteudo = '\n'.join([nome, json.dumps(args), ' '.join(trecho.split())])
+    return hashlib.blake2b(conteudo.encode('utf-8'), digest_size=16).hexdigest()
+
+class ImpressoesPaginas:
+
+    def __init__(self, caminho = ARQUIVO_IMPRESSOES):
+        caminho = Path(caminho)
+        cria_pasta(caminho)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho.as_posix(),
+            check_same_thread=False, isolation_level=None)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('PRAGMA synchronous=NORMAL')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS paginas ('
+            'url TEXT PRIMARY KEY, nome TEXT, impressao TEXT, linhas TEXT)')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS alteradas ('
+            'id INTEGER PRIMARY KEY, nome TEXT, linha TEXT)')
+        self.inalteradas = 0
+        self.alteradas = 0
+
+    # Linhas guardadas da página, se a impressão é a mesma; senão None.
+    def linhas_inalteradas(self, url, impressao):
+        with self._lock:
+            linha = self._conexao.execute('SELECT impressao, linhas FROM paginas '
+                'WHERE url = ?', (url,)).fetchone()
+            if linha is None or linha[0] != impressao:
+                return None
+            self.inalteradas += 1
+        return json.loads(linha[1])
+
+    # Guarda as linhas da página e registra as que não estavam nela antes.
+    def grava(self, nome, url, impressao, linhas):
+        novas = [json.dumps(linha) for linha in linhas]
+        with self._lock:
+            anterior = self._conexao.execute('SELECT linhas FROM paginas '
+                'WHERE url = ?', (url,)).fetchone()
+            anteriores = set()
+            if anterior is not None:
+                anteriores = {json.dumps(linha) for linha in json.loads(anterior[0])}
+            self._conexao.execute('BEGIN')
+            self._conexao.execute('INSERT OR REPLACE INTO paginas VALUES '
+                '(?, ?, ?, ?)', (url, nome, impressao, json.dumps(linhas)))
+            self._conexao.executemany('INSERT INTO alteradas (nome, linha) '
+                'VALUES (?, ?)', [(nome, linha) for linha in novas
+                if linha not in anteriores])
+            self._conexao.execute('COMMIT')
+            self.alteradas += 1
+
+    # Retira as linhas alteradas registradas para o extrator.
+    def retira_alteradas(self, nome):
+        with self._lock:
+            self._conexao.execute('BEGIN')
+            linhas = self._conexao.execute('SELECT linha FROM alteradas WHERE '
+                'nome = ? ORDER BY id', (nome,)).fetchall()
+            self._conexao.execute('DELETE FROM alteradas WHERE nome = ?', (nome,))
+            self._conexao.execute('COMMIT')
+        return [json.loads(linha[0]) for linha in linhas]
+
+    def fecha(self):
+        with self._lock:
+            self._conexao.close()
+
+_impressoes = None
+
+def ativa_impressoes(caminho = ARQUIVO_IMPRESSOES):
+    global _impressoes
+    _impressoes = ImpressoesPaginas(caminho)
+    return _impressoes
+
+def desativa_impressoes():
+    global _impressoes
+    if _impressoes:
+        logger.info('Impressões: {} páginas sem mudança, {} extraídas.'.format(
+            _impressoes.inalteradas, _impressoes.alteradas))
+        _impressoes.fecha()
+    _impressoes = None
+
+'''
+    Extrai as linhas da página e devolve os registros. Com as impressões
+    ativas e a url da página, páginas sem mudança não são extraídas de novo.
+'''
+def extrai_registros(nome, url, html, *args, backend = None):
+    impressoes = _impressoes
+    if impressoes is None or url is None:
+        linhas = extrai(nome, html, *args, backend = backend)
+        return registro(nome, linhas) if nome == 'navio' else registros(nome, linhas)
+
+    impressao = impressao_pagina(nome, html, args)
+    linhas = impressoes.linhas_inalteradas(url, impressao)
+    if linhas is None:
+        linhas = extrai(nome, html, *args, backend = backend)
+        if nome == 'navio':
+            linhas = [linhas]
+        impressoes.grava(nome, url, impressao, linhas)
+    else:
+        registra_extracao(nome + '_inalterada', time.perf_counter(), 0)
+    return registro(nome, linhas[0]) if nome == 'navio' else registros(nome, linhas)
+
+'''
+    Grava em <arquivo>_delta.csv as linhas novas ou alteradas do extrator
+    nome desde a última gravação do delta. Sem impressões ativas, não faz
+    nada.
+
+    monta - função que recebe os registros e devolve o DataFrame a gravar
+        (a mesma do arquivo completo).
+'''
+def salva_delta(nome, arquivo_csv, monta):
+    if _impressoes is None:
         return
+    df = monta(registros(nome, _impressoes.retira_alteradas(nome)))
+    caminho = Path(arquivo_csv)
+    caminho_delta = caminho.with_name(caminho.stem + '_delta' + caminho.suffix)
+    cria_pasta(caminho_delta)
+    escreve_csv(df, caminho_delta.as_posix(), mode='w')
+    logger.info('Arquivo {} criado com {} linhas novas ou alteradas.'.format(
+        caminho_delta, len(df)))
+
+
+# # Fila de falhas
+#
+# As páginas que não puderam ser obtidas (erro de conexão ou código HTTP
+# diferente de 200, depois das novas tentativas de requisita) ficam numa fila
+# persistente, um banco SQLite, com a url, a etapa (classe da página), o
+# porto, o último erro e o número de tentativas. Uma página obtida depois,
+# numa coleta normal ou no reprocessamento, sai da fila.
+#
+# reprocessa_falhas busca de novo só as páginas da fila cujo intervalo de
+# espera já passou e mescla as linhas obtidas nos arquivos de saída. O
+# intervalo dobra a cada tentativa que falha. Páginas de listagem são
+# percorridas a partir da página que falhou até o fim da paginação.
+ARQUIVO_FALHAS = './output/falhas.sqlite'
+
+# Espera (segundos) antes da segunda tentativa de uma página da fila, dobrada
+# a cada nova falha até BACKOFF_FALHAS_MAXIMO. A primeira tentativa do
+# reprocessamento não espera: requisita já tentou de novo durante a coleta.
+BACKOFF_FALHAS_BASE = 5 * 60
+BACKOFF_FALHAS_MAXIMO = 12 * 3600
+
+# Páginas com esse número de tentativas continuam na fila, mas não são mais
+# buscadas pelo reprocessamento.
+TENTATIVAS_FALHA = 8
+
+Falha = namedtuple('Falha', ['url', 'etapa', 'porto', 'erro', 'tentativas',
+    'proxima'])
+
+class FilaFalhas:
+
+    def __init__(self, caminho = ARQUIVO_FALHAS):
+        caminho = Path(caminho)
+        cria_pasta(caminho)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho.as_posix(), timeout=60,
+            check_same_thread=False, isolation_level=None)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS falhas ('
+            'url TEXT PRIMARY KEY, etapa TEXT, porto TEXT, erro TEXT, '
+            'tentativas INTEGER, primeira REAL, ultima REAL, proxima REAL)')
+        # Urls na fila, para que resolve não consulte o banco a cada página.
+        self._urls = {linha[0] for linha in
+            self._conexao.execute('SELECT url FROM falhas')}
+
+    def contem(self, url):
+        return url in self._urls
+
+    # Registra mais uma tentativa da página e agenda a próxima.
+    def registra(self, etapa, url, erro, porto = None):
+        agora = time.time()
+        with self._lock:
+            linha = self._conexao.execute('SELECT tentativas, primeira FROM '
+                'falhas WHERE url = ?', (url,)).fetchone()
+            tentativas, primeira = linha if linha else (0, agora)
+            tentativas += 1
+            espera = 0 if tentativas == 1 else min(BACKOFF_FALHAS_MAXIMO,
+                BACKOFF_FALHAS_BASE * 2 ** (tentativas - 2))
+            self._conexao.execute('INSERT OR REPLACE INTO falhas VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?)', (url, etapa, porto, erro,
+                tentativas, primeira, agora, agora + espera))
+            self._urls.add(url)
+
+    # Retira da fila a página, obtida com sucesso.
+    def resolve(self, url):
+        if url not in self._urls:
+            return
+        with self._lock:
+            self._conexao.execute('DELETE FROM falhas WHERE url = ?', (url,))
+            self._urls.discard(url)
+
+    # Falhas com a próxima tentativa vencida, da mais antiga à mais nova.
+    def vencidas(self, agora = None):
+        with self._lock:
+            linhas = self._conexao.execute('SELECT url, etapa, porto, erro, '
+                'tentativas, proxima FROM falhas WHERE proxima <= ? AND '
+                'tentativas < ? ORDER BY proxima', (agora or time.time(),
+                TENTATIVAS_FALHA)).fetchall()
+        return [Falha(*linha) for linha in linhas]
+
+    # Número de páginas na fila por etapa.
+    def resumo(self):
+        with self._lock:
+            return dict(self._conexao.execute('SELECT etapa, COUNT(*) FROM '
+                'falhas GROUP BY etapa').fetchall())
+
+    def fecha(self):
+        with self._lock:
+            self._conexao.close()
+
+_falhas = None
+
+def ativa_falhas(caminho = ARQUIVO_FALHAS):
+    global _falhas
+    _falhas = FilaFalhas(caminho)
+    return _falhas
+
+def desativa_falhas():
+    global _falhas
+    if _falhas:
+        resumo = _falhas.resumo()
+        if resumo:
+            logger.warning('Páginas na fila de falhas: {}.'.format(resumo))
+        _falhas.fecha()
+    _falhas = None
+
+# Fila de falhas ativa e páginas vindas do site. No reprocessamento offline
+# do arquivo de páginas a fila não muda: uma página ausente do arquivo não é
+# falha do site, e uma versão arquivada não resolve uma falha atual.
+def _registra_falhas():
+    return _falhas is not None and not (_arquivo_html and _arquivo_html.offline)
+
+# Registra a falha ao obter a página, se a fila de falhas estiver ativa.
+def registra_falha(etapa, url, erro, porto = None):
+    if _registra_falhas():
+        _falhas.registra(etapa, url, erro, porto)
+
+def resolve_falha(url):
+    if _registra_falhas():
+        _falhas.resolve(url)
 
+'''
+    Mescla linhas recuperadas no arquivo de saída: linhas com as mesmas
+    chaves são substituídas e as novas entram no fim (ou na ordem das colunas
+    em ordem). As linhas recuperadas também vão para o histórico e para a
+    tabela do banco de saída.
+'''
+def mescla_no_arquivo(df, arquivo_csv, chaves, tabela = None, ordem = None):
+    # Passa as linhas pelo formato do CSV para juntá-las às do arquivo, lidas
+    # como texto.
+    texto = io.StringIO()
+    escreve_csv(df, texto)
+    texto.seek(0)
+    mescladas = pd.read_csv(texto, sep=';', dtype=str, keep_default_na=False)
 
-    df_portos_interesse = pd.read_csv(arquivo_portos_interesse, sep=';',
-        encoding='latin-1', comment='#')
-    df_portos = pd.read_csv(arquivo_portos_brasil, sep=';', encoding='latin-1')
-    nome_portos_interesse = df_portos_interesse.Nome.values
+    caminho_arquivo = Path(arquivo_csv)
+    if caminho_arquivo.exists():
+        mescladas = pd.concat([pd.read_csv(caminho_arquivo.as_posix(), sep=';',
+            dtype=str, keep_default_na=False), mescladas], ignore_index=True)
+    mescladas = mescladas.drop_duplicates(chaves, keep='last')
+    if ordem:
+        mescladas = mescladas.sort_values(ordem)
 
+    cria_pasta(caminho_arquivo)
+    escreve_csv(mescladas, caminho_arquivo.as_posix())
+    salva_acumulado(df, caminho_arquivo.as_posix())
+    salva_no_banco(tabela, df)
+    logger.info('{} linhas recuperadas mescladas em {}.'.format(len(df),
+        arquivo_csv))
 
-    for nome_porto in nome_portos_interesse:
-        porto = df_portos[df_portos.Nome==nome_porto.upper()]
+'''
+    Busca de novo as páginas da fila de falhas com a próxima tentativa
+    vencida e mescla as linhas obtidas nos arquivos de saída (ver
+    mescla_no_arquivo). Os navios encontrados nas listagens recuperadas que
+    ainda não estão em navios_interesse_csv também são buscados. Páginas que
+    falham de novo continuam na fila, com espera maior.
+'''
+@etapa_medida
+def reprocessa_falhas(proxy = None, portos_csv = ARQUIVO_PORTOS_BRASIL,
+    navios_em_portos_csv = ARQUIVO_NAVIOS_EM_PORTOS,
+    chegadas_esperadas_csv = ARQUIVO_CHEGADAS_ESPERADAS,
+    navios_interesse_csv = ARQUIVO_NAVIOS_INTERESSE,
+    concorrencia = CONCORRENCIA_NAVIOS, concorrencia_portos = CONCORRENCIA_PORTOS,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS):
+    if _falhas is None:
+        raise RuntimeError('O reprocessamento usa a fila de falhas: ative-a '
+            'com ativa_falhas().')
+    vencidas = _falhas.vencidas()
+    if not vencidas:
+        logger.info('Nenhuma página da fila de falhas a reprocessar.')
+        return
+    logger.info('Reprocessando {} páginas da fila de falhas.'.format(
+        len(vencidas)))
+
+    coleta = data_coleta()
+    por_etapa = {}
+    for falha in vencidas:
+        por_etapa.setdefault(falha.etapa, []).append(falha)
+
+    def recupera_listagem(falha):
+        args = () if falha.etapa == CLASSE_PORTOS else (falha.porto,)
+        linhas = []
+        for url_pagina, html, _ in percorre_paginas(falha.url, proxy,
+            falha.etapa, concorrencia_paginas, nome_porto = falha.porto):
+            linhas.extend(extrai_registros(falha.etapa, url_pagina, html, *args))
+        return linhas
+
+    listagens = [
+        (CLASSE_PORTOS, portos_csv, prepara_portos, ['Nome', 'Codigo'],
+            TABELA_PORTOS, ['Nome']),
+        (CLASSE_NAVIOS_PORTO, navios_em_portos_csv, prepara_navios_porto,
+            ['Porto', 'LinkNavio'], TABELA_NAVIOS_PORTO, None),
+        (CLASSE_CHEGADAS_ESPERADAS, chegadas_esperadas_csv,
+            prepara_chegadas_esperadas, ['Porto', 'LinkNavio'],
+            TABELA_CHEGADAS_ESPERADAS, None),
+    ]
+    urls_navios = [falha.url for falha in por_etapa.get(CLASSE_NAVIO, [])]
+    for etapa, arquivo_csv, prepara, chaves, tabela, ordem in listagens:
+        linhas = []
+        for recuperadas in executa_em_paralelo(recupera_listagem,
+            por_etapa.get(etapa, []), concorrencia_portos):
+            linhas.extend(recuperadas)
+        if not linhas:
+            continue
+        mescla_no_arquivo(prepara(linhas, coleta), arquivo_csv, chaves, tabela,
+            ordem)
+        if etapa != CLASSE_PORTOS:
+            urls_navios.extend(linha.LinkNavio for linha in linhas)
+
+    # Navios da fila e navios novos das listagens recuperadas.
+    conhecidos = navios_recentes(navios_interesse_csv, todos = True)
+    urls_navios = [url for url in remove_navios_repetidos(urls_navios)
+        if _falhas.contem(url) or identidade_navio(url) not in conhecidos]
+    navios, _ = busca_navios(urls_navios, proxy, concorrencia)
+    if navios:
+        mescla_no_arquivo(prepara_navios(navios, coleta), navios_interesse_csv,
+            ['LinkNavio'], TABELA_NAVIOS)
+
+    recuperadas = sum(not _falhas.contem(falha.url) for falha in vencidas)
+    logger.info('Reprocessamento: {} de {} páginas recuperadas; na fila: '
+        '{}.'.format(recuperadas, len(vencidas), _falhas.resumo()))
+
+# # Pipeline
 
-        # Verifica se os porto de interesse está no arquivo de portos.
-        # Caso não esteja, avisa o erro e pula para o próximo.
-        if len(porto) == 0:
-            logger.warn('PORTO DE INTERESSE "{}" CONFIGURADO NO ARQUVO "{}" '\
-            'NÃO CONSTA NO ARQUIVO "{}"!'.format(nome_porto,
-            path_arquivo_portos_interesse.absolute().as_posix(),
-            path_arquivo_portos_brasil.absolute().as_posix()))
+'''
+    Executa os crawlers de navios em portos, de chegadas esperadas e de navios
+    de interesse em pipeline.
+
+    Cada LinkNavio encontrado pelos crawlers de portos entra numa fila e é
+    buscado assim que descoberto, enquanto os portos ainda são percorridos.
+    Os arquivos gerados são os mesmos da execução em etapas: os navios são
+    gravados na ordem em que aparecem nos arquivos de navios em portos e de
+    chegadas esperadas.
+
+    limite - busca apenas os primeiros navios descobertos.
+    janela_frescor - ver crawl_navios_interesse.
+    retomar - ver ExecucaoIncremental. Só as etapas de portos são retomadas;
+        os navios de portos já concluídos são buscados ao fim das etapas.
+'''
+@etapa_medida
+def executa_pipeline(proxy = None, arquivo_portos_interesse = ARQUIVO_PORTOS_INTERESSE,
+    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL,
+    navios_em_portos_csv = ARQUIVO_NAVIOS_EM_PORTOS,
+    chegadas_esperadas_csv = ARQUIVO_CHEGADAS_ESPERADAS,
+    navios_interesse_csv = ARQUIVO_NAVIOS_INTERESSE,
+    concorrencia = CONCORRENCIA_NAVIOS, concorrencia_portos = CONCORRENCIA_PORTOS,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS, limite = None,
+    janela_frescor = None, retomar = True):
+
+    coleta = data_coleta()
+    recentes = navios_recentes(navios_interesse_csv, janela_frescor)
+    fila = queue.Queue()
+    fim = object()
+
+    def etapa(nome, crawler, arquivo_csv):
+        try:
+            crawler(arquivo_csv = arquivo_csv,
+                arquivo_portos_interesse = arquivo_portos_interesse,
+                arquivo_portos_brasil = arquivo_portos_brasil, proxy = proxy,
+                concorrencia_paginas = concorrencia_paginas,
+                concorrencia_portos = concorrencia_portos,
+                ao_encontrar_navio = fila.put, retomar = retomar)
+        except Exception:
+            logger.exception('Erro na etapa {} do pipeline.'.format(nome))
+        finally:
+            fila.put(fim)
+
+    etapas = [
+        threading.Thread(target=etapa, args=('navios_em_portos',
+            crawl_navios_em_portos, navios_em_portos_csv)),
+        threading.Thread(target=etapa, args=('chegadas_esperadas',
+            crawl_chegadas_esperadas, chegadas_esperadas_csv)),
+    ]
+    for thread in etapas:
+        thread.start()
+
+    # Urls na ordem em que são descobertas, até as duas etapas terminarem.
+    # Um navio já visto em outro porto ou etapa não é buscado de novo.
+    def urls_descobertas():
+        etapas_ativas = len(etapas)
+        vistos = set()
+        while etapas_ativas:
+            url = fila.get()
+            if url is fim:
+                etapas_ativas -= 1
+                continue
+            identidade = identidade_navio(url)
+            if identidade in vistos or (limite and len(vistos) >= limite):
+                continue
+            vistos.add(identidade)
+            logger.info('Pipeline: {} navios na fila.'.format(fila.qsize()))
+            registra_fila('pipeline', fila.qsize())
+            yield url
+
+    buscar = lambda url: (identidade_navio(url),
+        obtem_ou_reaproveita_navio(url, proxy, recentes))
+    resultados = {}
+    for identidade, resultado in executa_em_paralelo(buscar, urls_descobertas(),
+        concorrencia):
+        resultados[identidade] = resultado
+
+    for thread in etapas:
+        thread.join()
+
+    # Reordena os navios conforme os arquivos das etapas de portos.
+    ordem = []
+    for arquivo_csv in (navios_em_portos_csv, chegadas_esperadas_csv):
+        if Path(arquivo_csv).exists():
+            ordem.extend(pd.read_csv(arquivo_csv, sep=';',
+                usecols=['LinkNavio']).LinkNavio.dropna().values)
+    ordem = list(remove_navios_repetidos(ordem))
+
+    # Portos retomados de uma execução interrompida não passam pela fila.
+    faltantes = [] if limite else [url for url in ordem
+        if identidade_navio(url) not in resultados]
+    for identidade, resultado in executa_em_paralelo(buscar, faltantes,
+        concorrencia):
+        resultados[identidade] = resultado
+
+    navios = []
+    navios_erro = []
+    for url in ordem:
+        resultado = resultados.get(identidade_navio(url))
+        if resultado is None:
             continue
+        detalhes, erro = resultado
+        if erro:
+            navios_erro.append(erro)
+        else:
+            navios.append(detalhes)
 
+    logger.info('Total de navios sem erro / com erros: {} / {}'.format(len(navios),len(navios_erro)))
+    salva_navios(navios, navios_interesse_csv, coleta)
+    salva_delta('navio', navios_interesse_csv,
+        lambda navios: prepara_navios(navios, coleta))
+
+# # Fila distribuída
+#
+# Para dividir uma coleta entre várias máquinas, o coordenador publica uma
+# rodada numa fila compartilhada (um banco SQLite numa pasta comum): uma
+# tarefa de navios em porto e uma de chegadas esperadas para cada porto de
+# interesse. Cada instância do crawler em modo trabalhador reserva tarefas
+# da fila por um prazo (lease), renovado enquanto trabalha, e confirma cada
+# tarefa ao terminar. Os navios encontrados viram novas tarefas, uma por
+# navio (IMO ou MMSI). Uma tarefa de um trabalhador que parou volta para a
+# fila quando o prazo vence; depois de TENTATIVAS_TAREFA tentativas é dada
+# como falha. As linhas vão para o banco de saída comum (ver BancoSaida) com
+# a data de coleta da rodada, e consolida_rodada gera os arquivos CSV da
+# rodada a partir do banco.
+ARQUIVO_FILA = './output/fila.sqlite'
+
+TAREFA_NAVIOS_PORTO = 'navios_porto'
+TAREFA_CHEGADAS_ESPERADAS = 'chegadas_esperadas'
+TAREFA_NAVIO = 'navio'
+
+# Prazo (segundos) de uma reserva, renovado a cada terço do prazo enquanto o
+# trabalhador está ativo.
+DURACAO_RESERVA = 120.0
+TENTATIVAS_TAREFA = 5
+
+# Espera (segundos) entre consultas quando não há tarefa livre, mas ainda há
+# tarefas em andamento que podem publicar outras.
+ESPERA_FILA = 2.0
+
+Tarefa = namedtuple('Tarefa', ['id', 'rodada', 'tipo', 'chave', 'dados',
+    'tentativas'])
+
+class FilaTrabalho:
+
+    def __init__(self, caminho = ARQUIVO_FILA):
+        caminho = Path(caminho)
+        cria_pasta(caminho)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho.as_posix(), timeout=60,
+            check_same_thread=False, isolation_level=None)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS rodadas ('
+            'rodada TEXT PRIMARY KEY, coleta TEXT, criada REAL)')
+        self._conexao.execute('CREATE TABLE IF NOT EXISTS tarefas ('
+            'id INTEGER PRIMARY KEY, rodada TEXT, tipo TEXT, chave TEXT, '
+            'dados TEXT, estado TEXT, tentativas INTEGER DEFAULT 0, '
+            'dono TEXT, expira REAL, erro TEXT, UNIQUE (rodada, tipo, chave))')
+        self._conexao.execute('CREATE INDEX IF NOT EXISTS tarefas_estado '
+            'ON tarefas (rodada, estado, expira)')
+
+    # Executa funcao(conexao) numa transação que bloqueia outras escritas.
+    def _transacao(self, funcao):
+        with self._lock:
+            self._conexao.execute('BEGIN IMMEDIATE')
+            try:
+                resultado = funcao(self._conexao)
+            except Exception:
+                self._conexao.execute('ROLLBACK')
+                raise
+            self._conexao.execute('COMMIT')
+            return resultado
+
+    def cria_rodada(self, coleta):
+        rodada = coleta.strftime(FORMATO_DATA)
+        self._transacao(lambda c: c.execute('INSERT OR IGNORE INTO rodadas '
+            'VALUES (?, ?, ?)', (rodada, rodada, time.time())))
+        return rodada
+
+    def ultima_rodada(self):
+        with self._lock:
+            linha = self._conexao.execute('SELECT rodada FROM rodadas '
+                'ORDER BY criada DESC LIMIT 1').fetchone()
+        return linha[0] if linha else None
+
+    # Tarefas já publicadas na rodada (mesmo tipo e chave) são ignoradas.
+    def publica(self, rodada, tipo, itens):
+        linhas = [(rodada, tipo, chave, json.dumps(dados))
+            for chave, dados in itens]
+        self._transacao(lambda c: c.executemany('INSERT OR IGNORE INTO tarefas '
+            '(rodada, tipo, chave, dados, estado) VALUES (?, ?, ?, ?, '
+            '\'pendente\')', linhas))
+
+    '''
+        Reserva a próxima tarefa livre da rodada para o dono: uma pendente ou
+        uma em andamento com o prazo vencido. Retorna a Tarefa ou None.
+    '''
+    def reserva(self, rodada, dono, duracao = DURACAO_RESERVA):
+        def reserva_(conexao):
+            agora = time.time()
+            linha = conexao.execute('SELECT id, rodada, tipo, chave, dados, '
+                'tentativas FROM tarefas WHERE rodada = ? AND (estado = '
+                '\'pendente\' OR (estado = \'em_andamento\' AND expira < ?)) '
+                'ORDER BY id LIMIT 1', (rodada, agora)).fetchone()
+            if linha is None:
+                return None
+            conexao.execute('UPDATE tarefas SET estado = \'em_andamento\', '
+                'dono = ?, expira = ?, tentativas = tentativas + 1 WHERE id = ?',
+                (dono, agora + duracao, linha[0]))
+            return Tarefa(linha[0], linha[1], linha[2], linha[3],
+                json.loads(linha[4]), linha[5] + 1)
+        return self._transacao(reserva_)
+
+    # Renova o prazo de todas as tarefas em andamento do dono.
+    def renova(self, dono, duracao = DURACAO_RESERVA):
+        self._transacao(lambda c: c.execute('UPDATE tarefas SET expira = ? '
+            'WHERE dono = ? AND estado = \'em_andamento\'',
+            (time.time() + duracao, dono)))
+
+    # Confirma a tarefa, se ela ainda é do dono (o prazo pode ter vencido e
+    # outra instância tê-la reservado).
+    def confirma(self, tarefa, dono):
+        self._transacao(lambda c: c.execute('UPDATE tarefas SET estado = '
+            '\'concluida\', erro = NULL WHERE id = ? AND dono = ?',
+            (tarefa.id, dono)))
+
+    # Devolve a tarefa à fila ou, esgotadas as tentativas, a dá como falha.
+    def devolve(self, tarefa, dono, erro):
+        estado = 'falhou' if tarefa.tentativas >= TENTATIVAS_TAREFA else 'pendente'
+        self._transacao(lambda c: c.execute('UPDATE tarefas SET estado = ?, '
+            'erro = ?, dono = NULL, expira = NULL WHERE id = ? AND dono = ?',
+            (estado, str(erro), tarefa.id, dono)))
+
+    # {estado: quantidade} das tarefas da rodada.
+    def resumo(self, rodada):
+        with self._lock:
+            return dict(self._conexao.execute('SELECT estado, COUNT(*) FROM '
+                'tarefas WHERE rodada = ? GROUP BY estado', (rodada,)))
+
+    def falhas(self, rodada, tipo):
+        with self._lock:
+            return self._conexao.execute('SELECT chave, dados, erro FROM tarefas '
+                'WHERE rodada = ? AND tipo = ? AND estado = \'falhou\' '
+                'ORDER BY id', (rodada, tipo)).fetchall()
+
+    def fecha(self):
+        with self._lock:
+            self._conexao.close()
+
+# Identificação da instância nas reservas.
+def dono_instancia():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+'''
+    Publica uma rodada: uma tarefa de navios em porto e uma de chegadas
+    esperadas para cada porto de interesse. Retorna a rodada.
+'''
+def publica_rodada(fila, arquivo_portos_interesse = ARQUIVO_PORTOS_INTERESSE,
+    arquivo_portos_brasil = ARQUIVO_PORTOS_BRASIL):
+    portos = le_portos_interesse(arquivo_portos_interesse, arquivo_portos_brasil)
+    if portos is None:
+        return None
+
+    rodada = fila.cria_rodada(data_coleta())
+    itens = [(nome_porto, {'nome': nome_porto, 'porto': {chave: None
+        if pd.isna(valor) else str(valor) for chave, valor in porto.items()}})
+        for nome_porto, porto in portos]
+    for tipo in (TAREFA_NAVIOS_PORTO, TAREFA_CHEGADAS_ESPERADAS):
+        fila.publica(rodada, tipo, itens)
+    logger.info('Rodada {} publicada com {} portos.'.format(rodada, len(itens)))
+    return rodada
 
-        url_chegadas_esperadas =   porto.LinkChegadasEsperadas.values[0]
+'''
+    Executa uma tarefa da fila. As linhas vão para o banco de saída; os
+    navios encontrados nos portos são publicados como tarefas.
+'''
+def executa_tarefa(fila, tarefa, coleta, proxy = None,
+    concorrencia_paginas = CONCORRENCIA_PAGINAS):
+    publica_navio = lambda url: fila.publica(tarefa.rodada, TAREFA_NAVIO,
+        [(identidade_navio(url), {'url': url})])
+
+    if tarefa.tipo == TAREFA_NAVIO:
+        detalhes, erro = obtem_dados_navio(tarefa.dados['url'], proxy)
+        if erro:
+            raise requests.RequestException(erro[0])
+        salva_no_banco(TABELA_NAVIOS, prepara_navios([detalhes], coleta))
+        return
 
-        # Issue #20
-        url_chegadas_esperadas += '/per_page:50'
+    nome_porto = tarefa.dados['nome']
+    porto = pd.Series(tarefa.dados['porto'])
+    if tarefa.tipo == TAREFA_NAVIOS_PORTO:
+        linhas = crawl_navios_porto(nome_porto, porto, proxy,
+            concorrencia_paginas, publica_navio)
+        salva_no_banco(TABELA_NAVIOS_PORTO, prepara_navios_porto(linhas, coleta))
+    elif tarefa.tipo == TAREFA_CHEGADAS_ESPERADAS:
+        linhas = crawl_chegadas_esperadas_porto(nome_porto, porto, proxy,
+            concorrencia_paginas, publica_navio)
+        salva_no_banco(TABELA_CHEGADAS_ESPERADAS,
+            prepara_chegadas_esperadas(linhas, coleta))
+    else:
+        raise ValueError('Tipo de tarefa desconhecido: {}'.format(tarefa.tipo))
 
+'''
+    Trabalha na rodada (por padrão, a última publicada) até que todas as
+    tarefas estejam concluídas ou falhas, com até `concorrencia` tarefas
+    simultâneas. As linhas são gravadas no banco de saída, que precisa estar
+    ativo (ativa_banco) e ser comum às instâncias.
+'''
+def executa_trabalhador(fila, rodada = None, proxy = None,
+    concorrencia = CONCORRENCIA_NAVIOS, duracao_reserva = DURACAO_RESERVA):
+    if _banco is None:
+        raise RuntimeError('O modo trabalhador grava no banco de saída: '
+            'ative-o com ativa_banco().')
+    rodada = rodada or fila.ultima_rodada()
+    if rodada is None:
+        logger.warning('Nenhuma rodada publicada na fila.')
+        return
+    coleta = pd.Timestamp(datetime.strptime(rodada, FORMATO_DATA))
+    dono = dono_instancia()
+
+    # Mantém as reservas enquanto as tarefas são executadas.
+    parar = threading.Event()
+    def renova_reservas():
+        while not parar.wait(duracao_reserva / 3):
+            fila.renova(dono, duracao_reserva)
+    renovacao = threading.Thread(target=renova_reservas, daemon=True)
+    renovacao.start()
+
+    # executa_em_paralelo adianta itens além das tarefas em execução: uma
+    # tarefa só é reservada quando há um lugar livre, para que a instância
+    # não segure reservas que outras poderiam executar.
+    concorrencia = max(1, min(concorrencia or 1, limite_conexoes()))
+    livres = threading.BoundedSemaphore(concorrencia)
+
+    def tarefas():
         while True:
-            logger.info('Capturar chegadas esperadas no porto {}'.format(url_chegadas_esperadas))
-            html_navios_porto = obtem_pagina(url_chegadas_esperadas,proxy=proxy).text
-            soup = BeautifulSoup(html_navios_porto, 'lxml')
-            # Tag <table> dos navios.
-            table = soup.find('table', class_='table table-hover text-left')
-
-            # Percorrer todas as linhas da tabela.
-            # A primeira linha é o cabeçalho, então iremos pulá-la.
-            linhas = table.find_all('tr')
-
-            primeira_linha_dados = True
-            rowspan_porto_origem = False
-            rowspan_eta_calculado = False
-
-            for linha in linhas[1:]:
-
-                # Cada linha contém uma lista de células com os valores de interesse.
-                celulas = linha.find_all('td')
-
-                # Pular linha de propagada que contém apenas uma célula <td>.
-                if len(celulas) == 1: continue
-
-                # Issue #9.
-                # A primeira linha de dados tem a segunda célula com rowspan.
-                # As demais linhas não tem essa célula, então os ínidices das células
-                # precisam ser ajustados.
-                idx_porto_origem = 1
-                idx_nome_navio = 2
-                idx_eta_informado = 3
-                idx_eta_calculado = 4
-                idx_chegada_atual = 5
-                idx_posicao_navio = 6
-                if primeira_linha_dados:
-                    col = celulas[idx_porto_origem]
-                    if col.has_attr('rowspan'):
-                        rowspan_porto_origem = True
-                    col = celulas[4]
-                    if col.has_attr('rowspan'):
-                        rowspan_eta_calculado = True
-                    primeira_linha_dados = False
-                else:
-                    if rowspan_porto_origem:
-                        idx_porto_origem = None
-                        idx_nome_navio -= 1
-                        idx_eta_informado -= 1
-                        idx_eta_calculado -= 1
-                        idx_chegada_atual -= 1
-                        idx_posicao_navio -= 1
-                    if rowspan_eta_calculado:
-                        idx_eta_calculado = None
-                        idx_chegada_atual -= 1
-                        idx_posicao_navio -= 1
-
-
-                # Coluna nome do porto de origem.
-                nome_porto_origem = None
-                if idx_porto_origem:
-                    col = celulas[idx_porto_origem]
-                    nome_porto_origem = col.text.strip()
-
-                # Coluna nome  do navio.
-                col = celulas[idx_nome_navio]
-                nome_navio = col.a.text.strip()
-                link_navio = URL_BASE+col.a['href'].strip()
-                link_icone_tipo_navio = None
-                if col.img:
-                    link_icone_tipo_navio = URL_BASE+col.img['src']
-
-                    # Se não for do tipo tanker (vi8.png), pula para próximo navio.
-                    if link_icone_tipo_navio.find('vessel_types/vi8.png') == -1:
-                        continue
-                # Se não contiver imagem do tipo, pula para próximo navio.
-                else:
-                    continue
+            livres.acquire()
+            tarefa = fila.reserva(rodada, dono, duracao_reserva)
+            if tarefa is not None:
+                yield tarefa
+                continue
+            livres.release()
+            resumo = fila.resumo(rodada)
+            if not resumo.get('pendente') and not resumo.get('em_andamento'):
+                return
+            time.sleep(ESPERA_FILA)
+
+    def executa(tarefa):
+        logger.info('Tarefa {} {} (tentativa {}).'.format(tarefa.tipo,
+            tarefa.chave, tarefa.tentativas))
+        try:
+            executa_tarefa(fila, tarefa, coleta, proxy)
+        except Exception as e:
+            logger.exception('Erro na tarefa {} {}.'.format(tarefa.tipo,
+                tarefa.chave))
+            fila.devolve(tarefa, dono, e)
+            return False
+        else:
+            fila.confirma(tarefa, dono)
+            return True
+        finally:
+            livres.release()
+
+    try:
+        executadas = sum(executa_em_paralelo(executa, tarefas(), concorrencia))
+    finally:
+        parar.set()
+        renovacao.join()
+    logger.info('Rodada {}: {} tarefas executadas por {}. Situação da fila: '
+        '{}.'.format(rodada, executadas, dono, fila.resumo(rodada)))
 
-                # Coluna ETA Informado.
-                eta_informado = None
-                col = celulas[idx_eta_informado]
-                if col.span:
-                    if col.span.has_attr('data-time'):
-                        valor_data = col.span['data-time']
-                        if valor_data:
-                            eta_informado = converte_data(int(valor_data))
-
-                # Coluna ETA Calculado.
-                eta_calculado = None
-                if idx_eta_calculado:
-                    col = celulas[idx_eta_calculado]
-                    if col.span:
-                        if col.span.has_attr('data-time'):
-                            valor_data = col.span['data-time']
-                            if valor_data:
-                                eta_calculado = converte_data(int(valor_data))
-
-                # Coluna Chegada Atual.
-                data_chegada = None
-                col = celulas[idx_chegada_atual]
-                if col.span:
-                    if col.span.has_attr('data-time'):
-                        valor_data = col.span['data-time']
-                        if valor_data:
-                            data_chegada = converte_data(int(valor_data))
-
-                # Link posição do navio
-                link_posicao_navio = None
-                col = celulas[idx_posicao_navio]
-                if col.a:
-                    link_posicao_navio = URL_BASE+col.a['href']
-
-
-                # Armazena os dados de cada navio na tabela de navios.
-                dados = [nome_porto, nome_porto_origem,nome_navio,
-                    eta_informado, eta_calculado, data_chegada, link_navio,
-                    link_icone_tipo_navio, link_posicao_navio, data_coleta()]
-                tabela_chegadas_esperadas.append(dados)
-
-            # Não há próxima página?
-            next_disabled = soup.find('span', class_='next disabled')
-            if next_disabled:
-                logger.info('Fim da captura de chegadas esperadas para o ' \
-                    'porto {}.'.format(nome_porto))
-                break
-            elif soup.find('span', class_='next'):
-                next_page = soup.find('span', class_='next')
-                url_chegadas_esperadas = URL_BASE + next_page.a['href']
-            else:
-                logger.info('Fim da captura de chegadas esperadas para o ' \
-                    'porto {}.'.format(nome_porto))
-                break
+'''
+    Grava os arquivos de saída da rodada (navios em portos, chegadas
+    esperadas e navios de interesse) a partir do banco de saída, com as
+    linhas da data de coleta da rodada. As tarefas de navio que esgotaram as
+    tentativas são registradas na fila de falhas, se ativa.
+'''
+def consolida_rodada(fila, rodada = None,
+    navios_em_portos_csv = ARQUIVO_NAVIOS_EM_PORTOS,
+    chegadas_esperadas_csv = ARQUIVO_CHEGADAS_ESPERADAS,
+    navios_interesse_csv = ARQUIVO_NAVIOS_INTERESSE):
+    rodada = rodada or fila.ultima_rodada()
+    resumo = fila.resumo(rodada)
+    if resumo.get('pendente') or resumo.get('em_andamento'):
+        logger.warning('Rodada {} ainda em andamento: {}.'.format(rodada, resumo))
+
+    for tabela, arquivo_csv in ((TABELA_NAVIOS_PORTO, navios_em_portos_csv),
+        (TABELA_CHEGADAS_ESPERADAS, chegadas_esperadas_csv),
+        (TABELA_NAVIOS, navios_interesse_csv)):
+        df = _banco.le(tabela, rodada)
+        caminho_arquivo = Path(arquivo_csv)
+        cria_pasta(caminho_arquivo)
+        salva_dataframe_csv(df, caminho_arquivo.as_posix())
+
+    # Com impressões comuns às instâncias, o delta junta o de todas elas.
+    coleta = pd.Timestamp(datetime.strptime(rodada, FORMATO_DATA))
+    salva_delta('navios_porto', navios_em_portos_csv,
+        lambda linhas: prepara_navios_porto(linhas, coleta))
+    salva_delta('chegadas_esperadas', chegadas_esperadas_csv,
+        lambda linhas: prepara_chegadas_esperadas(linhas, coleta))
+    salva_delta('navio', navios_interesse_csv,
+        lambda navios: prepara_navios(navios, coleta))
+
+    # Navios que esgotaram as tentativas da rodada vão para a fila de falhas,
+    # se ainda não estiverem nela.
+    if _falhas:
+        for _, dados, erro in fila.falhas(rodada, TAREFA_NAVIO):
+            url = json.loads(dados)['url']
+            if not _falhas.contem(url):
+                _falhas.registra(CLASSE_NAVIO, url, erro)
+    logger.info('Rodada {} consolidada: {}.'.format(rodada, resumo))
+
+# # Modo contínuo
+#
+# Em vez de rodar as etapas uma vez e sair, o crawler fica em execução e roda
+# cada etapa no seu intervalo: a lista de portos muda pouco, os navios em
+# portos mudam a cada hora e as chegadas esperadas a cada poucos minutos.
+# Quando mais de uma etapa está na hora, elas rodam na ordem de sempre
+# (portos, navios em portos, chegadas esperadas, navios), uma de cada vez.
+# Com a fila de falhas ativa, as páginas que falharam são reprocessadas no
+# seu próprio intervalo (ver reprocessa_falhas).
+#
+# Quem decide quando cada página é buscada de novo são os intervalos: com o
+# cache ativo, as páginas nunca são servidas dele sem consultar o site, só
+# revalidadas (HTTP 304) quando o site informa ETag / Last-Modified.
+
+# Intervalos padrão (minutos) de cada etapa no modo contínuo.
+INTERVALOS_ETAPAS = {
+    'portos': 24 * 60,
+    'navios_porto': 60,
+    'chegadas_esperadas': 15,
+    'navios': 15,
+    'falhas': 10,
+}
 
-    cabecalho = ['Porto', 'PortoOrigem','Navio','ETAInformado','ETACalculado', 'DataChegada',
-        'LinkNavio','LinkIconeTipoNavio', 'LinkPosicaoNavio', 'DataColeta']
-    df = pd.DataFrame(tabela_chegadas_esperadas, columns=cabecalho)
+'''
+    Executa etapas periodicamente, cada uma no seu intervalo.
+
+    As etapas ficam numa fila ordenada pelo instante da próxima execução e,
+    no mesmo instante, pela ordem em que foram adicionadas. Uma etapa que
+    atrasou (a anterior demorou) roda assim que possível, sem repetir as
+    execuções perdidas. Erros de uma etapa são registrados no log e não
+    interrompem as demais. parar (threading.Event) encerra o agendador ao fim
+    da etapa em andamento.
+'''
+class Agendador:
+
+    def __init__(self):
+        self.parar = threading.Event()
+        self._etapas = []
+
+    # intervalo em segundos.
+    def adiciona(self, nome, intervalo, funcao):
+        self._etapas.append((nome, intervalo, funcao))
+
+    def executa(self, execucoes = None):
+        agora = time.monotonic()
+        fila = [(agora, ordem, nome, intervalo, funcao)
+            for ordem, (nome, intervalo, funcao) in enumerate(self._etapas)]
+        heapq.heapify(fila)
+
+        executadas = 0
+        while fila and not self.parar.is_set():
+            previsto, ordem, nome, intervalo, funcao = heapq.heappop(fila)
+            espera = previsto - time.monotonic()
+            if espera > 0:
+                logger.info('Próxima etapa: {} em {:.0f} segundos.'.format(nome,
+                    espera))
+                if self.parar.wait(espera):
+                    break
 
-    # Pegar latitude e longitude a partir do link da posição.
-    df_latlong = df.LinkPosicaoNavio.str.extract('centerx:(?P<Longitude>-?\d{,3}\.?\d*)/centery:(?P<Latitude>-?\d{,3}\.?\d*)', expand=True)
+            logger.info('Modo contínuo: executando a etapa {}.'.format(nome))
+            try:
+                funcao()
+            except Exception:
+                logger.exception('Erro na etapa {} do modo contínuo.'.format(nome))
 
-    # Issue #5
-    df_latlong['Latitude'] = df_latlong.Latitude.str.replace('.', ',')
-    df_latlong['Longitude'] = df_latlong.Longitude.str.replace('.', ',')
-    df = df.join(df_latlong)
+            proxima = max(previsto + intervalo, time.monotonic())
+            heapq.heappush(fila, (proxima, ordem, nome, intervalo, funcao))
+            executadas += 1
+            if execucoes and executadas >= execucoes:
+                break
 
-    caminho_arquivo = Path(arquivo_csv)
-    cria_pasta(caminho_arquivo)
-    salva_dataframe_csv(df, caminho_arquivo.as_posix())
+'''
+    Roda as etapas no modo contínuo até receber SIGTERM ou Ctrl+C.
+
+    intervalos - {etapa: minutos}, sobre INTERVALOS_ETAPAS.
+    janela_frescor - ver crawl_navios_interesse.
+    maximo_buscas - navios buscados no site a cada execução da etapa de
+        navios. Os navios são buscados do que chega antes ao que chega depois
+        (ver ordena_navios_por_eta); os demais mantêm a linha anterior.
+    execucoes - encerra depois desse número de execuções de etapas.
+'''
+def executa_continuo(proxy = None, intervalos = None, janela_frescor = None,
+    maximo_buscas = None, execucoes = None):
+    minutos = dict(INTERVALOS_ETAPAS, **(intervalos or {}))
+    agendador = Agendador()
+    agendador.adiciona('portos', minutos['portos'] * 60,
+        lambda: crawl_portos_brasil(proxy = proxy))
+    agendador.adiciona('navios_porto', minutos['navios_porto'] * 60,
+        lambda: crawl_navios_em_portos(proxy = proxy))
+    agendador.adiciona('chegadas_esperadas', minutos['chegadas_esperadas'] * 60,
+        lambda: crawl_chegadas_esperadas(proxy = proxy))
+    agendador.adiciona('navios', minutos['navios'] * 60,
+        lambda: crawl_navios_interesse(proxy = proxy,
+            janela_frescor = janela_frescor, prioridade_eta = True,
+            maximo_buscas = maximo_buscas))
+    if _falhas:
+        agendador.adiciona('falhas', minutos['falhas'] * 60,
+            lambda: reprocessa_falhas(proxy = proxy))
+
+    cache = _cache
+    if cache:
+        ttl = cache.ttl
+        cache.ttl = {classe: 0 for classe in ttl}
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *args: agendador.parar.set())
+    try:
+        agendador.executa(execucoes)
+    except KeyboardInterrupt:
+        logger.info('Modo contínuo interrompido.')
+    finally:
+        if cache:
+            cache.ttl = ttl
+    return agendador
 
 
 def __configurar_log():
@@ -631,20 +4404,171 @@ def __configurar_log():
     logger.setLevel(logging.INFO)
 
 
+def __argumentos():
+    parser = argparse.ArgumentParser(description='Crawler do site Marine Traffic.')
+    parser.add_argument('--sem-proxy', action='store_true',
+        help='não usa o proxy local {}'.format(PROXY_PADRAO))
+    parser.add_argument('--pipeline', action='store_true',
+        help='busca os navios de interesse enquanto os portos são percorridos')
+    parser.add_argument('--backend-extracao', choices=sorted(EXTRATORES),
+        default=BACKEND_EXTRACAO, help='backend de extração do HTML')
+    parser.add_argument('--processos-extracao', type=int, metavar='N',
+        help='extrai os dados das páginas em N processos separados')
+    parser.add_argument('--frescor-navios', type=float, metavar='HORAS',
+        help='não busca de novo navios coletados há menos de HORAS horas')
+    parser.add_argument('--formato-acumulado', choices=FORMATOS_ACUMULADO,
+        default=FORMATO_ACUMULADO,
+        help='formato do histórico acumulado de cada arquivo')
+    parser.add_argument('--cache', nargs='?', const=ARQUIVO_CACHE,
+        metavar='ARQUIVO', help='guarda as páginas baixadas no cache SQLite '
+        'ARQUIVO (padrão {}) e as reutiliza enquanto válidas'.format(ARQUIVO_CACHE))
+    parser.add_argument('--banco', nargs='?', const=ARQUIVO_BANCO,
+        metavar='ARQUIVO', help='grava também as linhas de todas as etapas '
+        'no banco SQLite ARQUIVO (padrão {})'.format(ARQUIVO_BANCO))
+    parser.add_argument('--taxa-requisicoes', type=float, metavar='N',
+        default=TAXA_REQUISICOES,
+        help='máximo de requisições por segundo ao site')
+    parser.add_argument('--proxies', nargs='+', metavar='URL',
+        help='distribui as requisições entre estes proxies, no lugar do '
+        'proxy local')
+    parser.add_argument('--concorrencia-por-proxy', type=int, metavar='N',
+        default=CONCORRENCIA_POR_PROXY,
+        help='máximo de requisições simultâneas por proxy do pool')
+    parser.add_argument('--arquivo-html', nargs='?', const=PASTA_ARQUIVO_HTML,
+        metavar='PASTA', help='arquiva as páginas baixadas na PASTA '
+        '(padrão {})'.format(PASTA_ARQUIVO_HTML))
+    parser.add_argument('--reprocessar-arquivo', action='store_true',
+        help='refaz a extração sobre as páginas arquivadas, sem acessar o site')
+    parser.add_argument('--ate', metavar='"AAAA-MM-DD HH:MM"',
+        type=lambda valor: datetime.strptime(valor, FORMATO_DATA),
+        help='com --reprocessar-arquivo, usa as páginas obtidas até essa data (UTC)')
+    parser.add_argument('--impressoes', nargs='?', const=ARQUIVO_IMPRESSOES,
+        metavar='ARQUIVO', help='não extrai de novo as páginas que não mudaram '
+        'desde a última coleta e grava as linhas novas ou alteradas em '
+        '<arquivo>_delta.csv (impressões no ARQUIVO, padrão {})'.format(
+        ARQUIVO_IMPRESSOES))
+    parser.add_argument('--falhas', metavar='ARQUIVO', default=ARQUIVO_FALHAS,
+        help='fila das páginas que não puderam ser obtidas (padrão '
+        '{})'.format(ARQUIVO_FALHAS))
+    parser.add_argument('--reprocessar-falhas', action='store_true',
+        help='busca de novo só as páginas da fila de falhas e mescla as '
+        'linhas obtidas nos arquivos de saída')
+    parser.add_argument('--metricas', metavar='ARQUIVO',
+        help='grava as métricas da execução em JSON no ARQUIVO')
+    parser.add_argument('--metricas-prometheus', metavar='ARQUIVO',
+        help='grava as métricas no formato texto do Prometheus no ARQUIVO, '
+        'atualizado ao fim de cada etapa')
+    parser.add_argument('--perfil', metavar='PASTA',
+        help='grava o perfil (cProfile) de cada etapa em PASTA/<etapa>.prof')
+    parser.add_argument('--continuo', action='store_true',
+        help='fica em execução, rodando cada etapa no seu intervalo')
+    for etapa, opcao in (('portos', 'portos'), ('navios_porto', 'navios-porto'),
+        ('chegadas_esperadas', 'chegadas'), ('navios', 'navios'),
+        ('falhas', 'falhas')):
+        parser.add_argument('--intervalo-' + opcao, type=float, metavar='MIN',
+            dest='intervalo_' + etapa, default=INTERVALOS_ETAPAS[etapa],
+            help='com --continuo, intervalo da etapa {} em minutos (padrão '
+            '{})'.format(etapa, INTERVALOS_ETAPAS[etapa]))
+    parser.add_argument('--navios-por-ciclo', type=int, metavar='N',
+        help='com --continuo, busca no máximo N navios por execução da etapa '
+        'de navios, dos que chegam antes aos que chegam depois')
+    parser.add_argument('--fila', metavar='ARQUIVO', default=ARQUIVO_FILA,
+        help='fila de tarefas compartilhada entre as instâncias (padrão '
+        '{})'.format(ARQUIVO_FILA))
+    parser.add_argument('--publicar', action='store_true',
+        help='captura os portos e publica na fila uma rodada com os portos '
+        'de interesse')
+    parser.add_argument('--trabalhador', action='store_true',
+        help='executa tarefas da última rodada da fila até ela terminar, '
+        'gravando no banco de saída')
+    parser.add_argument('--consolidar', action='store_true',
+        help='grava os arquivos de saída da última rodada a partir do banco')
+    parser.add_argument('--recomecar', action='store_true',
+        help='descarta o progresso de uma execução interrompida')
+    args, legado = parser.parse_known_args()
+
+    # Até então qualquer argumento na linha de comando desligava o proxy.
+    if legado:
+        args.sem_proxy = True
+    return args
+
+
 if __name__ =='__main__':
+    args = __argumentos()
     __configurar_log()
+    if args.cache:
+        ativa_cache(args.cache)
+    ativa_falhas(args.falhas)
+    if args.metricas or args.metricas_prometheus:
+        ativa_metricas(args.metricas, args.metricas_prometheus)
+    if args.perfil:
+        ativa_perfil(args.perfil)
+    BACKEND_EXTRACAO = args.backend_extracao
+    ativa_formato_acumulado(args.formato_acumulado)
+    configura_limite_requisicoes(args.taxa_requisicoes,
+        max(1, int(2 * args.taxa_requisicoes)))
+    if args.banco or args.trabalhador or args.consolidar:
+        ativa_banco(args.banco or ARQUIVO_BANCO)
+    if args.processos_extracao:
+        ativa_processos_extracao(args.processos_extracao)
+    if args.arquivo_html or args.reprocessar_arquivo:
+        ativa_arquivo_html(args.arquivo_html or PASTA_ARQUIVO_HTML,
+            offline = args.reprocessar_arquivo, ate = args.ate)
+    if args.impressoes:
+        ativa_impressoes(args.impressoes)
 
     proxies = None
 
+    # Com --proxies, as requisições são distribuídas pelo pool.
+    if args.proxies:
+        ativa_pool_proxies(args.proxies, args.concorrencia_por_proxy)
+
     # Se não tiver qualquer argumento, usa o proxy ptbrs.
-    if len(sys.argv) == 1:
+    elif not args.sem_proxy:
 
         proxies = {
-                'http': 'http://127.0.0.1:53128',
-                'https': 'http://127.0.0.1:53128',
+                'http': PROXY_PADRAO,
+                'https': PROXY_PADRAO,
             }
 
-    crawl_portos_brasil(proxy = proxies)
-    crawl_navios_em_portos(proxy = proxies)
-    crawl_chegadas_esperadas(proxy = proxies)
-    crawl_navios_interesse(proxy = proxies)
+    janela_frescor = None
+    if args.frescor_navios:
+        janela_frescor = timedelta(hours=args.frescor_navios)
+
+    retomar = not args.recomecar
+
+    try:
+        if args.continuo:
+            executa_continuo(proxies, {etapa: getattr(args, 'intervalo_' + etapa)
+                for etapa in INTERVALOS_ETAPAS}, janela_frescor,
+                args.navios_por_ciclo)
+        elif args.reprocessar_falhas:
+            reprocessa_falhas(proxy = proxies)
+        elif args.publicar or args.trabalhador or args.consolidar:
+            fila = FilaTrabalho(args.fila)
+            if args.publicar:
+                crawl_portos_brasil(proxy = proxies, retomar = retomar)
+                publica_rodada(fila)
+            if args.trabalhador:
+                executa_trabalhador(fila, proxy = proxies)
+            if args.consolidar:
+                consolida_rodada(fila)
+            fila.fecha()
+        elif args.pipeline:
+            crawl_portos_brasil(proxy = proxies, retomar = retomar)
+            executa_pipeline(proxy = proxies, janela_frescor = janela_frescor,
+                retomar = retomar)
+        else:
+            crawl_portos_brasil(proxy = proxies, retomar = retomar)
+            crawl_navios_em_portos(proxy = proxies, retomar = retomar)
+            crawl_chegadas_esperadas(proxy = proxies, retomar = retomar)
+            crawl_navios_interesse(proxy = proxies, janela_frescor = janela_frescor,
+                retomar = retomar)
+    finally:
+        desativa_processos_extracao()
+        desativa_banco()
+        desativa_pool_proxies()
+        desativa_arquivo_html()
+        desativa_impressoes()
+        desativa_falhas()
+        desativa_metricas()
@@ -0,0 +1,31 @@
+# coding: utf-8
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmark'))
+
+import marine_traffic_crawler as crawler
+from servidor import ConfiguracaoServidor, inicia_servidor
+
+
+'''
+    Crawler apontado para o servidor local do benchmark, rodando numa pasta
+    temporária. Devolve a configuração do servidor (contagem de páginas,
+    taxa de erro, fixtures).
+'''
+@pytest.fixture
+def servidor_local(tmp_path, monkeypatch):
+    configuracao = ConfiguracaoServidor(paginas={'portos': 15})
+    servidor = inicia_servidor(configuracao)
+    monkeypatch.setattr(crawler, 'URL_BASE', servidor.url_base)
+    monkeypatch.setattr(crawler, 'URL_BASE_HTTPS', servidor.url_base)
+    crawler.configura_limite_requisicoes(1000, 100)
+    monkeypatch.chdir(tmp_path)
+    yield configuracao
+    servidor.shutdown()
+    servidor.server_close()
@@ -0,0 +1,39 @@
+# coding: utf-8
+
+import sqlite3
+
+import pandas as pd
+
+import marine_traffic_crawler as crawler
+
+
+# Reprocessar o arquivo sem --ate grava como DataColeta a data das páginas
+# arquivadas, não a hora do reprocessamento.
+def test_reprocessamento_usa_data_do_arquivo(servidor_local, tmp_path):
+    pasta = (tmp_path / 'arquivo_html').as_posix()
+    crawler.ativa_arquivo_html(pasta)
+    try:
+        crawler.crawl_portos_brasil(limite=60, concorrencia_paginas=1,
+            retomar=False)
+    finally:
+        crawler.desativa_arquivo_html()
+
+    # Páginas obtidas há três dias.
+    with sqlite3.connect(pasta + '/indice.sqlite') as conexao:
+        conexao.execute('UPDATE paginas SET obtido = obtido - 3 * 86400')
+        obtido = conexao.execute('SELECT MAX(obtido) FROM paginas '
+            'WHERE classe = ?', (crawler.CLASSE_PORTOS,)).fetchone()[0]
+    conexao.close()
+
+    contagem = dict(servidor_local.contagem)
+    crawler.ativa_arquivo_html(pasta, offline=True)
+    try:
+        crawler.crawl_portos_brasil(limite=60, concorrencia_paginas=1,
+            retomar=False)
+    finally:
+        crawler.desativa_arquivo_html()
+    assert dict(servidor_local.contagem) == contagem
+
+    portos = pd.read_csv(crawler.ARQUIVO_PORTOS_BRASIL, sep=';', dtype=str)
+    esperada = pd.Timestamp(obtido, unit='s').floor('min')
+    assert set(portos['DataColeta']) == {esperada.strftime(crawler.FORMATO_DATA)}
@@ -0,0 +1,21 @@
+# coding: utf-8
+
+import marine_traffic_crawler as crawler
+
+
+URL_PORTOS = '/en/ais/index/ports/all/flag:BR/per_page:50'
+URL_NAVIO = '/en/ais/details/ships/shipid:1/mmsi:1/imo:1/vessel:TESTE'
+
+
+def test_cache_reaproveita_portos_mas_nao_navios(servidor_local, tmp_path):
+    crawler.ativa_cache(str(tmp_path / 'cache.sqlite'))
+    try:
+        for _ in range(2):
+            crawler.obtem_pagina(crawler.URL_BASE + URL_PORTOS,
+                classe=crawler.CLASSE_PORTOS)
+            crawler.obtem_pagina(crawler.URL_BASE + URL_NAVIO,
+                classe=crawler.CLASSE_NAVIO)
+    finally:
+        crawler.desativa_cache()
+
+    assert servidor_local.contagem == {'portos': 1, 'navio': 2}
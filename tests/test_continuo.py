@@ -0,0 +1,32 @@
+# coding: utf-8
+
+import pandas as pd
+
+import marine_traffic_crawler as crawler
+
+
+def escreve_portos_interesse(quantidade):
+    portos = pd.read_csv(crawler.ARQUIVO_PORTOS_BRASIL, sep=';', dtype=str)
+    crawler.cria_pasta(crawler.Path(crawler.ARQUIVO_PORTOS_INTERESSE))
+    portos[['Nome']].head(quantidade).to_csv(crawler.ARQUIVO_PORTOS_INTERESSE,
+        index=False)
+
+
+# Com o cache ativo, cada execução agendada de uma etapa busca as páginas de
+# novo no site, mesmo dentro do TTL do cache.
+def test_modo_continuo_nao_serve_paginas_do_cache(servidor_local, tmp_path):
+    crawler.crawl_portos_brasil(retomar=False)
+    escreve_portos_interesse(2)
+    servidor_local.zera_contagem()
+
+    cache = crawler.ativa_cache(str(tmp_path / 'cache.sqlite'))
+    try:
+        intervalos = {etapa: 0.0001 for etapa in crawler.INTERVALOS_ETAPAS}
+        crawler.executa_continuo(intervalos=intervalos, execucoes=8)
+        assert cache.ttl == crawler.TTL_CACHE
+    finally:
+        crawler.desativa_cache()
+
+    assert servidor_local.contagem['portos'] == 2 * 15
+    assert servidor_local.contagem['navios_porto'] == 2 * 2 * 2
+    assert servidor_local.contagem['chegadas_esperadas'] == 2 * 2 * 2
@@ -0,0 +1,34 @@
+# coding: utf-8
+
+import pandas as pd
+import pytest
+
+import marine_traffic_crawler as crawler
+
+
+# Uma captura interrompida e retomada minutos depois grava uma única data de
+# coleta: a da primeira execução, guardada no checkpoint.
+def test_retomada_mantem_data_de_coleta(servidor_local, monkeypatch):
+    extrai_portos = crawler.extrai_portos
+    paginas = []
+
+    def interrompe(html, url = None):
+        paginas.append(url)
+        if len(paginas) > 12:
+            raise KeyboardInterrupt
+        return extrai_portos(html, url = url)
+
+    monkeypatch.setattr(crawler, 'data_coleta',
+        lambda classe = None: pd.Timestamp('2026-01-01 10:00'))
+    monkeypatch.setattr(crawler, 'extrai_portos', interrompe)
+    with pytest.raises(KeyboardInterrupt):
+        crawler.crawl_portos_brasil(concorrencia_paginas=1, retomar=False)
+
+    monkeypatch.setattr(crawler, 'data_coleta',
+        lambda classe = None: pd.Timestamp('2026-01-01 10:05'))
+    monkeypatch.setattr(crawler, 'extrai_portos', extrai_portos)
+    crawler.crawl_portos_brasil(concorrencia_paginas=1)
+
+    portos = pd.read_csv(crawler.ARQUIVO_PORTOS_BRASIL, sep=';', dtype=str)
+    assert len(portos) == 15 * 20
+    assert set(portos['DataColeta']) == {'2026-01-01 10:00'}
@@ -0,0 +1,35 @@
+# coding: utf-8
+
+import re
+
+import pytest
+
+import marine_traffic_crawler as crawler
+from benchmark import PAGINAS_EXTRACAO
+from servidor import ConfiguracaoServidor, monta_pagina
+
+
+def _argumentos(caminho, funcao, argumento):
+    _, html = monta_pagina(ConfiguracaoServidor(), caminho)
+    if argumento is None and funcao == 'navio':
+        argumento = crawler.URL_BASE + caminho
+    return (html,) if argumento is None else (html, argumento)
+
+# Os dois backends de extração devolvem as mesmas linhas.
+@pytest.mark.parametrize('nome, caminho, funcao, argumento', PAGINAS_EXTRACAO,
+    ids=[pagina[0] for pagina in PAGINAS_EXTRACAO])
+def test_lxml_igual_bs4(nome, caminho, funcao, argumento):
+    args = _argumentos(caminho, funcao, argumento)
+    linhas = crawler.extrator(funcao, 'bs4')(*args)
+    assert linhas
+    assert crawler.extrator(funcao, 'lxml')(*args) == linhas
+
+# Linha de porto sem o link de partidas: nenhum dos backends a aceita.
+def test_porto_sem_link_de_partidas():
+    html, = _argumentos('/en/ais/index/ports/all/flag:BR/per_page:50',
+        'portos', None)
+    html = re.sub(r'<td><a href="[^"]*move_type:1">Departures</a></td>',
+        '<td>Departures</td>', html, count=1)
+    for backend in ('bs4', 'lxml'):
+        with pytest.raises((TypeError, AttributeError)):
+            crawler.extrator('portos', backend)(html)
@@ -0,0 +1,43 @@
+# coding: utf-8
+
+import sqlite3
+
+import marine_traffic_crawler as crawler
+
+
+URL_PORTOS = '/en/ais/index/ports/all/flag:BR/per_page:50'
+
+
+def _fila(caminho):
+    with sqlite3.connect(caminho) as conexao:
+        linhas = conexao.execute('SELECT url, etapa, tentativas FROM falhas '
+            'ORDER BY url').fetchall()
+    conexao.close()
+    return linhas
+
+# O reprocessamento offline não resolve falhas com páginas arquivadas nem
+# registra como falha as páginas que não estão no arquivo.
+def test_reprocessamento_offline_nao_altera_fila(servidor_local, tmp_path):
+    pasta = (tmp_path / 'arquivo_html').as_posix()
+    caminho_falhas = (tmp_path / 'falhas.sqlite').as_posix()
+    crawler.ativa_arquivo_html(pasta)
+    try:
+        crawler.crawl_portos_brasil(limite=60, concorrencia_paginas=1,
+            retomar=False)
+    finally:
+        crawler.desativa_arquivo_html()
+
+    fila = crawler.ativa_falhas(caminho_falhas)
+    fila.registra(crawler.CLASSE_PORTOS, crawler.URL_BASE_HTTPS + URL_PORTOS,
+        'HTTP 503')
+    antes = _fila(caminho_falhas)
+
+    crawler.ativa_arquivo_html(pasta, offline=True)
+    try:
+        crawler.crawl_portos_brasil(concorrencia_paginas=1, retomar=False)
+    finally:
+        crawler.desativa_arquivo_html()
+        crawler.desativa_falhas()
+
+    assert len(antes) == 1
+    assert _fila(caminho_falhas) == antes
@@ -0,0 +1,106 @@
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import marine_traffic_crawler as crawler
+
+
+# Portos espalhados pela costa e pelo interior, com vírgula decimal como no
+# arquivo gravado pelo crawler, e um porto sem coordenadas.
+@pytest.fixture
+def arquivo_portos(tmp_path):
+    aleatorio = np.random.default_rng(25)
+    n = 400
+    latitude = aleatorio.uniform(-34, 5, n)
+    longitude = aleatorio.uniform(-74, -28, n)
+    df = pd.DataFrame({
+        'Nome': ['PORTO {}'.format(i) for i in range(n)],
+        'Codigo': ['BR{:03d}'.format(i) for i in range(n)],
+        'Id': range(1000, 1000 + n),
+        'Latitude': ['{:.5f}'.format(v).replace('.', ',') for v in latitude],
+        'Longitude': ['{:.5f}'.format(v).replace('.', ',') for v in longitude],
+    })
+    df.loc[7, ['Latitude', 'Longitude']] = ''
+    caminho = tmp_path / 'portos.csv'
+    df.to_csv(caminho, sep=';', index=False, encoding='latin-1')
+    return caminho.as_posix()
+
+def _posicoes():
+    aleatorio = np.random.default_rng(3)
+    latitude = aleatorio.uniform(-40, 10, 3000)
+    longitude = aleatorio.uniform(-80, -20, 3000)
+    latitude[[0, 10]] = np.nan
+    longitude[[5, 10]] = np.nan
+    return pd.Series(latitude), pd.Series(longitude)
+
+# Distâncias (km) de cada posição a cada porto, por haversine.
+def _haversine(latitude, longitude, latitude_portos, longitude_portos):
+    lat1 = np.radians(np.asarray(latitude, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(longitude, dtype=float))[:, None]
+    lat2 = np.radians(latitude_portos)[None, :]
+    lon2 = np.radians(longitude_portos)[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2)
+        * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * crawler.RAIO_TERRA_KM * np.arcsin(np.sqrt(a))
+
+def _coordenadas_portos(indice):
+    return (crawler._graus(indice.catalogo.df.Latitude),
+        crawler._graus(indice.catalogo.df.Longitude))
+
+@pytest.mark.parametrize('tamanho_folha', [4, crawler.TAMANHO_FOLHA_INDICE])
+def test_mais_proximo_igual_forca_bruta(arquivo_portos, tamanho_folha):
+    indice = crawler.IndicePortos(crawler.CatalogoPortos(arquivo_portos),
+        tamanho_folha)
+    latitude, longitude = _posicoes()
+    portos, distancias = indice.mais_proximo(latitude, longitude)
+
+    todas = _haversine(latitude, longitude, *_coordenadas_portos(indice))
+    todas = np.where(np.isnan(todas), np.inf, todas)
+    sem_coordenadas = latitude.isna() | longitude.isna()
+
+    assert (portos[sem_coordenadas] == -1).all()
+    assert np.isnan(distancias[sem_coordenadas]).all()
+    assert not (portos == 7).any()
+    esperados = todas[~sem_coordenadas].min(axis=1)
+    np.testing.assert_allclose(distancias[~sem_coordenadas], esperados,
+        rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(todas[np.flatnonzero(~sem_coordenadas),
+        portos[~sem_coordenadas]], esperados, rtol=1e-9, atol=1e-6)
+
+def test_no_raio_igual_forca_bruta(arquivo_portos):
+    indice = crawler.IndicePortos(crawler.CatalogoPortos(arquivo_portos), 4)
+    latitude, longitude = _posicoes()
+    raio = 150.0
+    posicoes, portos, distancias = indice.no_raio(latitude, longitude, raio)
+
+    todas = _haversine(latitude, longitude, *_coordenadas_portos(indice))
+    # Pares muito perto da borda do raio podem divergir por arredondamento.
+    borda = np.abs(todas - raio) < 1e-6
+    esperados = set(zip(*np.nonzero((todas <= raio) & ~borda)))
+    obtidos = set(zip(posicoes, portos))
+    assert esperados <= obtidos
+    assert all(borda[posicao, porto] for posicao, porto in obtidos - esperados)
+
+    np.testing.assert_allclose(distancias, todas[posicoes, portos],
+        rtol=1e-9, atol=1e-6)
+    assert (np.diff(posicoes) >= 0).all()
+
+def test_distancia_ao_porto(arquivo_portos):
+    indice = crawler.obtem_indice_portos(arquivo_portos)
+    latitude, longitude = _posicoes()
+    nomes = np.array(['PORTO {}'.format(i % 400) for i in range(len(latitude))],
+        dtype=object)
+    nomes[[1, 2]] = 'PORTO INEXISTENTE'
+    nomes[3] = ' porto  7 '
+    distancias = indice.distancia_ao_porto(latitude, longitude, nomes)
+
+    latitude_portos, longitude_portos = _coordenadas_portos(indice)
+    destinos = indice.catalogo.posicoes_por_nome(nomes)
+    esperadas = _haversine(latitude, longitude, latitude_portos,
+        longitude_portos)[np.arange(len(latitude)), destinos]
+    esperadas[destinos == -1] = np.nan
+
+    assert np.isnan(distancias[[0, 1, 2, 3, 5, 10]]).all()
+    np.testing.assert_allclose(distancias, esperadas, rtol=1e-9, atol=1e-6)
@@ -0,0 +1,32 @@
+# coding: utf-8
+
+import time
+
+import marine_traffic_crawler as crawler
+
+
+def test_prometheus_com_status_http_e_texto(tmp_path):
+    metricas = crawler.ativa_metricas(
+        arquivo_prometheus=str(tmp_path / 'metricas.prom'))
+    try:
+        crawler.registra_resposta('navio', 200, time.perf_counter(), 100)
+        crawler.registra_resposta('navio', 503, time.perf_counter())
+        crawler.registra_resposta('navio', 'cache')
+        crawler.registra_resposta('navio', 'erro')
+        texto = metricas.texto_prometheus()
+    finally:
+        crawler.desativa_metricas()
+
+    assert 'marinetraffic_respostas_total{classe="navio",status="200"} 1' in texto
+    assert 'marinetraffic_respostas_total{classe="navio",status="cache"} 1' in texto
+    assert (tmp_path / 'metricas.prom').read_text(encoding='utf-8') == texto
+
+
+def test_relatorio_json_com_status_misturados():
+    metricas = crawler.Metricas()
+    metricas.conta('respostas', classe='portos', status=200)
+    metricas.conta('respostas', classe='portos', status='arquivo')
+    relatorio = metricas.relatorio()
+    status = sorted(item['rotulos']['status']
+        for item in relatorio['metricas']['respostas'])
+    assert status == ['200', 'arquivo']
@@ -0,0 +1,22 @@
+# coding: utf-8
+
+import pandas as pd
+import pytest
+
+import marine_traffic_crawler as crawler
+
+
+# 15 páginas de 20 portos; o lote do gravador (200) ainda não foi gravado
+# quando o limite é atingido.
+@pytest.mark.parametrize('limite', [30, 230])
+def test_limite_de_portos(servidor_local, limite):
+    crawler.crawl_portos_brasil(limite=limite, concorrencia_paginas=1,
+        retomar=False)
+    portos = pd.read_csv(crawler.ARQUIVO_PORTOS_BRASIL, sep=';', dtype=str)
+    assert len(portos) == limite
+
+
+def test_sem_limite_captura_todos(servidor_local):
+    crawler.crawl_portos_brasil(retomar=False)
+    portos = pd.read_csv(crawler.ARQUIVO_PORTOS_BRASIL, sep=';', dtype=str)
+    assert len(portos) == 15 * 20
@@ -0,0 +1,54 @@
+# coding: utf-8
+
+import threading
+import time
+
+import pytest
+
+import marine_traffic_crawler as crawler
+
+
+@pytest.fixture
+def pool_proxies():
+    pool = crawler.ativa_pool_proxies(['http://10.0.0.{}:3128'.format(i)
+        for i in range(1, 4)])
+    yield pool
+    crawler.desativa_pool_proxies()
+
+# Maior número de chamadas simultâneas de executa_em_paralelo.
+def _maximo_simultaneo(concorrencia):
+    lock = threading.Lock()
+    estado = {'atual': 0, 'maximo': 0}
+
+    def tarefa(item):
+        with lock:
+            estado['atual'] += 1
+            estado['maximo'] = max(estado['maximo'], estado['atual'])
+        time.sleep(0.05)
+        with lock:
+            estado['atual'] -= 1
+
+    list(crawler.executa_em_paralelo(tarefa, range(4 * concorrencia),
+        concorrencia))
+    return estado['maximo']
+
+def test_sem_pool_limite_por_host():
+    assert crawler.limite_conexoes() == crawler.LIMITE_CONEXOES_POR_HOST
+    assert _maximo_simultaneo(40) == crawler.LIMITE_CONEXOES_POR_HOST
+
+def test_limite_cresce_com_proxies_saudaveis(pool_proxies):
+    limite = crawler.LIMITE_CONEXOES_POR_HOST
+    assert crawler.limite_conexoes() == 3 * limite
+    assert _maximo_simultaneo(40) == 40
+
+    pool_proxies.estados[0].pausa_ate = time.monotonic() + 60
+    assert crawler.limite_conexoes() == 2 * limite
+    for estado in pool_proxies.estados:
+        estado.pausa_ate = time.monotonic() + 60
+    assert crawler.limite_conexoes() == limite
+
+def test_semaforo_por_proxy():
+    url = 'https://www.marinetraffic.com/en/ais/index/ports/all'
+    assert crawler.semaforo_host(url) is crawler.semaforo_host(url)
+    assert crawler.semaforo_host(url, 'http://10.0.0.1:3128') is not \
+        crawler.semaforo_host(url, 'http://10.0.0.2:3128')
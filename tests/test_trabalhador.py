@@ -0,0 +1,37 @@
+# coding: utf-8
+
+import threading
+import time
+
+import pandas as pd
+
+import marine_traffic_crawler as crawler
+
+
+# Cada instância reserva no máximo `concorrencia` tarefas de cada vez.
+def test_reservas_limitadas_a_concorrencia(tmp_path, monkeypatch):
+    fila = crawler.FilaTrabalho((tmp_path / 'fila.sqlite').as_posix())
+    rodada = fila.cria_rodada(pd.Timestamp('2026-01-01 10:00'))
+    fila.publica(rodada, crawler.TAREFA_NAVIO,
+        [(str(i), {'url': 'navio/{}'.format(i)}) for i in range(30)])
+
+    lock = threading.Lock()
+    reservas = []
+
+    def executa_tarefa(fila_tarefa, tarefa, coleta, proxy):
+        with lock:
+            reservas.append(fila.resumo(rodada).get('em_andamento', 0))
+        time.sleep(0.02)
+
+    monkeypatch.setattr(crawler, 'executa_tarefa', executa_tarefa)
+    monkeypatch.setattr(crawler, 'ESPERA_FILA', 0.01)
+    crawler.ativa_banco((tmp_path / 'banco.sqlite').as_posix())
+    try:
+        crawler.executa_trabalhador(fila, rodada, concorrencia=4)
+    finally:
+        crawler.desativa_banco()
+
+    assert fila.resumo(rodada) == {'concluida': 30}
+    fila.fecha()
+    assert len(reservas) == 30
+    assert max(reservas) <= 4